@@ -1,29 +1,47 @@
 import os
-import io
-import base64
-import requests
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, request, jsonify
 from flask_cors import CORS
-from PIL import Image
 import tempfile
 from dotenv import load_dotenv
 from routes.advanced_features import advanced_bp
-from routes.video_routes import video_bp
+from routes.video_routes import video_bp, video_processor
 from routes.template_video_routes import template_video_bp
-from utils.replicate_processor import ReplicateProcessor
-from utils.supabase_storage import SupabaseStorage
+from routes.job_routes import jobs_bp
+from routes.webhook_routes import webhooks_bp
+from routes.system_routes import system_bp
+from routes.storage_routes import storage_bp
+from utils.image_processor import ImageProcessor, ImageTooLargeError
+from utils.input_profiles import prepare_input
+from utils.replicate_processor import ReplicateProcessor, ProviderFallbackError, run_hedged
+from utils.supabase_storage import get_supabase_storage
+from utils.persistence_queue import get_persistence_queue, PersistenceQueueFull
+from utils.response_helper import wants_async, submit_async_job, send_result, send_catalog_listing
+from utils.output_encoder import negotiate, encode_result, supported_formats, QUALITY_TIERS
+from utils.provider_result import ProviderResult
+from utils.http_client import get_http_client
+from utils.media_ingest import StreamingRequest
+from utils.gradio_pool import get_gradio_pool
+from utils.template_catalog import get_template_catalog
+from utils.template_derivatives import get_template_derivatives
+from utils.template_analysis import get_template_analyzer
+from utils.media_server import send_media
+from utils.face_swap_engine import get_face_swap_engine, face_swap_unavailable_reason, NoFaceError
 
 load_dotenv()
 
-app = Flask(__name__)
+# static_folder=None: /static/... goes through send_media like every other file route
+app = Flask(__name__, static_folder=None)
+
+# Large uploads (videos) are spooled straight to named temp files and streamed from there
+app.request_class = StreamingRequest
 
 # Configure CORS for production - allow all origins for mobile apps
 CORS(app, 
      resources={r"/api/*": {
          "origins": "*",
          "methods": ["GET", "POST", "OPTIONS"],
-         "allow_headers": ["Content-Type", "Accept", "User-Agent"],
-         "expose_headers": ["Content-Type"],
+         "allow_headers": ["Content-Type", "Accept", "User-Agent", "Range", "If-None-Match", "If-Range"],
+         "expose_headers": ["Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag"],
          "supports_credentials": False,
          "max_age": 3600
      }})
@@ -31,6 +49,15 @@ CORS(app,
 app.register_blueprint(advanced_bp, url_prefix='/api/advanced')
 app.register_blueprint(video_bp, url_prefix='/api/video')
 app.register_blueprint(template_video_bp, url_prefix='/api/template-video')
+app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+app.register_blueprint(webhooks_bp, url_prefix='/api/webhooks')
+app.register_blueprint(system_bp, url_prefix='/api/system')
+app.register_blueprint(storage_bp, url_prefix='/api/storage')
+
+@app.errorhandler(ImageTooLargeError)
+def image_too_large(e):
+    """Uploads over IMAGE_MAX_PIXELS (decompression bombs) are rejected before decoding"""
+    return jsonify({'error': 'Image too large', 'details': str(e)}), 413
 
 HF_API_TOKEN = os.getenv('HUGGINGFACE_API_TOKEN', '')
 HF_API_URL = "https://api-inference.huggingface.co/models/"
@@ -40,19 +67,59 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 replicate_processor = ReplicateProcessor()
 
+# Index templates (sizes, hashes, dimensions) once; listings are then served from memory.
+# Spawned pool processes re-run this file as __mp_main__ and must not index or attach again.
+if __name__ != '__mp_main__':
+    get_template_catalog().refresh(force=True)
+    # Thumbnails / poster frames / preview clips; finished ones are read from disk by every process
+    if os.getenv('TEMPLATE_DERIVATIVES', 'true').lower() == 'true':
+        get_template_derivatives().attach(get_template_catalog())
+    # Face analysis sidecars for template videos (OpenCV); finished ones are read from disk by every process
+    if os.getenv('TEMPLATE_ANALYSIS', 'true').lower() == 'true':
+        get_template_analyzer().attach(get_template_catalog())
+
+_background_work_pid = None
+
+@app.before_request
+def start_background_work():
+    """
+    Start per-process background work once per serving process
+    Runs on the first request, i.e. after Gunicorn has forked, so no process
+    pool or thread is ever started in a --preload master (forked workers
+    would inherit its clients and locks but not its threads) or at import time.
+    """
+    global _background_work_pid
+    if _background_work_pid == os.getpid():
+        return
+    _background_work_pid = os.getpid()
+    
+    # Connect to HuggingFace Spaces in the background so video fallbacks skip the handshake
+    # GRADIO_WARMUP_SPACES: comma-separated Space names, or "all" for every video fallback Space
+    warmup_spaces = os.getenv('GRADIO_WARMUP_SPACES', '').strip()
+    if warmup_spaces:
+        if warmup_spaces == 'all':
+            warmup_spaces = ','.join(video_processor.hf_spaces.values())
+        get_gradio_pool().warm_up([space.strip() for space in warmup_spaces.split(',') if space.strip()])
+    
+    # Templates still missing derivatives or face analysis
+    if os.getenv('TEMPLATE_DERIVATIVES', 'true').lower() == 'true':
+        get_template_derivatives().submit_missing(get_template_catalog())
+    if os.getenv('TEMPLATE_ANALYSIS', 'true').lower() == 'true':
+        get_template_analyzer().submit_missing(get_template_catalog())
+
 def query_huggingface_model(model_id, image_bytes, params=None):
     """Query Hugging Face Inference API"""
     headers = {"Authorization": f"Bearer {HF_API_TOKEN}"}
     
     if params:
-        response = requests.post(
+        response = get_http_client().post(
             f"{HF_API_URL}{model_id}",
             headers=headers,
             data=image_bytes,
             json=params
         )
     else:
-        response = requests.post(
+        response = get_http_client().post(
             f"{HF_API_URL}{model_id}",
             headers=headers,
             data=image_bytes
@@ -60,13 +127,6 @@ def query_huggingface_model(model_id, image_bytes, params=None):
     
     return response
 
-def image_to_bytes(image):
-    """Convert PIL Image to bytes"""
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr.seek(0)
-    return img_byte_arr.read()
-
 @app.route('/healthz')
 @app.route('/health')
 def health_check():
@@ -74,19 +134,23 @@ def health_check():
 
 @app.route('/')
 def home():
-    return send_from_directory('static', 'index.html')
+    return send_media('static', 'index.html')
 
 @app.route('/template-video-swap')
 def template_video_swap():
-    return send_from_directory('static', 'template_video_swap.html')
+    return send_media('static', 'template_video_swap.html')
 
 @app.route('/video-swap')
 def video_swap_test():
-    return send_from_directory('static', 'video_swap.html')
+    return send_media('static', 'video_swap.html')
+
+@app.route('/static/<path:filename>')
+def static_media(filename):
+    return send_media('static', filename)
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory('static', path)
+    return send_media('static', path)
 
 @app.route('/api')
 def api_info():
@@ -98,7 +162,7 @@ def api_info():
             'basic': [
                 '/api/ai/hd-image - Upscale image 2x/4x ✅ (Replicate+HF)',
                 '/api/ai/fix-old-photo - Restore old photos ✅ (Replicate+HF)',
-                '/api/ai/swap-face - Swap faces ✅ (Replicate+HF)',
+                '/api/ai/swap-face - Swap faces ✅ (local CPU engine)',
                 '/api/ai/cartoonify - Cartoon/Anime style ✅ (Replicate)',
                 '/api/ai/style-transfer - Artistic styles ✅ (Replicate)'
             ],
@@ -115,6 +179,30 @@ def api_info():
                 '/api/video/face-swap - Video face swap ✅ (HF Pro + Replicate Pro)',
                 '/api/video/providers - List available providers & models'
             ],
+            'jobs': [
+                'POST any image endpoint with async=true - returns job_id immediately (202)',
+                '/api/jobs/<job_id>?wait=30 - Job status (optional long-poll)',
+                '/api/jobs/<job_id>/result - Download finished result'
+            ],
+            'storage': [
+                '/api/storage/status/<path> - Whether a background (save_storage) upload has finished'
+            ],
+            'system': [
+                '/api/system/cache - Result cache hit/miss counters',
+                '/api/system/http - Outbound HTTP pool metrics',
+                '/api/system/hedging - Provider latency histograms and hedge stats',
+                '/api/system/providers - Provider circuit breakers and health',
+                '/api/system/template-assets - Template files uploaded to providers',
+                '/api/system/scratch - Scratch disk usage and quota',
+                '/api/system/vmodel - Outstanding VModel tasks and poller stats',
+                '/api/system/gradio - Pooled HuggingFace Space clients',
+                '/api/system/storage - Supabase storage call latency',
+                '/api/system/persistence - Background storage upload queue',
+                '/api/system/inputs - Input downscaling per model and bytes saved',
+                '/api/system/templates - Template catalog index, derivative generation and face analysis',
+                '/api/system/media - Static media responses, 304s, ranges and proxy offloads',
+                '/api/system/faceswap - Local face-swap engine batching and embedding cache'
+            ],
             'health': '/api/health'
         },
         'note': 'img2img = transforms your image, text2img = generates new image from prompt',
@@ -125,7 +213,12 @@ def api_info():
         'styles': [
             'cartoon', 'anime', 'disney', 'oil_painting', 
             'sketch', 'watercolor'
-        ]
+        ],
+        'output': {
+            'formats': supported_formats(),
+            'quality': list(QUALITY_TIERS) + ['1-100'],
+            'note': 'Image endpoints take format/quality form fields or honor the Accept header'
+        }
     })
 
 @app.route('/api/health')
@@ -139,43 +232,101 @@ def list_templates():
         # Get base URL from request or use production URL
         base_url = request.host_url.rstrip('/')
         
-        all_templates = []
-        
-        for category in ['female', 'male', 'mixed']:
-            folder_path = os.path.join('static', 'templates', category)
-            if os.path.exists(folder_path):
-                for filename in os.listdir(folder_path):
-                    if filename.endswith(('.jpg', '.jpeg', '.png')):
-                        # Clean filename for ID
-                        clean_name = filename.replace('.jpg', '').replace('.jpeg', '').replace('.png', '')
-                        all_templates.append({
-                            'id': f"{category}_{clean_name}",
-                            'name': clean_name.replace('_', ' ').replace('-', ' ').title(),
-                            'imageUrl': f'{base_url}/static/templates/{category}/{filename}',
-                            'category': category.capitalize()
-                        })
-        
-        return jsonify({
-            'status': 'success',
-            'templates': all_templates,
-            'total': len(all_templates)
-        }), 200
+        def template_info(entry):
+            # ?v=<content hash> makes the URL immutable, so clients may cache it for a year
+            image_url = f"{base_url}/static/templates/{entry['category']}/{entry['filename']}?v={entry['sha256'][:16]}"
+            thumbnails = {name: base_url + url for name, url in entry['derivatives'].items()}
+            return {
+                'id': entry['id'],
+                'name': entry['id'].split('_', 1)[1].replace('_', ' ').replace('-', ' ').title(),
+                'imageUrl': image_url,
+                'category': entry['category'].capitalize(),
+                'width': entry['width'],
+                'height': entry['height'],
+                # WebP thumbnail for grids; the full image until it is generated
+                'thumbnailUrl': thumbnails.get('thumb_512', image_url),
+                'thumbnails': thumbnails
+            }
+        
+        def build():
+            all_templates = [template_info(entry) for entry in get_template_catalog().images()]
+            return {
+                'status': 'success',
+                'templates': all_templates,
+                'total': len(all_templates)
+            }
+        
+        return send_catalog_listing('images', build, base_url)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/templates/face-swap', methods=['POST'])
 def template_face_swap():
-    """Face swap with template - Feature unavailable"""
+    """Swap the uploaded face into a template image (local CPU engine)"""
     try:
-        # Face swap models currently unavailable
-        return jsonify({
-            'error': 'Template face swap temporarily unavailable',
-            'details': 'Face swap models are currently not accessible. We recommend using Cartoonify or Style Transfer for creative photo effects.'
-        }), 503
+        face_file = request.files.get('face_image') or request.files.get('source_image')
+        template_id = request.form.get('template_id', '')
+        if not face_file or not template_id:
+            return jsonify({'error': 'face_image and template_id are required'}), 400
+        
+        engine = get_face_swap_engine()
+        if not engine:
+            return face_swap_unavailable()
+        
+        entry = get_template_catalog().image(template_id)
+        if not entry:
+            return jsonify({'error': f'Template not found: {template_id}'}), 404
+        
+        source_image = ImageProcessor.open_upload(face_file)
+        template_image = ImageProcessor.load_image(entry['path'], engine.max_side)
+        
+        if wants_async():
+            return submit_async_job('template-face-swap', engine.swap, source_image, template_image)
+        
+        try:
+            result = engine.swap(source_image, template_image)
+        except NoFaceError as e:
+            return jsonify({'error': str(e)}), 422
+        
+        return send_result(result, 'template-face-swap')
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def face_swap_unavailable():
+    return jsonify({
+        'error': 'Face swap feature temporarily unavailable',
+        'details': f"Local face swap engine not loaded ({face_swap_unavailable_reason()}). "
+                   "Please try HD Upscale, Cartoonify, or Style Transfer instead."
+    }), 503
+
+def query_huggingface_result(model_id, image_bytes):
+    """Call an HF image-to-image model and return a ProviderResult (raises on failure)"""
+    response = query_huggingface_model(model_id, image_bytes)
+    if response.status_code == 200:
+        return ProviderResult.from_response(response)
+    raise Exception(response.text)
+
+def upscale_with_fallback(image, scale):
+    """Upscale with Replicate, hedged with Hugging Face. Raises ProviderFallbackError."""
+    return run_hedged(
+        'hd-upscale',
+        lambda: replicate_processor.upscale_image(image, scale=scale, passthrough=True),
+        lambda: query_huggingface_result("caidas/swin2SR-classical-sr-x2-64",
+                                         prepare_input(image, "hf:caidas/swin2SR-classical-sr-x2-64")[0])
+    )
+
+def restore_with_fallback(image):
+    """Restore with Replicate GFPGAN, hedged with Hugging Face. Raises ProviderFallbackError."""
+    return run_hedged(
+        'restore',
+        lambda: replicate_processor.restore_photo(image, passthrough=True),
+        lambda: query_huggingface_result("tencentarc/gfpgan", prepare_input(image, "hf:tencentarc/gfpgan")[0])
+    )
+
+@app.route('/api/ai/hd-image', methods=['POST'])
 def hd_image():
     """Upscale image using Real-ESRGAN (Replicate primary, HF fallback)"""
     try:
@@ -185,36 +336,20 @@ def hd_image():
         file = request.files['image']
         scale = int(request.form.get('scale', '2'))
         
-        image = Image.open(file.stream)
+        image = ImageProcessor.open_upload(file)
+        
+        if wants_async():
+            return submit_async_job('hd-upscale', upscale_with_fallback, image, scale)
         
-        # Try Replicate first
         try:
-            result_image = replicate_processor.upscale_image(image, scale=scale)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-        except Exception as replicate_error:
-            print(f"Replicate failed: {replicate_error}, trying Hugging Face...")
-            
-            # Fallback to Hugging Face
-            image_bytes = image_to_bytes(image)
-            model_id = "caidas/swin2SR-classical-sr-x2-64"
-            response = query_huggingface_model(model_id, image_bytes)
-            
-            if response.status_code == 200:
-                result_image = Image.open(io.BytesIO(response.content))
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                output.seek(0)
-                return send_file(output, mimetype='image/png')
-            else:
-                return jsonify({
-                    'error': 'Both Replicate and HF failed',
-                    'replicate_error': str(replicate_error),
-                    'hf_error': response.text
-                }), 500
+            result = upscale_with_fallback(image, scale)
+        except ProviderFallbackError as fallback_error:
+            return jsonify(fallback_error.to_dict()), 500
+        
+        return send_result(result, 'hd-upscale')
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -226,36 +361,20 @@ def fix_old_photo():
             return jsonify({'error': 'No image file provided'}), 400
         
         file = request.files['image']
-        image = Image.open(file.stream)
+        image = ImageProcessor.open_upload(file)
+        
+        if wants_async():
+            return submit_async_job('restore', restore_with_fallback, image)
         
-        # Try Replicate first
         try:
-            result_image = replicate_processor.restore_photo(image)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-        except Exception as replicate_error:
-            print(f"Replicate failed: {replicate_error}, trying Hugging Face...")
-            
-            # Fallback to Hugging Face
-            image_bytes = image_to_bytes(image)
-            model_id = "tencentarc/gfpgan"
-            response = query_huggingface_model(model_id, image_bytes)
-            
-            if response.status_code == 200:
-                result_image = Image.open(io.BytesIO(response.content))
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                output.seek(0)
-                return send_file(output, mimetype='image/png')
-            else:
-                return jsonify({
-                    'error': 'Both Replicate and HF failed',
-                    'replicate_error': str(replicate_error),
-                    'hf_error': response.text
-                }), 500
+            result = restore_with_fallback(image)
+        except ProviderFallbackError as fallback_error:
+            return jsonify(fallback_error.to_dict()), 500
+        
+        return send_result(result, 'restore')
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -268,37 +387,51 @@ def cartoonify():
         
         file = request.files['image']
         style = request.form.get('style', 'general')
+        seed = request.form.get('seed') or None
+        
+        image = ImageProcessor.open_upload(file)
         
-        image = Image.open(file.stream)
-        result_image = replicate_processor.cartoonify(image, style=style)
+        if wants_async():
+            return submit_async_job('cartoonify', replicate_processor.cartoonify, image, style=style, seed=seed, passthrough=True)
         
-        output = io.BytesIO()
-        result_image.save(output, format='PNG')
-        output.seek(0)
-        return send_file(output, mimetype='image/png')
+        result = replicate_processor.cartoonify(image, style=style, seed=seed, passthrough=True)
+        return send_result(result, 'cartoonify')
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/ai/swap-face', methods=['POST'])
 def swap_face():
-    """Swap faces between two images (Replicate primary, HF fallback)"""
+    """Swap the face of source_image onto target_image (local CPU engine, batched)"""
     try:
         if 'source_image' not in request.files or 'target_image' not in request.files:
             return jsonify({'error': 'Both source_image and target_image are required'}), 400
         
+        engine = get_face_swap_engine()
+        if not engine:
+            return face_swap_unavailable()
+        
         source_file = request.files['source_image']
         target_file = request.files['target_image']
+        all_faces = request.form.get('all_faces', 'true').lower() == 'true'
         
-        source_image = Image.open(source_file.stream)
-        target_image = Image.open(target_file.stream)
+        source_image = ImageProcessor.open_upload(source_file)
+        target_image = ImageProcessor.open_upload(target_file)
         
-        # Face swap models currently unavailable
-        return jsonify({
-            'error': 'Face swap feature temporarily unavailable',
-            'details': 'Face swap models are currently not accessible. Please try HD Upscale, Cartoonify, or Style Transfer instead.'
-        }), 503
+        if wants_async():
+            return submit_async_job('face-swap', engine.swap, source_image, target_image, all_faces=all_faces)
+        
+        try:
+            result = engine.swap(source_image, target_image, all_faces=all_faces)
+        except NoFaceError as e:
+            return jsonify({'error': str(e)}), 422
+        
+        return send_result(result, 'face-swap')
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -311,18 +444,50 @@ def style_transfer():
         
         file = request.files['image']
         style = request.form.get('style', 'oil_painting')
+        seed = request.form.get('seed') or None
+        
+        image = ImageProcessor.open_upload(file)
         
-        image = Image.open(file.stream)
-        result_image = replicate_processor.style_transfer(image, style=style)
+        if wants_async():
+            return submit_async_job('style-transfer', replicate_processor.style_transfer, image, style=style, seed=seed, passthrough=True)
         
-        output = io.BytesIO()
-        result_image.save(output, format='PNG')
-        output.seek(0)
-        return send_file(output, mimetype='image/png')
+        result = replicate_processor.style_transfer(image, style=style, seed=seed, passthrough=True)
+        return send_result(result, 'style-transfer')
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def run_feature(feature, image, scale=2, style='anime'):
+    """Run a process-and-save feature on the Replicate processor"""
+    if feature == 'hd-upscale':
+        return replicate_processor.upscale_image(image, scale=scale, passthrough=True)
+    if feature == 'cartoonify':
+        return replicate_processor.cartoonify(image, style=style, passthrough=True)
+    if feature == 'restore':
+        return replicate_processor.restore_photo(image, passthrough=True)
+    if feature == 'remove-bg':
+        return replicate_processor.remove_background(image, passthrough=True)
+    raise ValueError(f'Unknown feature: {feature}')
+
+def process_and_upload(feature, image, user_id=None, scale=2, style='anime', output=None):
+    """
+    Run a feature and upload the result to Supabase (async process-and-save jobs)
+    output is the OutputSpec negotiated with the client; None uploads the provider's bytes as is
+    """
+    result = run_feature(feature, image, scale=scale, style=style)
+    data, mimetype = encode_result(result, output) if output else (result.read(), result.mimetype)
+    upload_result = get_supabase_storage().upload_bytes(data, mimetype, user_id, feature)
+    if not upload_result['success']:
+        raise Exception(f"Storage upload failed: {upload_result.get('error')}")
+    return {
+        'storage_url': upload_result['url'],
+        'filename': upload_result['filename'],
+        'path': upload_result['path'],
+        'feature': feature
+    }
+
 @app.route('/api/ai/process-and-save', methods=['POST'])
 def process_and_save():
     """
@@ -331,10 +496,12 @@ def process_and_save():
     Parameters:
     - image (file): Image to process
     - feature (form): AI feature to use (hd-upscale, face-swap, cartoonify, etc.)
-    - save_storage (form): 'true' to save to Supabase
+    - save_storage (form): 'true' to save to Supabase (uploaded in the background;
+      the response has the final URL and a status_url to check persistence)
     - user_id (form): Optional user ID for organizing files
     - scale (form): For HD upscale (2 or 4)
     - style (form): For cartoonify/style-transfer
+    - async (form): 'true' to return a job id instead of waiting (poll /api/jobs/<id>)
     """
     try:
         if 'image' not in request.files:
@@ -344,32 +511,45 @@ def process_and_save():
         feature = request.form.get('feature', 'hd-upscale')
         save_to_storage = request.form.get('save_storage', 'false').lower() == 'true'
         user_id = request.form.get('user_id', None)
+        scale = int(request.form.get('scale', '2'))
+        style = request.form.get('style', 'anime')
         
-        image = Image.open(file.stream)
-        result_image = None
-        
-        # Process based on feature type
-        if feature == 'hd-upscale':
-            scale = int(request.form.get('scale', '2'))
-            result_image = replicate_processor.upscale_image(image, scale=scale)
-        
-        elif feature == 'cartoonify':
-            style = request.form.get('style', 'anime')
-            result_image = replicate_processor.cartoonify(image, style=style)
+        if feature not in ('hd-upscale', 'cartoonify', 'restore', 'remove-bg'):
+            return jsonify({'error': f'Unknown feature: {feature}'}), 400
         
-        elif feature == 'restore':
-            result_image = replicate_processor.restore_photo(image)
+        image = ImageProcessor.open_upload(file)
         
-        elif feature == 'remove-bg':
-            result_image = replicate_processor.remove_background(image)
+        if wants_async():
+            if save_to_storage:
+                return submit_async_job(feature, process_and_upload, feature, image,
+                                        user_id=user_id, scale=scale, style=style, output=negotiate(feature))
+            return submit_async_job(feature, run_feature, feature, image, scale=scale, style=style)
         
-        else:
-            return jsonify({'error': f'Unknown feature: {feature}'}), 400
+        result = run_feature(feature, image, scale=scale, style=style)
         
-        # Save to Supabase if requested
+        # Save to Supabase if requested, in the negotiated format (native bytes when they pass through)
         if save_to_storage:
-            storage = SupabaseStorage()
-            upload_result = storage.upload_image(result_image, user_id, feature)
+            data, mimetype = encode_result(result, negotiate(feature))
+            persistence = get_persistence_queue()
+            if persistence.storage.client:
+                # Write-behind: reply now with the pre-assigned URL, upload in the background
+                try:
+                    persisted = persistence.enqueue(data, mimetype, user_id, feature)
+                    return jsonify({
+                        'success': True,
+                        'message': 'Image processed, saving to Supabase in the background',
+                        'storage_url': persisted['url'],
+                        'filename': persisted['filename'],
+                        'path': persisted['path'],
+                        'feature': feature,
+                        'persistence': 'queued',
+                        'status_url': f"/api/storage/status/{persisted['path']}"
+                    })
+                except PersistenceQueueFull as e:
+                    print(f"[Persist] {e}, uploading synchronously")
+            
+            storage = get_supabase_storage()
+            upload_result = storage.upload_bytes(data, mimetype, user_id, feature)
             
             if upload_result['success']:
                 return jsonify({
@@ -378,7 +558,8 @@ def process_and_save():
                     'storage_url': upload_result['url'],
                     'filename': upload_result['filename'],
                     'path': upload_result['path'],
-                    'feature': feature
+                    'feature': feature,
+                    'persistence': 'succeeded'
                 })
             else:
                 return jsonify({
@@ -388,11 +569,10 @@ def process_and_save():
                 }), 500
         
         # Return image bytes if not saving to storage
-        output = io.BytesIO()
-        result_image.save(output, format='PNG')
-        output.seek(0)
-        return send_file(output, mimetype='image/png')
+        return send_result(result, feature)
         
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,11 +1,13 @@
 import io
 import os
-import requests
 import base64
 from flask import Blueprint, request, jsonify, send_file
-from PIL import Image
-from utils.image_processor import ImageProcessor
-from utils.replicate_processor import ReplicateProcessor
+from utils.image_processor import ImageProcessor, ImageTooLargeError
+from utils.input_profiles import prepare_input
+from utils.replicate_processor import ReplicateProcessor, ProviderFallbackError, run_hedged
+from utils.response_helper import wants_async, submit_async_job, send_result
+from utils.provider_result import ProviderResult
+from utils.http_client import get_http_client
 
 advanced_bp = Blueprint('advanced', __name__)
 
@@ -20,7 +22,7 @@ def query_image_to_image(model_id, image_bytes):
         "Authorization": f"Bearer {HF_API_TOKEN}",
         "Content-Type": "application/octet-stream"
     }
-    response = requests.post(
+    response = get_http_client().post(
         f"{HF_API_URL}{model_id}",
         headers=headers,
         data=image_bytes
@@ -31,13 +33,51 @@ def query_text_to_image(model_id, prompt):
     """Query Hugging Face for text-to-image models"""
     headers = {"Authorization": f"Bearer {HF_API_TOKEN}"}
     payload = {"inputs": prompt}
-    response = requests.post(
+    response = get_http_client().post(
         f"{HF_API_URL}{model_id}",
         headers=headers,
         json=payload
     )
     return response
 
+def hf_result(response):
+    """ProviderResult for a successful HF response (raises with the HF error text otherwise)"""
+    if response.status_code == 200:
+        return ProviderResult.from_response(response)
+    raise Exception(response.text)
+
+def generate_with_fallback(prompt, seed=None, feature='text-to-image'):
+    """Text-to-image with Replicate SDXL, hedged with HF Stable Diffusion. Raises ProviderFallbackError."""
+    return run_hedged(
+        feature,
+        lambda: replicate_processor.generate_image_from_text(prompt, seed=seed, passthrough=True),
+        lambda: hf_result(query_text_to_image("stabilityai/stable-diffusion-2-1", prompt))
+    )
+
+def remove_background_with_fallback(image):
+    """Remove background with Replicate, hedged with HF RMBG. Raises ProviderFallbackError."""
+    return run_hedged(
+        'remove-bg',
+        lambda: replicate_processor.remove_background(image, passthrough=True),
+        lambda: hf_result(query_image_to_image("briaai/RMBG-1.4", prepare_input(image, "hf:briaai/RMBG-1.4")[0]))
+    )
+
+def respond_with_generation(feature, prompt):
+    """
+    Run (or queue with async=true) a text-to-image generation and return the image
+    An optional 'seed' form field makes the result reproducible (and cacheable)
+    """
+    seed = request.form.get('seed') or None
+    if wants_async():
+        return submit_async_job(feature, generate_with_fallback, prompt, seed=seed, feature=feature)
+    
+    try:
+        result = generate_with_fallback(prompt, seed=seed, feature=feature)
+    except ProviderFallbackError as fallback_error:
+        return jsonify(fallback_error.to_dict()), 500
+    
+    return send_result(result, feature)
+
 @advanced_bp.route('/ai-hugs', methods=['POST'])
 def ai_hugs():
     """Generate AI hugging photo from 2 person images (Replicate primary, HF fallback)"""
@@ -52,46 +92,20 @@ def ai_hugs():
         else:
             # Fallback to text prompt if no images provided
             prompt = request.form.get('prompt', 'two people hugging, warm embrace, happy moment, professional photo, realistic, high quality')
-            result_image = replicate_processor.generate_image_from_text(prompt)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
+            return respond_with_generation('ai-hugs', prompt)
         
         # Load images
-        person1_image = Image.open(person1_file.stream)
-        person2_image = Image.open(person2_file.stream)
+        person1_image = ImageProcessor.open_upload(person1_file)
+        person2_image = ImageProcessor.open_upload(person2_file)
         
         # Generate hugging photo with prompt based on images
         prompt = "two people hugging, warm embrace, happy romantic moment, professional photo, realistic, high quality, beautiful composition"
         
-        # Try Replicate first
-        try:
-            result_image = replicate_processor.generate_image_from_text(prompt)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-        except Exception as replicate_error:
-            print(f"Replicate failed: {replicate_error}, trying Hugging Face...")
-            
-            # Fallback to Hugging Face
-            model_id = "stabilityai/stable-diffusion-2-1"
-            response = query_text_to_image(model_id, prompt)
-            
-            if response.status_code == 200:
-                result_image = Image.open(io.BytesIO(response.content))
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                output.seek(0)
-                return send_file(output, mimetype='image/png')
-            else:
-                return jsonify({
-                    'error': 'Both Replicate and HF failed',
-                    'replicate_error': str(replicate_error),
-                    'hf_error': response.text
-                }), 500
+        # Replicate primary, HF fallback
+        return respond_with_generation('ai-hugs', prompt)
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -109,46 +123,20 @@ def future_baby():
         else:
             # Fallback to text prompt if no images provided
             prompt = request.form.get('prompt', 'cute baby face, infant, adorable, high quality portrait, professional photo, realistic')
-            result_image = replicate_processor.generate_image_from_text(prompt)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
+            return respond_with_generation('future-baby', prompt)
         
         # Load images
-        parent1_image = Image.open(parent1_file.stream)
-        parent2_image = Image.open(parent2_file.stream)
+        parent1_image = ImageProcessor.open_upload(parent1_file)
+        parent2_image = ImageProcessor.open_upload(parent2_file)
         
         # Generate baby prediction with prompt
         prompt = "cute baby face, infant child, adorable mixed features, high quality portrait, professional photo, realistic, beautiful baby"
         
-        # Try Replicate first
-        try:
-            result_image = replicate_processor.generate_image_from_text(prompt)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-        except Exception as replicate_error:
-            print(f"Replicate failed: {replicate_error}, trying Hugging Face...")
-            
-            # Fallback to Hugging Face
-            model_id = "stabilityai/stable-diffusion-2-1"
-            response = query_text_to_image(model_id, prompt)
-            
-            if response.status_code == 200:
-                result_image = Image.open(io.BytesIO(response.content))
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                output.seek(0)
-                return send_file(output, mimetype='image/png')
-            else:
-                return jsonify({
-                    'error': 'Both Replicate and HF failed',
-                    'replicate_error': str(replicate_error),
-                    'hf_error': response.text
-                }), 500
+        # Replicate primary, HF fallback
+        return respond_with_generation('future-baby', prompt)
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -170,32 +158,8 @@ def template_styles():
         
         prompt = templates.get(template, templates['ghostface'])
         
-        # Try Replicate first
-        try:
-            result_image = replicate_processor.generate_image_from_text(prompt)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-        except Exception as replicate_error:
-            print(f"Replicate failed: {replicate_error}, trying Hugging Face...")
-            
-            # Fallback to Hugging Face
-            model_id = "stabilityai/stable-diffusion-2-1"
-            response = query_text_to_image(model_id, prompt)
-            
-            if response.status_code == 200:
-                result_image = Image.open(io.BytesIO(response.content))
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                output.seek(0)
-                return send_file(output, mimetype='image/png')
-            else:
-                return jsonify({
-                    'error': 'Both Replicate and HF failed',
-                    'replicate_error': str(replicate_error),
-                    'hf_error': response.text
-                }), 500
+        # Replicate primary, HF fallback
+        return respond_with_generation('template-styles', prompt)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -206,32 +170,8 @@ def muscle_enhance():
     try:
         prompt = request.form.get('prompt', 'muscular person, bodybuilder, fit athletic body, professional fitness photo, high quality, realistic')
         
-        # Try Replicate first
-        try:
-            result_image = replicate_processor.generate_image_from_text(prompt)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-        except Exception as replicate_error:
-            print(f"Replicate failed: {replicate_error}, trying Hugging Face...")
-            
-            # Fallback to Hugging Face
-            model_id = "stabilityai/stable-diffusion-2-1"
-            response = query_text_to_image(model_id, prompt)
-            
-            if response.status_code == 200:
-                result_image = Image.open(io.BytesIO(response.content))
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                output.seek(0)
-                return send_file(output, mimetype='image/png')
-            else:
-                return jsonify({
-                    'error': 'Both Replicate and HF failed',
-                    'replicate_error': str(replicate_error),
-                    'hf_error': response.text
-                }), 500
+        # Replicate primary, HF fallback
+        return respond_with_generation('muscle-enhance', prompt)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -244,36 +184,20 @@ def remove_background():
             return jsonify({'error': 'No image file provided'}), 400
         
         file = request.files['image']
-        image = Image.open(file.stream)
+        image = ImageProcessor.open_upload(file)
+        
+        if wants_async():
+            return submit_async_job('remove-bg', remove_background_with_fallback, image)
         
-        # Try Replicate first
         try:
-            result_image = replicate_processor.remove_background(image)
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-        except Exception as replicate_error:
-            print(f"Replicate failed: {replicate_error}, trying Hugging Face...")
-            
-            # Fallback to Hugging Face
-            image_bytes = ImageProcessor.image_to_bytes(image)
-            model_id = "briaai/RMBG-1.4"
-            response = query_image_to_image(model_id, image_bytes)
-            
-            if response.status_code == 200:
-                result_image = Image.open(io.BytesIO(response.content))
-                output = io.BytesIO()
-                result_image.save(output, format='PNG')
-                output.seek(0)
-                return send_file(output, mimetype='image/png')
-            else:
-                return jsonify({
-                    'error': 'Both Replicate and HF failed',
-                    'replicate_error': str(replicate_error),
-                    'hf_error': response.text
-                }), 500
+            result = remove_background_with_fallback(image)
+        except ProviderFallbackError as fallback_error:
+            return jsonify(fallback_error.to_dict()), 500
+        
+        return send_result(result, 'remove-bg')
             
+    except ImageTooLargeError:
+        raise  # 413 from the app-level error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
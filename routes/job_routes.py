@@ -0,0 +1,91 @@
+"""
+Async Job Routes
+Poll status and fetch results of jobs submitted with async=true
+"""
+
+import io
+import json
+from flask import Blueprint, request, jsonify, send_file
+from utils.job_manager import get_job_manager
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# Keep long-polls well below the Gunicorn worker timeout
+MAX_WAIT_SECONDS = 30
+
+
+def job_to_json(job):
+    """Public representation of a job dict"""
+    data = {
+        'job_id': job['id'],
+        'feature': job['feature'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'status_url': f"/api/jobs/{job['id']}",
+    }
+    if job['status'] == 'failed':
+        data['error'] = job['error']
+    if job['status'] == 'succeeded':
+        data['result_url'] = f"/api/jobs/{job['id']}/result"
+        data['result_mimetype'] = job['result_mimetype']
+        data['result_size'] = job['result_size']
+    return data
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Get job status
+
+    Query params:
+    - wait: Optional long-poll timeout in seconds (max 30)
+    """
+    try:
+        manager = get_job_manager()
+        wait = min(float(request.args.get('wait', '0')), MAX_WAIT_SECONDS)
+
+        job = manager.wait(job_id, wait) if wait > 0 else manager.get(job_id)
+        if not job:
+            return jsonify({'error': f'Job not found: {job_id}'}), 404
+
+        data = job_to_json(job)
+
+        # Small JSON results (e.g. storage URLs) are returned inline
+        if job['status'] == 'succeeded' and job['result_mimetype'] == 'application/json':
+            result = manager.get_result(job_id)
+            if result:
+                data['result'] = json.loads(result[0])
+
+        return jsonify(data)
+
+    except ValueError:
+        return jsonify({'error': 'wait must be a number'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Download the result of a finished job"""
+    try:
+        manager = get_job_manager()
+        job = manager.get(job_id)
+        if not job:
+            return jsonify({'error': f'Job not found: {job_id}'}), 404
+
+        if job['status'] == 'failed':
+            return jsonify({'error': 'Job failed', 'details': job['error']}), 500
+        if job['status'] != 'succeeded':
+            return jsonify({'error': 'Job not finished', 'status': job['status']}), 409
+
+        result = manager.get_result(job_id)
+        if not result:
+            return jsonify({'error': 'Job result expired'}), 410
+
+        data, mimetype = result
+        return send_file(io.BytesIO(data), mimetype=mimetype)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
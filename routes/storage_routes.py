@@ -0,0 +1,36 @@
+"""
+Storage Routes
+Status of write-behind uploads started by process-and-save (save_storage=true)
+"""
+
+from flask import Blueprint, jsonify
+from utils.persistence_queue import get_persistence_queue
+
+storage_bp = Blueprint('storage', __name__)
+
+
+def persistence_to_json(record):
+    """Public representation of a persistence record (a job-store row keyed by storage path)"""
+    data = {
+        'path': record['id'],
+        'status': record['status'],
+        'persisted': record['status'] == 'succeeded',
+        'created_at': record['created_at'],
+        'started_at': record['started_at'],
+        'finished_at': record['finished_at'],
+        'mimetype': record['result_mimetype'],
+        'size': record['result_size'],
+        'storage_url': get_persistence_queue().storage.get_image_url(record['id']),
+    }
+    if record['status'] == 'failed':
+        data['error'] = record['error']
+    return data
+
+
+@storage_bp.route('/status/<path:storage_path>', methods=['GET'])
+def persistence_status(storage_path):
+    """Whether a result returned with persistence 'queued' has been uploaded yet"""
+    record = get_persistence_queue().status(storage_path)
+    if not record or not record['feature'].startswith('persist:'):
+        return jsonify({'error': f'Unknown storage path: {storage_path}'}), 404
+    return jsonify(persistence_to_json(record))
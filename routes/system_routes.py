@@ -0,0 +1,119 @@
+"""
+System Routes
+Runtime metrics for caches and shared infrastructure
+"""
+
+from flask import Blueprint, jsonify
+from utils.result_cache import get_result_cache
+from utils.http_client import get_http_client
+from utils.hedged_executor import get_hedged_executor
+from utils.provider_health import get_health_registry
+from utils.template_assets import get_template_assets
+from utils.scratch import get_scratch_manager
+from utils.vmodel_tasks import get_vmodel_tasks
+from utils.gradio_pool import get_gradio_pool
+from utils.supabase_storage import get_supabase_storage
+from utils.persistence_queue import get_persistence_queue
+from utils.input_profiles import get_input_preprocessor
+from utils.template_catalog import get_template_catalog
+from utils.template_derivatives import get_template_derivatives
+from utils.template_analysis import get_template_analyzer
+from utils.media_server import get_media_server
+from utils.face_swap_engine import loaded_face_swap_engine, face_swap_unavailable_reason
+
+system_bp = Blueprint('system', __name__)
+
+
+@system_bp.route('/cache', methods=['GET'])
+def cache_stats():
+    """Result cache hit/miss counters and tier usage"""
+    cache = get_result_cache()
+    if not cache:
+        return jsonify({'enabled': False})
+    return jsonify(dict(cache.stats(), enabled=True))
+
+
+@system_bp.route('/http', methods=['GET'])
+def http_stats():
+    """Outbound HTTP pool usage, per-host concurrency and handshake counts"""
+    return jsonify(get_http_client().stats())
+
+
+@system_bp.route('/hedging', methods=['GET'])
+def hedging_stats():
+    """Provider latency histograms, hedge delays and win counts"""
+    return jsonify(get_hedged_executor().stats())
+
+
+@system_bp.route('/providers', methods=['GET'])
+def provider_health():
+    """Circuit breaker state, error rate and latency for every provider/model seen so far"""
+    return jsonify(get_health_registry().stats())
+
+
+@system_bp.route('/template-assets', methods=['GET'])
+def template_asset_stats():
+    """Remote copies of template files per provider (content hash, URL, expiry)"""
+    return jsonify(get_template_assets().stats())
+
+
+@system_bp.route('/scratch', methods=['GET'])
+def scratch_stats():
+    """Scratch disk usage, quota, active sessions and sweeper counters"""
+    return jsonify(get_scratch_manager().stats())
+
+
+@system_bp.route('/vmodel', methods=['GET'])
+def vmodel_stats():
+    """Outstanding VModel tasks and shared poller counters"""
+    tasks = get_vmodel_tasks()
+    if not tasks:
+        return jsonify({'enabled': False})
+    return jsonify(dict(tasks.stats(), enabled=True))
+
+
+@system_bp.route('/gradio', methods=['GET'])
+def gradio_stats():
+    """Pooled HuggingFace Space clients: connection state, concurrency and evictions"""
+    return jsonify(get_gradio_pool().stats())
+
+
+@system_bp.route('/storage', methods=['GET'])
+def storage_stats():
+    """Supabase storage latency histograms for upload / public URL / list / delete calls"""
+    return jsonify(get_supabase_storage().stats())
+
+
+@system_bp.route('/persistence', methods=['GET'])
+def persistence_stats():
+    """Write-behind storage uploads: pending, retries, failures and overflows to synchronous uploads"""
+    return jsonify(get_persistence_queue().stats())
+
+
+@system_bp.route('/inputs', methods=['GET'])
+def input_stats():
+    """Input preprocessing per model: passthroughs, downscales, and upload bytes before/after"""
+    return jsonify(get_input_preprocessor().stats())
+
+
+@system_bp.route('/templates', methods=['GET'])
+def template_catalog_stats():
+    """Template catalog: entries, version (listing ETag basis), re-scans, derivatives and face analysis"""
+    return jsonify(dict(get_template_catalog().stats(), derivatives=get_template_derivatives().stats(),
+                        analysis=get_template_analyzer().stats()))
+
+
+@system_bp.route('/media', methods=['GET'])
+def media_stats():
+    """Static media serving: responses, 304s, partial (Range) responses and proxy offloads"""
+    return jsonify(get_media_server().stats())
+
+
+@system_bp.route('/faceswap', methods=['GET'])
+def face_swap_stats():
+    """Local face-swap engine: batch sizes, embedding cache hits and batch latency (never loads the models)"""
+    engine = loaded_face_swap_engine()
+    if not engine:
+        reason = face_swap_unavailable_reason()
+        return jsonify({'enabled': reason is None, 'loaded': False, 'reason': reason})
+    return jsonify(dict(engine.stats(), enabled=True, loaded=True))
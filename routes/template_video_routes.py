@@ -3,10 +3,16 @@ Template Video Face Swap Routes
 User uploads face, API swaps into pre-existing template videos
 """
 
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 import os
 from utils.video_processor import VideoFaceSwapProcessor
+from utils.template_assets import TemplateAsset
+from utils.scratch import ScratchQuotaExceeded
+from utils.template_catalog import get_template_catalog
+from utils.response_helper import send_catalog_listing
+from utils.media_server import send_media
+from utils.template_analysis import get_template_analyzer, load_sidecar, sidecar_path
 
 template_video_bp = Blueprint('template_video', __name__)
 video_processor = VideoFaceSwapProcessor()
@@ -22,39 +28,58 @@ def allowed_file(filename, allowed_extensions):
 def list_templates():
     """List all available template videos"""
     try:
-        os.makedirs(TEMPLATES_DIR, exist_ok=True)
+        def build():
+            templates = [{
+                'id': entry['id'],
+                'filename': entry['filename'],
+                'url': f"/api/template-video/preview/{entry['filename']}?v={entry['sha256'][:16]}",
+                'size': entry['size'],
+                'size_mb': round(entry['size'] / 1024 / 1024, 2),
+                'duration': entry['duration'],
+                'width': entry['width'],
+                'height': entry['height'],
+                'poster_url': entry['derivatives'].get('poster'),
+                'preview_url': entry['derivatives'].get('preview'),
+                # Face analysis summary (None until analyzed)
+                'faces': entry['analysis']
+            } for entry in get_template_catalog().videos()]
+            return {
+                'success': True,
+                'templates': templates,
+                'count': len(templates)
+            }
         
-        templates = []
-        for filename in os.listdir(TEMPLATES_DIR):
-            if filename.lower().endswith(('.mp4', '.avi', '.mov', '.webm')):
-                file_path = os.path.join(TEMPLATES_DIR, filename)
-                file_size = os.path.getsize(file_path)
-                
-                templates.append({
-                    'id': filename.rsplit('.', 1)[0],  # filename without extension
-                    'filename': filename,
-                    'url': f'/api/template-video/preview/{filename}',
-                    'size': file_size,
-                    'size_mb': round(file_size / 1024 / 1024, 2)
-                })
-        
-        return jsonify({
-            'success': True,
-            'templates': templates,
-            'count': len(templates)
-        })
+        return send_catalog_listing('videos', build)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @template_video_bp.route('/preview/<filename>', methods=['GET'])
 def preview_template(filename):
-    """Serve template video for preview"""
+    """Serve template video for preview (Range requests for scrubbing, long-lived cache with ?v=<hash>)"""
     try:
-        return send_from_directory(TEMPLATES_DIR, filename)
+        return send_media(TEMPLATES_DIR, filename)
     except Exception as e:
         return jsonify({'error': 'Template not found'}), 404
 
+@template_video_bp.route('/analysis/<template_id>', methods=['GET'])
+def template_analysis(template_id):
+    """Face analysis sidecar of a template: per-frame faces, scene cuts, keyframes, face segments"""
+    template = get_template_catalog().video(template_id)
+    if not template:
+        return jsonify({'error': f'Template not found: {template_id}'}), 404
+    
+    if load_sidecar(template['path'], template['sha256']):
+        return send_media(TEMPLATES_DIR, os.path.basename(sidecar_path(template['path'])))
+    
+    analyzer = get_template_analyzer()
+    if analyzer.pending(template):
+        return jsonify({'status': 'pending', 'template_id': template_id}), 202, {'Retry-After': '5'}
+    return jsonify({
+        'error': 'Template not analyzed',
+        'details': 'Face analysis needs OpenCV' if not analyzer.available else 'Analysis failed or not started'
+    }), 404
+
 @template_video_bp.route('/swap', methods=['POST'])
 def swap_face_with_template():
     """
@@ -81,16 +106,20 @@ def swap_face_with_template():
             return jsonify({'error': 'Missing template_id'}), 400
         
         # Find template video file
-        template_file = None
-        for filename in os.listdir(TEMPLATES_DIR):
-            if filename.rsplit('.', 1)[0] == template_id:
-                template_file = filename
-                break
-        
-        if not template_file:
+        template = get_template_catalog().video(template_id)
+        if not template:
             return jsonify({'error': f'Template not found: {template_id}'}), 404
         
-        template_path = os.path.join(TEMPLATES_DIR, template_file)
+        template_file = template['filename']
+        template_path = template['path']
+        
+        # The sidecar, not the in-memory entry: it may have been written by another worker
+        analysis = load_sidecar(template_path, template['sha256'])
+        if analysis and not analysis['summary']['frames_with_faces']:
+            return jsonify({
+                'error': f'Template has no detectable faces: {template_id}',
+                'details': 'Face analysis found no faces in this template video'
+            }), 422
         
         # Get provider
         provider = request.form.get('provider', 'auto')
@@ -100,14 +129,12 @@ def swap_face_with_template():
         
         print(f"[TemplateAPI] Face swap request: template={template_id}, provider={provider}")
         
-        # Open template video as file object
-        with open(template_path, 'rb') as video_file:
-            # Process video face swap
-            result, provider_used, model_used = video_processor.swap_face_video(
-                face_image, 
-                video_file, 
-                provider
-            )
+        # Providers reuse their uploaded copy of the template (uploaded once per content hash)
+        result, provider_used, model_used = video_processor.swap_face_video(
+            face_image,
+            TemplateAsset(template_path),
+            provider
+        )
         
         return jsonify({
             'success': True,
@@ -119,6 +146,12 @@ def swap_face_with_template():
             'audio_preserved': True
         })
         
+    except ScratchQuotaExceeded as e:
+        return jsonify({
+            'error': 'Server busy',
+            'details': str(e)
+        }), 503, {'Retry-After': '30'}
+        
     except Exception as e:
         print(f"[TemplateAPI] Error: {e}")
         return jsonify({
@@ -158,17 +191,21 @@ def upload_template():
         os.makedirs(TEMPLATES_DIR, exist_ok=True)
         save_path = os.path.join(TEMPLATES_DIR, filename)
         template_video.save(save_path)
+        # Starts thumbnail generation and face analysis in the background
+        get_template_catalog().refresh(force=True)
         
         file_size = os.path.getsize(save_path)
+        template_id = filename.rsplit('.', 1)[0]
         
         return jsonify({
             'success': True,
             'message': 'Template uploaded successfully',
             'template': {
-                'id': filename.rsplit('.', 1)[0],
+                'id': template_id,
                 'filename': filename,
                 'url': f'/api/template-video/preview/{filename}',
-                'size_mb': round(file_size / 1024 / 1024, 2)
+                'size_mb': round(file_size / 1024 / 1024, 2),
+                'analysis_url': f'/api/template-video/analysis/{template_id}'
             }
         })
         
@@ -180,17 +217,14 @@ def delete_template(template_id):
     """Delete a template video (admin feature)"""
     try:
         # Find template file
-        template_file = None
-        for filename in os.listdir(TEMPLATES_DIR):
-            if filename.rsplit('.', 1)[0] == template_id:
-                template_file = filename
-                break
-        
-        if not template_file:
+        template = get_template_catalog().video(template_id)
+        if not template:
             return jsonify({'error': 'Template not found'}), 404
         
-        template_path = os.path.join(TEMPLATES_DIR, template_file)
-        os.remove(template_path)
+        os.remove(template['path'])
+        if os.path.exists(sidecar_path(template['path'])):
+            os.remove(sidecar_path(template['path']))
+        get_template_catalog().refresh(force=True)
         
         return jsonify({
             'success': True,
@@ -3,6 +3,7 @@ import os
 from flask import Blueprint, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 from utils.video_processor import VideoFaceSwapProcessor
+from utils.scratch import ScratchQuotaExceeded
 
 video_bp = Blueprint('video', __name__)
 video_processor = VideoFaceSwapProcessor()
@@ -10,6 +11,84 @@ video_processor = VideoFaceSwapProcessor()
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'webm'}
 ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}
 
+# Static provider descriptions; /providers adds live health data
+PROVIDER_INFO = {
+    'auto': {
+        'name': 'Auto (Best)',
+        'strategy': 'Replicate → VModel → HuggingFace fallback chain',
+        'models': ['arabyai-replicate/roop_face_swap', 'vmodel/video-face-swap-pro', '4 HF Spaces'],
+        'timeout': '15-77 seconds (+ HF fallback if needed)',
+        'audio_preserved': True,
+        'cost': '$0.10-0.14 per video (FREE HF fallback)',
+        'status': '✅ RECOMMENDED - 6 PROVIDERS!'
+    },
+    'replicate': {
+        'name': 'Replicate (Stable)',
+        'models': ['arabyai-replicate/roop_face_swap'],
+        'timeout': '~77 seconds',
+        'audio_preserved': True,
+        'cost': '$0.14 per video',
+        'quality': 'Good, stable',
+        'status': '✅ WORKING 2025'
+    },
+    'vmodel': {
+        'name': 'VModel.AI (Premium)',
+        'models': ['vmodel/video-face-swap-pro'],
+        'timeout': '15-30 seconds',
+        'audio_preserved': True,
+        'cost': '$0.03/second (~$0.10 per short video)',
+        'quality': 'Premium, commercial license',
+        'status': '✅ WORKING 2025',
+        'requirements': 'Requires Supabase (auto-uploads files)'
+    },
+    'hf-tonyassi': {
+        'name': 'HuggingFace (tonyassi)',
+        'space': 'tonyassi/video-face-swap',
+        'timeout': 'Variable (queue-based)',
+        'audio_preserved': 'Unknown',
+        'cost': 'FREE',
+        'quality': 'Preview mode (800px, 4s, 12fps)',
+        'status': '🤗 FREE BACKUP',
+        'features': 'Gender filtering support'
+    },
+    'hf-marko': {
+        'name': 'HuggingFace (MarkoVidrih)',
+        'space': 'MarkoVidrih/video-face-swap',
+        'timeout': 'Variable (queue-based)',
+        'audio_preserved': 'Unknown',
+        'cost': 'FREE',
+        'quality': 'Basic quality',
+        'status': '🤗 FREE BACKUP'
+    },
+    'hf-alsv': {
+        'name': 'HuggingFace (ALSv)',
+        'space': 'ALSv/video-face-swap',
+        'timeout': 'Variable (queue-based)',
+        'audio_preserved': 'Unknown',
+        'cost': 'FREE',
+        'quality': 'Basic quality',
+        'status': '🤗 FREE BACKUP'
+    },
+    'hf-prithiv': {
+        'name': 'HuggingFace (prithivMLmods)',
+        'space': 'prithivMLmods/Video-Face-Swapper',
+        'timeout': 'Variable (queue-based)',
+        'audio_preserved': 'Unknown',
+        'cost': 'FREE',
+        'quality': 'Educational model',
+        'status': '🤗 FREE BACKUP'
+    }
+}
+
+PROVIDER_USAGE = {
+    'provider_auto': 'Replicate → VModel → 4 HuggingFace Spaces (6 total providers!)',
+    'provider_replicate': 'Replicate only - arabyai-replicate/roop_face_swap with audio',
+    'provider_vmodel': 'VModel.AI - premium quality, faster, requires Supabase',
+    'provider_hf': '4 FREE HuggingFace Spaces (tonyassi, marko, alsv, prithiv)',
+    'audio_note': '✅ Replicate & VModel preserve original video audio!',
+    'important': 'Auto mode tries 6 providers for maximum reliability!'
+}
+
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
@@ -91,6 +170,12 @@ def video_face_swap():
                 download_name='face_swapped_video.mp4'
             )
     
+    except ScratchQuotaExceeded as e:
+        return jsonify({
+            'error': 'Server busy',
+            'details': str(e)
+        }), 503, {'Retry-After': '30'}
+    
     except Exception as e:
         error_msg = str(e)
         print(f"[API] Video face swap error: {error_msg}")
@@ -150,85 +235,37 @@ def video_face_swap():
 
 @video_bp.route('/providers', methods=['GET'])
 def get_providers():
-    """Get available video face swap providers and models"""
+    """
+    Video face swap providers with live health data
+    Each provider includes its circuit state, recent error rate and latency;
+    'auto.current_order' is the order auto mode would try them in right now.
+    """
+    configured = {
+        'replicate': bool(video_processor.replicate_pro_token),
+        'vmodel': bool(video_processor.vmodel_token),
+    }
+    providers = {}
+    for name, info in PROVIDER_INFO.items():
+        providers[name] = dict(info)
+        if name == 'auto':
+            providers[name]['mode'] = video_processor.auto_mode
+            providers[name]['current_order'] = video_processor.auto_order()
+            if video_processor.auto_mode == 'race':
+                providers[name]['race'] = {
+                    'providers': video_processor.race_providers,
+                    'budget': video_processor.race_budget,
+                    'costs': video_processor.provider_costs,
+                }
+            continue
+        providers[name]['configured'] = configured.get(name, True)
+        health_key = video_processor._health_key(name)
+        providers[name]['health'] = video_processor.health.snapshot([health_key])[health_key]
+    
     return jsonify({
-        'providers': {
-            'auto': {
-                'name': 'Auto (Best)',
-                'strategy': 'Replicate → VModel → HuggingFace fallback chain',
-                'models': ['arabyai-replicate/roop_face_swap', 'vmodel/video-face-swap-pro', '4 HF Spaces'],
-                'timeout': '15-77 seconds (+ HF fallback if needed)',
-                'audio_preserved': True,
-                'cost': '$0.10-0.14 per video (FREE HF fallback)',
-                'status': '✅ RECOMMENDED - 6 PROVIDERS!'
-            },
-            'replicate': {
-                'name': 'Replicate (Stable)',
-                'models': ['arabyai-replicate/roop_face_swap'],
-                'timeout': '~77 seconds',
-                'audio_preserved': True,
-                'cost': '$0.14 per video',
-                'quality': 'Good, stable',
-                'status': '✅ WORKING 2025'
-            },
-            'vmodel': {
-                'name': 'VModel.AI (Premium)',
-                'models': ['vmodel/video-face-swap-pro'],
-                'timeout': '15-30 seconds',
-                'audio_preserved': True,
-                'cost': '$0.03/second (~$0.10 per short video)',
-                'quality': 'Premium, commercial license',
-                'status': '✅ WORKING 2025',
-                'requirements': 'Requires Supabase (auto-uploads files)'
-            },
-            'hf-tonyassi': {
-                'name': 'HuggingFace (tonyassi)',
-                'space': 'tonyassi/video-face-swap',
-                'timeout': 'Variable (queue-based)',
-                'audio_preserved': 'Unknown',
-                'cost': 'FREE',
-                'quality': 'Preview mode (800px, 4s, 12fps)',
-                'status': '🤗 FREE BACKUP',
-                'features': 'Gender filtering support'
-            },
-            'hf-marko': {
-                'name': 'HuggingFace (MarkoVidrih)',
-                'space': 'MarkoVidrih/video-face-swap',
-                'timeout': 'Variable (queue-based)',
-                'audio_preserved': 'Unknown',
-                'cost': 'FREE',
-                'quality': 'Basic quality',
-                'status': '🤗 FREE BACKUP'
-            },
-            'hf-alsv': {
-                'name': 'HuggingFace (ALSv)',
-                'space': 'ALSv/video-face-swap',
-                'timeout': 'Variable (queue-based)',
-                'audio_preserved': 'Unknown',
-                'cost': 'FREE',
-                'quality': 'Basic quality',
-                'status': '🤗 FREE BACKUP'
-            },
-            'hf-prithiv': {
-                'name': 'HuggingFace (prithivMLmods)',
-                'space': 'prithivMLmods/Video-Face-Swapper',
-                'timeout': 'Variable (queue-based)',
-                'audio_preserved': 'Unknown',
-                'cost': 'FREE',
-                'quality': 'Educational model',
-                'status': '🤗 FREE BACKUP'
-            }
-        },
+        'providers': providers,
         'supported_formats': {
             'video': list(ALLOWED_VIDEO_EXTENSIONS),
             'image': list(ALLOWED_IMAGE_EXTENSIONS)
         },
-        'usage': {
-            'provider_auto': 'Replicate → VModel → 4 HuggingFace Spaces (6 total providers!)',
-            'provider_replicate': 'Replicate only - arabyai-replicate/roop_face_swap with audio',
-            'provider_vmodel': 'VModel.AI - premium quality, faster, requires Supabase',
-            'provider_hf': '4 FREE HuggingFace Spaces (tonyassi, marko, alsv, prithiv)',
-            'audio_note': '✅ Replicate & VModel preserve original video audio!',
-            'important': 'Auto mode tries 6 providers for maximum reliability!'
-        }
+        'usage': PROVIDER_USAGE
     })
@@ -0,0 +1,40 @@
+"""
+Provider Webhook Routes
+Completion callbacks for non-blocking provider calls
+"""
+
+import os
+from flask import Blueprint, request, jsonify
+from utils.prediction_engine import get_prediction_engine, verify_webhook_signature
+
+webhooks_bp = Blueprint('webhooks', __name__)
+
+
+@webhooks_bp.route('/replicate', methods=['POST'])
+def replicate_webhook():
+    """
+    Replicate prediction webhook (REPLICATE_PREDICTION_MODE=webhook)
+    Set REPLICATE_WEBHOOK_URL to the public URL of this route and
+    REPLICATE_WEBHOOK_SECRET to the signing secret; unsigned webhooks are rejected.
+    """
+    try:
+        secret = os.getenv('REPLICATE_WEBHOOK_SECRET', '')
+        if not secret:
+            return jsonify({'error': 'Webhooks disabled: REPLICATE_WEBHOOK_SECRET not set'}), 403
+        if not verify_webhook_signature(secret, request.headers, request.get_data()):
+            return jsonify({'error': 'Invalid webhook signature'}), 401
+
+        payload = request.get_json(silent=True)
+        if not payload:
+            return jsonify({'error': 'Invalid payload'}), 400
+
+        engine = get_prediction_engine()
+        if not engine:
+            return jsonify({'success': False, 'message': 'Prediction engine disabled'}), 200
+
+        # Unknown ids belong to another worker; its safety poll will pick them up
+        known = engine.handle_webhook(payload)
+        return jsonify({'success': True, 'handled': known})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,58 @@
+import io
+import pytest
+from PIL import Image
+from utils.image_processor import ImageProcessor, ImageTooLargeError
+
+
+def encode(image, format='PNG', **params):
+    output = io.BytesIO()
+    image.save(output, format=format, **params)
+    return output.getvalue()
+
+
+def palette_image(size=(400, 200), transparency=None):
+    image = Image.new('RGB', size, (200, 30, 30)).convert('P', palette=Image.Palette.ADAPTIVE)
+    if transparency is not None:
+        image.info['transparency'] = transparency
+    return image
+
+
+@pytest.mark.parametrize('image, expected_mode', [
+    (Image.new('RGB', (400, 200), 'red'), 'RGB'),
+    (Image.new('RGBA', (400, 200), (0, 0, 255, 128)), 'RGBA'),
+    (Image.new('L', (400, 200), 128), 'L'),
+    (Image.new('1', (400, 200), 1), 'L'),
+    (Image.new('I;16', (400, 200), 1000), 'I'),
+    (palette_image(), 'RGB'),
+    (palette_image(transparency=0), 'RGBA'),
+])
+def test_load_image_reduces_every_mode(image, expected_mode):
+    loaded = ImageProcessor.load_image(encode(image), max_size=100)
+    assert loaded.size == (100, 50)
+    assert loaded.mode == expected_mode
+
+
+def test_load_image_keeps_small_images_unchanged():
+    loaded = ImageProcessor.load_image(encode(palette_image((80, 40))), max_size=100)
+    assert loaded.size == (80, 40)
+    assert loaded.mode == 'P'
+
+
+def test_load_image_uses_jpeg_draft():
+    data = encode(Image.new('RGB', (1600, 1200), 'green'), 'JPEG')
+    loaded = ImageProcessor.load_image(data, max_size=300)
+    assert loaded.size == (300, 225)
+
+
+def test_load_image_applies_exif_orientation():
+    image = Image.new('RGB', (400, 200), 'blue')
+    exif = image.getexif()
+    exif[0x0112] = 6
+    loaded = ImageProcessor.load_image(encode(image, 'JPEG', exif=exif), max_size=100)
+    assert loaded.size == (50, 100)
+
+
+def test_load_image_rejects_oversized_header(monkeypatch):
+    monkeypatch.setattr('utils.image_processor.MAX_IMAGE_PIXELS', 1000)
+    with pytest.raises(ImageTooLargeError):
+        ImageProcessor.load_image(encode(Image.new('L', (100, 100))))
@@ -0,0 +1,111 @@
+import time
+import threading
+import pytest
+from PIL import Image
+from utils.job_manager import JobManager, JobQueueFullError, MemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    return MemoryJobStore()
+
+
+def make_job(job_id, status='queued', created_at=None):
+    return {
+        'id': job_id, 'feature': 'test', 'status': status, 'created_at': created_at or time.time(),
+        'started_at': None, 'finished_at': None, 'error': None, 'result_mimetype': None, 'result_size': None,
+    }
+
+
+def wait_idle(manager, timeout=5):
+    """pending drops just after the job's status turns terminal"""
+    deadline = time.time() + timeout
+    while manager.stats()['pending'] and time.time() < deadline:
+        time.sleep(0.01)
+    return manager.stats()['pending']
+
+
+def test_store_round_trip(store):
+    store.create(make_job('a'))
+    store.update('a', status='running', started_at=1.0)
+    store.set_result('a', b'payload', 'image/png')
+
+    job = store.get('a')
+    assert job['status'] == 'running'
+    assert job['started_at'] == 1.0
+    assert job['result_mimetype'] == 'image/png'
+    assert job['result_size'] == 7
+    assert store.get_result('a') == (b'payload', 'image/png')
+    assert store.get('missing') is None
+    assert store.get_result('missing') is None
+
+
+def test_store_purge_keeps_unfinished_jobs(store):
+    store.create(make_job('old-done', status='succeeded', created_at=100))
+    store.create(make_job('old-running', status='running', created_at=100))
+    store.create(make_job('new-done', status='failed', created_at=300))
+
+    store.purge(older_than=200)
+
+    assert store.get('old-done') is None
+    assert store.get('old-running') is not None
+    assert store.get('new-done') is not None
+
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    SQLiteJobStore(path).create(make_job('shared'))
+    assert SQLiteJobStore(path).get('shared')['feature'] == 'test'
+
+
+def test_manager_runs_job_and_serializes_result(store):
+    manager = JobManager(store=store, max_workers=2)
+
+    image_job = manager.submit('image', lambda: Image.new('RGB', (4, 4)))
+    dict_job = manager.submit('dict', lambda value: {'value': value}, 3)
+
+    assert manager.wait(image_job['id'], timeout=5)['status'] == 'succeeded'
+    data, mimetype = manager.get_result(image_job['id'])
+    assert mimetype == 'image/png' and data.startswith(b'\x89PNG')
+
+    assert manager.wait(dict_job['id'], timeout=5)['status'] == 'succeeded'
+    assert manager.get_result(dict_job['id']) == (b'{"value": 3}', 'application/json')
+
+
+def test_manager_records_failure(store):
+    manager = JobManager(store=store)
+
+    def fail():
+        raise RuntimeError('provider down')
+
+    job = manager.wait(manager.submit('fail', fail)['id'], timeout=5)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'provider down'
+    assert wait_idle(manager) == 0
+
+
+def test_manager_rejects_when_queue_full():
+    manager = JobManager(max_workers=1, max_pending=1)
+    release = threading.Event()
+    job = manager.submit('block', release.wait)
+
+    with pytest.raises(JobQueueFullError):
+        manager.submit('overflow', lambda: None)
+
+    release.set()
+    assert manager.wait(job['id'], timeout=5)['status'] == 'succeeded'
+    assert wait_idle(manager) == 0
+    assert manager.wait(manager.submit('after', lambda: {})['id'], timeout=5)['status'] == 'succeeded'
+
+
+def test_manager_releases_slot_when_store_fails():
+    class BrokenStore(MemoryJobStore):
+        def create(self, job):
+            raise OSError('disk full')
+
+    manager = JobManager(store=BrokenStore(), max_pending=1)
+    with pytest.raises(OSError):
+        manager.submit('broken', lambda: None)
+    assert manager.stats()['pending'] == 0
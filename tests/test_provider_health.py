@@ -0,0 +1,110 @@
+import pytest
+from utils import provider_health
+from utils.provider_health import HealthRegistry, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(provider_health.time, 'time', clock.time)
+    return clock
+
+
+def fail():
+    raise RuntimeError('boom')
+
+
+def state(registry, key):
+    return registry.snapshot([key])[key]['state']
+
+
+def test_opens_after_consecutive_failures(clock):
+    registry = HealthRegistry(failure_threshold=3, cooldown=60)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            registry.call('p', fail)
+    assert state(registry, 'p') == CLOSED
+
+    with pytest.raises(RuntimeError):
+        registry.call('p', fail)
+    assert state(registry, 'p') == OPEN
+    assert not registry.is_available('p')
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        registry.call('p', lambda: calls.append(1))
+    assert calls == []
+
+
+def test_success_resets_consecutive_failures(clock):
+    registry = HealthRegistry(failure_threshold=3, min_calls=100)
+    for _ in range(2):
+        registry.record('p', False, 1.0)
+    registry.record('p', True, 1.0)
+    registry.record('p', False, 1.0)
+    assert state(registry, 'p') == CLOSED
+
+
+def test_opens_on_error_rate(clock):
+    registry = HealthRegistry(failure_threshold=100, max_error_rate=0.5, min_calls=4)
+    for ok in (True, False, True, False):
+        registry.record('p', ok, 1.0)
+    assert state(registry, 'p') == OPEN
+
+
+def test_half_open_probe_closes_on_success(clock):
+    registry = HealthRegistry(failure_threshold=1, cooldown=60)
+    registry.record('p', False, 1.0)
+    clock.now += 61
+    assert registry.is_available('p')
+
+    assert registry._acquire('p')
+    assert state(registry, 'p') == HALF_OPEN
+    assert not registry._acquire('p')
+    with pytest.raises(CircuitOpenError):
+        registry.call('p', lambda: 'second probe')
+
+    registry.record('p', True, 1.0)
+    assert state(registry, 'p') == CLOSED
+    assert registry.call('p', lambda: 'ok') == 'ok'
+
+
+def test_half_open_probe_reopens_on_failure(clock):
+    registry = HealthRegistry(failure_threshold=1, cooldown=60)
+    registry.record('p', False, 1.0)
+    clock.now += 61
+
+    with pytest.raises(RuntimeError):
+        registry.call('p', fail)
+    assert state(registry, 'p') == OPEN
+    assert registry.snapshot(['p'])['p']['opened_at'] == clock.now
+
+
+def test_unenforced_call_runs_while_open(clock):
+    registry = HealthRegistry(failure_threshold=1)
+    registry.record('p', False, 1.0)
+    assert registry.call('p', lambda: 'fallback', enforce=False) == 'fallback'
+    assert state(registry, 'p') == CLOSED
+
+
+def test_order_prefers_available_then_healthy_then_fast(clock):
+    registry = HealthRegistry(failure_threshold=1, min_calls=100)
+    registry.record('down', False, 1.0)
+    registry.record('slow', True, 5.0)
+    registry.record('fast', True, 1.0)
+    assert registry.order(['down', 'new', 'slow', 'fast']) == ['fast', 'slow', 'new', 'down']
+
+
+def test_samples_expire_after_window(clock):
+    registry = HealthRegistry(window=300, failure_threshold=100, min_calls=100)
+    registry.record('p', False, 1.0)
+    clock.now += 301
+    assert registry.snapshot(['p'])['p']['calls'] == 0
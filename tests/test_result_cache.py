@@ -0,0 +1,91 @@
+import io
+import os
+import time
+from PIL import Image
+from utils.image_processor import ImageProcessor
+from utils.result_cache import MemoryTier, DiskTier, ResultCache, make_cache_key, image_cache_bytes
+
+
+def test_cache_key_depends_on_every_part():
+    base = make_cache_key('model:v1', 'upscale', b'input', {'scale': 2})
+    assert base == make_cache_key('model:v1', 'upscale', b'input', {'scale': 2})
+    assert base != make_cache_key('model:v2', 'upscale', b'input', {'scale': 2})
+    assert base != make_cache_key('model:v1', 'restore', b'input', {'scale': 2})
+    assert base != make_cache_key('model:v1', 'upscale', b'other', {'scale': 2})
+    assert base != make_cache_key('model:v1', 'upscale', b'input', {'scale': 4})
+
+
+def test_cache_key_ignores_param_order():
+    assert (make_cache_key('m', 'op', b'', {'a': 1, 'b': 2}) ==
+            make_cache_key('m', 'op', b'', {'b': 2, 'a': 1}))
+
+
+def test_image_cache_bytes_uses_upload_bytes_or_pixels():
+    image = Image.new('RGB', (8, 8), 'red')
+    assert image_cache_bytes(image).startswith(b'RGB:8x8:')
+
+    upload = ImageProcessor.image_to_bytes(image, 'PNG')
+    opened = ImageProcessor.open_upload(io.BytesIO(upload))
+    assert image_cache_bytes(opened) == b'source:' + upload
+    assert image_cache_bytes(opened.resize((4, 4))).startswith(b'RGB:4x4:')
+
+
+def test_memory_tier_evicts_least_recently_used():
+    tier = MemoryTier(max_bytes=10, max_item_bytes=10)
+    tier.put('a', b'1234', 'x')
+    tier.put('b', b'1234', 'x')
+    tier.get('a')
+    tier.put('c', b'1234', 'x')
+
+    assert tier.get('a') is not None
+    assert tier.get('b') is None
+    assert tier.get('c') is not None
+    assert tier.stats()['bytes'] == 8
+    assert tier.stats()['evictions'] == 1
+
+
+def test_memory_tier_skips_oversized_items():
+    tier = MemoryTier(max_bytes=100, max_item_bytes=4)
+    tier.put('big', b'12345', 'x')
+    assert tier.get('big') is None
+
+
+def test_disk_tier_round_trip_and_ttl(tmp_path):
+    tier = DiskTier(str(tmp_path), max_bytes=1024, ttl=60)
+    tier.put('ab' * 32, b'data', 'image/png')
+    assert tier.get('ab' * 32) == (b'data', 'image/png')
+
+    old = time.time() - 120
+    os.utime(os.path.join(str(tmp_path), 'ab', 'ab' * 32 + '.bin'), (old, old))
+    assert tier.get('ab' * 32) is None
+    assert tier.stats()['expirations'] == 1
+    assert tier.stats()['bytes'] == 0
+
+
+def test_disk_tier_evicts_oldest_and_counts_existing_bytes(tmp_path):
+    tier = DiskTier(str(tmp_path), max_bytes=10, ttl=3600)
+    tier.put('aa1', b'12345', 'x')
+    old = time.time() - 30
+    os.utime(os.path.join(str(tmp_path), 'aa', 'aa1.bin'), (old, old))
+    tier.put('bb1', b'12345', 'x')
+    tier.put('cc1', b'12345', 'x')
+
+    assert tier.get('aa1') is None
+    assert tier.get('cc1') == (b'12345', 'x')
+    assert tier.stats()['evictions'] >= 1
+    assert DiskTier(str(tmp_path), max_bytes=10, ttl=3600).current_bytes == tier.current_bytes
+
+
+def test_result_cache_promotes_disk_hits_and_counts(tmp_path):
+    disk = DiskTier(str(tmp_path), max_bytes=1024, ttl=60)
+    disk.put('key1', b'data', 'image/webp')
+    cache = ResultCache(memory_tier=MemoryTier(1024), disk_tier=disk)
+
+    assert cache.get('missing', 'upscale') is None
+    assert cache.get('key1', 'upscale') == (b'data', 'image/webp')
+    assert cache.get('key1', 'upscale') == (b'data', 'image/webp')
+
+    stats = cache.stats()
+    assert (stats['misses'], stats['disk_hits'], stats['memory_hits']) == (1, 1, 1)
+    assert stats['hit_rate'] == round(2 / 3, 4)
+    assert stats['operations']['upscale'] == {'hits': 2, 'misses': 1}
@@ -0,0 +1,109 @@
+import os
+import random
+import pytest
+from utils.fakes.tus_server import FakeTusServer, PREFIX
+from utils.resumable_upload import TusUploader, ResumableUploadError
+
+HEADERS = {'Authorization': 'Bearer test'}
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(**kwargs):
+        server = FakeTusServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def make_uploader(server, **kwargs):
+    kwargs.setdefault('retry_backoff', 0)
+    return TusUploader(server.base_url + PREFIX, headers=HEADERS, **kwargs)
+
+
+def payload(size):
+    return bytes(random.Random(size).getrandbits(8) for _ in range(size))
+
+
+def test_sequential_upload_in_chunks(make_server):
+    server = make_server()
+    uploader = make_uploader(server, chunk_size=1000)
+    data = payload(4500)
+
+    uploader.upload(data, {'objectName': 'clip.mp4'})
+
+    assert server.objects['clip.mp4'] == data
+    assert sum(1 for method, _ in server.requests if method == 'PATCH') == 5
+    assert uploader.stats()['chunks'] == 5
+
+
+def test_dropped_chunks_are_resumed_from_server_offset(make_server):
+    random.seed(7)
+    server = make_server(drop_rate=0.3)
+    uploader = make_uploader(server, chunk_size=500, max_retries=10)
+    data = payload(5000)
+
+    uploader.upload(data, {'objectName': 'flaky.mp4'})
+
+    assert server.objects['flaky.mp4'] == data
+    assert uploader.stats()['retries'] > 0
+    assert any(method == 'HEAD' for method, _ in server.requests)
+
+
+def test_failed_file_upload_resumes_on_retry(make_server, tmp_path):
+    server = make_server(drop_rate=1.0)
+    uploader = make_uploader(server, chunk_size=1000, max_retries=0)
+    data = payload(3000)
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(data)
+
+    with pytest.raises(ResumableUploadError):
+        uploader.upload(str(path), {'objectName': 'video.mp4'})
+    assert uploader.stats()['pending_resumes'] == 1
+    (upload,) = server.uploads.values()
+    received = len(upload['data'])
+    assert 0 < received < len(data)
+
+    server.drop_rate = 0
+    uploader.upload(str(path), {'objectName': 'video.mp4'})
+
+    assert server.objects['video.mp4'] == data
+    assert len(server.uploads) == 1
+    assert uploader.stats()['resumed'] == 1
+    assert uploader.stats()['pending_resumes'] == 0
+
+
+def test_changed_file_starts_a_new_upload(make_server, tmp_path):
+    server = make_server(drop_rate=1.0)
+    uploader = make_uploader(server, chunk_size=1000, max_retries=0)
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(payload(3000))
+
+    with pytest.raises(ResumableUploadError):
+        uploader.upload(str(path), {'objectName': 'video.mp4'})
+
+    server.drop_rate = 0
+    data = payload(3500)
+    path.write_bytes(data)
+    uploader.upload(str(path), {'objectName': 'video.mp4'})
+
+    assert server.objects['video.mp4'] == data
+    assert len(server.uploads) == 2
+    assert uploader.stats()['resumed'] == 0
+
+
+def test_parallel_upload_with_concatenation(make_server):
+    server = make_server(concatenation=True)
+    uploader = make_uploader(server, chunk_size=1000, parallel=3)
+    data = payload(5500)
+
+    uploader.upload(data, {'objectName': 'parts.mp4'})
+
+    assert server.objects['parts.mp4'] == data
+    partials = [upload for upload in server.uploads.values() if upload['partial']]
+    assert len(partials) == 3
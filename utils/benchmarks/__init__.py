@@ -0,0 +1,3 @@
+"""
+Micro-benchmarks for hot paths, runnable as modules (python -m utils.benchmarks.<name>)
+"""
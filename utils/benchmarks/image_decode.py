@@ -0,0 +1,77 @@
+"""
+Benchmark: full decode + LANCZOS resize vs ImageProcessor.load_image
+
+Compares the current upload path (Image.open, decode every pixel, then
+resize) with reduced-resolution loading (JPEG draft mode / reduce()) on
+synthetic phone-sized photos, or on your own files.
+
+Usage:
+    python -m utils.benchmarks.image_decode
+    python -m utils.benchmarks.image_decode --max-size 1024 --runs 10 photo1.jpg photo2.png
+"""
+
+import io
+import time
+import argparse
+from PIL import Image, ImageFilter
+from utils.image_processor import ImageProcessor
+
+
+def synthetic_photo(size=(4032, 3024), format='JPEG'):
+    """12 MP image with photo-like detail, encoded like a phone upload"""
+    image = Image.effect_mandelbrot(size, (-2.2, -1.2, 1.0, 1.2), 64).convert('RGB')
+    noise = Image.effect_noise(size, 24).convert('RGB')
+    image = Image.blend(image, noise, 0.25).filter(ImageFilter.SMOOTH)
+    output = io.BytesIO()
+    if format == 'JPEG':
+        image.save(output, format='JPEG', quality=90)
+    else:
+        image.save(output, format=format)
+    return output.getvalue()
+
+
+def current_path(data, max_size):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return ImageProcessor.resize_image(image, max_size)
+
+
+def reduced_path(data, max_size):
+    return ImageProcessor.load_image(data, max_size)
+
+
+def bench(func, data, max_size, runs):
+    func(data, max_size)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(data, max_size)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], result.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare full decode + resize with reduced-resolution loading')
+    parser.add_argument('files', nargs='*', help='Images to load (default: synthetic 12 MP JPEG and PNG)')
+    parser.add_argument('--max-size', type=int, default=1024)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.files:
+        samples = [(path, open(path, 'rb').read()) for path in args.files]
+    else:
+        samples = [('synthetic 12MP JPEG', synthetic_photo()), ('synthetic 12MP PNG', synthetic_photo(format='PNG'))]
+
+    print(f"[Bench] max_size={args.max_size}, median of {args.runs} runs")
+    for name, data in samples:
+        full, full_size = bench(current_path, data, args.max_size, args.runs)
+        reduced, reduced_size = bench(reduced_path, data, args.max_size, args.runs)
+        print(f"[Bench] {name} ({len(data) // 1024} KB): "
+              f"full decode {full * 1000:.0f} ms -> {full_size}, "
+              f"load_image {reduced * 1000:.0f} ms -> {reduced_size}, "
+              f"{full / reduced:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
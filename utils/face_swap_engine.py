@@ -0,0 +1,476 @@
+import os
+import time
+import queue
+import hashlib
+import threading
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import Future
+from utils.image_processor import ImageProcessor
+from utils.hedged_executor import LatencyHistogram
+
+# ArcFace 5-point template (eyes, nose, mouth corners) for a 112x112 crop
+ARCFACE_DST = [[38.2946, 51.6963], [73.5318, 51.5014], [56.0252, 71.7366], [41.5493, 92.3655], [70.7299, 92.2041]]
+
+REQUIRED_MODULES = ('numpy', 'cv2', 'onnxruntime')
+
+DEFAULT_SWAPPER = 'inswapper_128.onnx'
+
+
+def emap_paths(model_dir, swapper):
+    """
+    (.emap.npy cache, .onnx source) of the swapper's embedding projection
+    The .npy is extracted from the .onnx graph with the `onnx` package on first load; a .ort
+    swapper needs either the .npy or the .onnx model next to it.
+    """
+    base = os.path.join(model_dir, os.path.splitext(swapper)[0])
+    return base + '.emap.npy', base + '.onnx'
+
+
+class NoFaceError(Exception):
+    """No face was found in the source or target image"""
+
+
+def _dynamic_batch(session):
+    """True if the model's first input takes any batch size"""
+    dim = session.get_inputs()[0].shape[0]
+    return not isinstance(dim, int) or dim <= 0
+
+
+class FaceSwapEngine:
+    """
+    In-process CPU face swap for still images (InsightFace-style ONNX models)
+
+    - detector: SCRFD (det_10g.onnx), boxes + 5 landmarks
+    - embedder: ArcFace (w600k_r50.onnx), 512-d identity embedding of the source face
+    - swapper: inswapper_128.onnx, renders the source identity into each aligned target face
+
+    Sessions are created once per process and shared by every request. `.ort`
+    models run straight from the file's bytes (one copy of the weights instead
+    of two), and the swapper's embedding projection is a memory-mapped .npy.
+
+    Requests are queued and a single batcher thread takes up to max_batch of
+    them (waiting at most batch_window for more), then runs each stage once for
+    the whole batch: one detector pass, one embedder pass for the sources not
+    in the embedding cache, one swapper pass for every target face. Models
+    exported with a fixed batch size of 1 are run per item inside the stage.
+    Source embeddings are cached by image hash, so swapping the same face into
+    many templates runs detection and ArcFace once.
+
+    Batches form from concurrent swap() calls in one process: with Gunicorn's
+    default sync workers each worker handles one request at a time, so only
+    async=true jobs (job pool threads) batch together. Run gthread workers
+    (--worker-class gthread --threads N) for synchronous requests to batch.
+    """
+
+    def __init__(self, model_dir, detector='det_10g.onnx', embedder='w600k_r50.onnx', swapper=DEFAULT_SWAPPER,
+                 max_batch=8, batch_window=0.015, threads=0, det_size=640, det_threshold=0.5, max_side=2048,
+                 cache_size=256, timeout=60):
+        import numpy as np
+        import cv2
+        import onnxruntime as ort
+        self.np, self.cv2, self.ort = np, cv2, ort
+
+        self.model_dir = model_dir
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.threads = threads
+        self.det_size = det_size
+        self.det_threshold = det_threshold
+        self.max_side = max_side
+        self.cache_size = cache_size
+        self.timeout = timeout
+
+        start_time = time.time()
+        self._model_bytes = []
+        self.detector = self._session(detector)
+        self.embedder = self._session(embedder)
+        self.swapper = self._session(swapper)
+        self.emap = self._emap(swapper)
+        print(f"[FaceSwap] Models loaded from {model_dir} in {time.time() - start_time:.1f}s")
+
+        swapper_input = self.swapper.get_inputs()[0]
+        self.swap_size = swapper_input.shape[2] if isinstance(swapper_input.shape[2], int) else 128
+        self.embed_size = 112
+
+        self._embeddings = OrderedDict()  # sha256 of source image -> normed embedding
+        self._queue = queue.Queue()
+        self._latency = LatencyHistogram()
+        self._counters = {'requests': 0, 'batches': 0, 'faces_swapped': 0, 'no_face': 0, 'failed': 0,
+                          'embedding_hits': 0, 'embedding_misses': 0, 'max_batch_seen': 0}
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run_batches, name='face-swap-batcher', daemon=True)
+        self._worker.start()
+
+    # Model loading
+
+    def _session(self, filename):
+        options = self.ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        path = os.path.join(self.model_dir, filename)
+        if path.endswith('.ort'):
+            # ORT format: the session runs from the file's bytes, initializers included, instead of
+            # copying the weights into its own buffers; the bytes must outlive the session
+            with open(path, 'rb') as f:
+                model_bytes = f.read()
+            self._model_bytes.append(model_bytes)
+            options.add_session_config_entry('session.use_ort_model_bytes_directly', '1')
+            options.add_session_config_entry('session.use_ort_model_bytes_for_initializers', '1')
+            return self.ort.InferenceSession(model_bytes, sess_options=options, providers=['CPUExecutionProvider'])
+        return self.ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+    def _emap(self, swapper):
+        """inswapper's embedding projection (last graph initializer), cached as .npy and memory-mapped"""
+        path, onnx_path = emap_paths(self.model_dir, swapper)
+        if not os.path.exists(path):
+            import onnx
+            from onnx import numpy_helper
+            model = onnx.load(onnx_path)
+            self.np.save(path, numpy_helper.to_array(model.graph.initializer[-1]))
+        return self.np.load(path, mmap_mode='r')
+
+    # Public API
+
+    def swap(self, source_image, target_image, all_faces=True):
+        """
+        Render the largest face of source_image onto the faces of target_image (PIL Images)
+        all_faces=False swaps only the largest target face. Returns a PIL Image.
+        Raises NoFaceError when either image has no face.
+        """
+        future = Future()
+        self._queue.put((source_image, target_image, all_faces, future))
+        with self._lock:
+            self._counters['requests'] += 1
+        return future.result(timeout=self.timeout)
+
+    def stats(self):
+        with self._lock:
+            batches = self._counters['batches']
+            return dict(self._counters, queued=self._queue.qsize(), cached_embeddings=len(self._embeddings),
+                        avg_batch=round(self._counters['requests'] / batches, 2) if batches else 0.0,
+                        max_batch=self.max_batch, batch_window_ms=int(self.batch_window * 1000),
+                        latency=self._latency.to_dict())
+
+    # Batching
+
+    def _run_batches(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.time() + self.batch_window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            start_time = time.time()
+            try:
+                self._process(items)
+            except Exception as e:
+                for item in items:
+                    if not item[3].done():
+                        item[3].set_exception(e)
+            with self._lock:
+                self._counters['batches'] += 1
+                self._counters['max_batch_seen'] = max(self._counters['max_batch_seen'], len(items))
+                self._latency.record(time.time() - start_time)
+
+    def _fail(self, item, error):
+        with self._lock:
+            self._counters['no_face' if isinstance(error, NoFaceError) else 'failed'] += 1
+        item[3].set_exception(error)
+
+    def _process(self, items):
+        np = self.np
+        jobs = []
+        for item in items:
+            source_image, target_image, all_faces, future = item
+            try:
+                jobs.append({
+                    'item': item,
+                    'source_key': self._image_key(source_image),
+                    'source': self._to_bgr(source_image),
+                    'target': self._to_bgr(target_image),
+                    'all_faces': all_faces,
+                })
+            except Exception as e:
+                self._fail(item, e)
+
+        # 1. Embeddings: cached sources skip detection and ArcFace entirely
+        with self._lock:
+            for job in jobs:
+                embedding = self._embeddings.get(job['source_key'])
+                if embedding is not None:
+                    self._embeddings.move_to_end(job['source_key'])
+                    self._counters['embedding_hits'] += 1
+                job['embedding'] = embedding
+        missing = [job for job in jobs if job['embedding'] is None]
+
+        # 2. One detector pass over the targets and the uncached sources
+        images = [job['target'] for job in jobs] + [job['source'] for job in missing]
+        detections = self._detect(images)
+        for job, faces in zip(jobs, detections[:len(jobs)]):
+            job['faces'] = faces
+        for job, faces in zip(missing, detections[len(jobs):]):
+            job['source_faces'] = faces
+
+        # 3. One embedder pass for the new sources
+        embed_jobs = []
+        for job in missing:
+            if not job['source_faces']:
+                self._fail(job['item'], NoFaceError('No face detected in source image'))
+                job['failed'] = True
+                continue
+            embed_jobs.append(job)
+        if embed_jobs:
+            crops = [self._align(job['source'], self._largest(job['source_faces'])[1], self.embed_size)[0]
+                     for job in embed_jobs]
+            blobs = self.cv2.dnn.blobFromImages(crops, 1.0 / 127.5, (self.embed_size, self.embed_size),
+                                                (127.5, 127.5, 127.5), swapRB=True)
+            embeddings = self._run(self.embedder, {self.embedder.get_inputs()[0].name: blobs})[0]
+            with self._lock:
+                for job, embedding in zip(embed_jobs, embeddings):
+                    embedding = embedding / np.linalg.norm(embedding)
+                    job['embedding'] = embedding
+                    self._counters['embedding_misses'] += 1
+                    self._embeddings[job['source_key']] = embedding
+                    while len(self._embeddings) > self.cache_size:
+                        self._embeddings.popitem(last=False)
+
+        # 4. One swapper pass over every target face of every request
+        swaps = []  # (job, M, crop)
+        latents = []
+        for job in jobs:
+            if job.get('failed') or job['item'][3].done():
+                continue
+            faces = job['faces']
+            if not faces:
+                self._fail(job['item'], NoFaceError('No face detected in target image'))
+                job['failed'] = True
+                continue
+            if not job['all_faces']:
+                faces = [self._largest(faces)]
+            latent = (job['embedding'].reshape(1, -1) @ self.emap)
+            latent = latent / np.linalg.norm(latent)
+            for _, kps in faces:
+                crop, M = self._align(job['target'], kps, self.swap_size)
+                swaps.append((job, M, crop))
+                latents.append(latent[0])
+        if swaps:
+            blobs = self.cv2.dnn.blobFromImages([crop for _, _, crop in swaps], 1.0 / 255.0,
+                                                (self.swap_size, self.swap_size), (0, 0, 0), swapRB=True)
+            inputs = self.swapper.get_inputs()
+            outputs = self._run(self.swapper, {inputs[0].name: blobs,
+                                               inputs[1].name: np.stack(latents).astype(np.float32)})[0]
+
+            # 5. Paste the rendered faces back, one target at a time
+            for (job, M, crop), rendered in zip(swaps, outputs):
+                rgb = np.clip(rendered.transpose((1, 2, 0)) * 255, 0, 255).astype(np.uint8)
+                job['target'] = self._paste(job['target'], rgb[:, :, ::-1], M)
+                job['swapped'] = job.get('swapped', 0) + 1
+
+        for job in jobs:
+            if job.get('failed') or job['item'][3].done():
+                continue
+            with self._lock:
+                self._counters['faces_swapped'] += job.get('swapped', 0)
+            job['item'][3].set_result(self._to_pil(job['target']))
+
+    def _run(self, session, feeds):
+        """session.run on a stacked batch; per item (re-stacked) when the model has a fixed batch of 1"""
+        batch = len(next(iter(feeds.values())))
+        if batch == 1 or _dynamic_batch(session):
+            return session.run(None, feeds)
+        results = [session.run(None, {name: value[i:i + 1] for name, value in feeds.items()}) for i in range(batch)]
+        return [self.np.concatenate([result[k] for result in results]) for k in range(len(results[0]))]
+
+    # Image helpers
+
+    @staticmethod
+    def _image_key(image):
+        data = ImageProcessor.source_bytes(image)
+        if data is None:
+            data = f"{image.mode}:{image.size}".encode() + image.tobytes()
+        return hashlib.sha256(data).hexdigest()
+
+    def _to_bgr(self, image):
+        data = ImageProcessor.source_bytes(image)
+        if data is not None:
+            # Decoded upright and at no more than max_side (JPEG draft mode)
+            image = ImageProcessor.load_image(data, self.max_side)
+        else:
+            image = ImageProcessor.resize_image(image, self.max_side)
+        return self.np.ascontiguousarray(self.np.asarray(image.convert('RGB'))[:, :, ::-1])
+
+    def _to_pil(self, bgr):
+        from PIL import Image
+        return Image.fromarray(self.np.ascontiguousarray(bgr[:, :, ::-1]))
+
+    @staticmethod
+    def _largest(faces):
+        return max(faces, key=lambda face: (face[0][2] - face[0][0]) * (face[0][3] - face[0][1]))
+
+    def _align(self, image, kps, size):
+        """Similarity-warp the face to the ArcFace template scaled to size; returns (crop, M)"""
+        np = self.np
+        if size % 112 == 0:
+            ratio, diff_x = size / 112.0, 0.0
+        else:
+            ratio, diff_x = size / 128.0, 8.0 * size / 128.0
+        dst = np.array(ARCFACE_DST, dtype=np.float32) * ratio
+        dst[:, 0] += diff_x
+        M = self.cv2.estimateAffinePartial2D(np.asarray(kps, dtype=np.float32), dst, method=self.cv2.LMEDS)[0]
+        return self.cv2.warpAffine(image, M, (size, size), borderValue=0.0), M
+
+    def _paste(self, target, face_bgr, M):
+        """Inverse-warp the rendered face into the target with an eroded, feathered mask"""
+        np, cv2 = self.np, self.cv2
+        height, width = target.shape[:2]
+        IM = cv2.invertAffineTransform(M)
+        warped = cv2.warpAffine(face_bgr, IM, (width, height), borderValue=0.0)
+        mask = cv2.warpAffine(np.full(face_bgr.shape[:2], 255, dtype=np.uint8), IM, (width, height),
+                              borderValue=0.0)
+        mask[mask > 20] = 255
+        ys, xs = np.where(mask == 255)
+        if not len(ys):
+            return target
+        mask_size = int(np.sqrt((ys.max() - ys.min()) * (xs.max() - xs.min())))
+        k = max(mask_size // 10, 10)
+        mask = cv2.erode(mask, np.ones((k, k), np.uint8), iterations=1)
+        k = max(mask_size // 20, 5)
+        mask = cv2.GaussianBlur(mask, (2 * k + 1, 2 * k + 1), 0).astype(np.float32)[:, :, None] / 255.0
+        return (mask * warped + (1.0 - mask) * target).astype(np.uint8)
+
+    # SCRFD detection
+
+    def _detect(self, images):
+        """[(box [x1, y1, x2, y2, score], kps 5x2)] per BGR image"""
+        if not images:
+            return []
+        np, cv2 = self.np, self.cv2
+        size = self.det_size
+        canvases, scales = [], []
+        for image in images:
+            scale = min(size / image.shape[0], size / image.shape[1])
+            resized = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)))
+            canvas = np.zeros((size, size, 3), dtype=np.uint8)
+            canvas[:resized.shape[0], :resized.shape[1]] = resized
+            canvases.append(canvas)
+            scales.append(scale)
+        blobs = cv2.dnn.blobFromImages(canvases, 1.0 / 128, (size, size), (127.5, 127.5, 127.5), swapRB=True)
+
+        name = self.detector.get_inputs()[0].name
+        if _dynamic_batch(self.detector) and len(self.detector.get_outputs()[0].shape) == 3:
+            outputs = self.detector.run(None, {name: blobs})
+            per_image = [[output[i] for output in outputs] for i in range(len(images))]
+        else:
+            per_image = [self.detector.run(None, {name: blobs[i:i + 1]}) for i in range(len(images))]
+            per_image = [[output[0] if output.ndim == 3 else output for output in outs] for outs in per_image]
+        return [self._decode(outs, scale) for outs, scale in zip(per_image, scales)]
+
+    def _decode(self, outputs, scale):
+        """SCRFD heads (3 strides, 2 anchors, with keypoints) -> NMS'd faces in source pixels"""
+        np = self.np
+        size = self.det_size
+        strides = (8, 16, 32)
+        boxes, scores, keypoints = [], [], []
+        for index, stride in enumerate(strides):
+            score = outputs[index].reshape(-1)
+            distances = outputs[index + 3] * stride
+            kps_distances = outputs[index + 6] * stride
+            grid = size // stride
+            centers = np.stack(np.mgrid[:grid, :grid][::-1], axis=-1).astype(np.float32)
+            centers = np.repeat((centers * stride).reshape(-1, 2), 2, axis=0)
+
+            keep = np.where(score >= self.det_threshold)[0]
+            if not len(keep):
+                continue
+            c = centers[keep]
+            d = distances[keep]
+            boxes.append(np.stack([c[:, 0] - d[:, 0], c[:, 1] - d[:, 1], c[:, 0] + d[:, 2], c[:, 1] + d[:, 3]], axis=-1))
+            scores.append(score[keep])
+            k = kps_distances[keep].reshape(-1, 5, 2)
+            keypoints.append(c[:, None, :] + k)
+        if not boxes:
+            return []
+
+        boxes = np.concatenate(boxes) / scale
+        scores = np.concatenate(scores)
+        keypoints = np.concatenate(keypoints) / scale
+        order = scores.argsort()[::-1]
+        faces = []
+        suppressed = np.zeros(len(order), dtype=bool)
+        for position, i in enumerate(order):
+            if suppressed[position]:
+                continue
+            faces.append((np.append(boxes[i], scores[i]), keypoints[i]))
+            rest = order[position + 1:]
+            x1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+            y1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+            x2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+            y2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+            overlap = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+            area_i = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
+            area_rest = (boxes[rest, 2] - boxes[rest, 0]) * (boxes[rest, 3] - boxes[rest, 1])
+            suppressed[position + 1:] |= overlap / (area_i + area_rest - overlap + 1e-6) > 0.4
+        return faces
+
+
+_face_swap_engine = None
+_face_swap_engine_error = None
+_face_swap_engine_lock = threading.Lock()
+
+
+def face_swap_unavailable_reason():
+    """Why get_face_swap_engine() returns None (or None if it doesn't); loads nothing"""
+    model_dir = os.getenv('FACE_SWAP_MODEL_DIR')
+    if not model_dir:
+        return 'FACE_SWAP_MODEL_DIR not set'
+    modules = list(REQUIRED_MODULES)
+    emap_path, onnx_path = emap_paths(model_dir, os.getenv('FACE_SWAP_SWAPPER', DEFAULT_SWAPPER))
+    if not os.path.exists(emap_path):
+        if not os.path.exists(onnx_path):
+            return f"Swapper embedding map missing: needs {emap_path} or {onnx_path}"
+        # Extracting the embedding map once needs the onnx package
+        modules.append('onnx')
+    missing = [name for name in modules if importlib.util.find_spec(name) is None]
+    if missing:
+        return f"Missing packages: {', '.join(missing)}"
+    return _face_swap_engine_error
+
+
+def loaded_face_swap_engine():
+    """The FaceSwapEngine if this process has already loaded it, else None (never loads the models)"""
+    return _face_swap_engine
+
+
+def get_face_swap_engine():
+    """
+    Process-wide FaceSwapEngine, loaded on first use
+    None when FACE_SWAP_MODEL_DIR is unset, the runtime packages are missing or the models failed to load
+    """
+    global _face_swap_engine, _face_swap_engine_error
+    with _face_swap_engine_lock:
+        if _face_swap_engine is None and _face_swap_engine_error is None:
+            if face_swap_unavailable_reason():
+                return None
+            try:
+                _face_swap_engine = FaceSwapEngine(
+                    os.getenv('FACE_SWAP_MODEL_DIR'),
+                    detector=os.getenv('FACE_SWAP_DETECTOR', 'det_10g.onnx'),
+                    embedder=os.getenv('FACE_SWAP_EMBEDDER', 'w600k_r50.onnx'),
+                    swapper=os.getenv('FACE_SWAP_SWAPPER', DEFAULT_SWAPPER),
+                    max_batch=int(os.getenv('FACE_SWAP_BATCH_SIZE', '8')),
+                    batch_window=int(os.getenv('FACE_SWAP_BATCH_WINDOW_MS', '15')) / 1000.0,
+                    threads=int(os.getenv('FACE_SWAP_THREADS', '0')),
+                    max_side=int(os.getenv('FACE_SWAP_MAX_SIDE', '2048')),
+                    cache_size=int(os.getenv('FACE_SWAP_EMBEDDING_CACHE', '256'))
+                )
+            except Exception as e:
+                _face_swap_engine_error = f"Model loading failed: {e}"
+                print(f"[FaceSwap] {_face_swap_engine_error}")
+        return _face_swap_engine
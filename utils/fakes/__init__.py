@@ -0,0 +1,3 @@
+"""
+Local stand-ins for remote providers, for offline development and testing
+"""
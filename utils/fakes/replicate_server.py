@@ -0,0 +1,222 @@
+"""
+Fake Replicate API server
+
+Implements the subset of the Replicate HTTP API used by PredictionEngine:
+- POST /v1/predictions            create (status "starting")
+- GET  /v1/predictions/<id>       status; succeeds after `latency` seconds
+- POST /v1/predictions/<id>/cancel
+- POST /v1/files                  upload (multipart), returns a file handle
+- GET  /files/<id>.png            generated output image
+
+When a prediction is created with a webhook URL, the completed prediction
+is POSTed to it, like Replicate does.
+
+Usage:
+    python -m utils.fakes.replicate_server --port 8081 --latency 5
+    REPLICATE_API_BASE_URL=http://localhost:8081 REPLICATE_PREDICTION_MODE=poll python app.py
+"""
+
+import io
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class FakeReplicateServer:
+    """Threaded in-process fake of the Replicate predictions API"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=2.0, fail_rate=0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.predictions = {}
+        self.files = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _refresh(self, prediction):
+        """Advance a prediction's status based on elapsed time"""
+        if prediction['status'] in ('succeeded', 'failed', 'canceled'):
+            return prediction
+        elapsed = time.time() - prediction['_created']
+        if elapsed >= prediction['_latency']:
+            if prediction['_fail']:
+                prediction['status'] = 'failed'
+                prediction['error'] = 'Fake prediction failure'
+            else:
+                prediction['status'] = 'succeeded'
+                prediction['output'] = f"{self.base_url}/files/{prediction['id']}.png"
+            prediction['completed_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            if prediction.get('webhook'):
+                threading.Thread(target=self._send_webhook, args=(prediction,), daemon=True).start()
+        elif elapsed > 0.2:
+            prediction['status'] = 'processing'
+        return prediction
+
+    @staticmethod
+    def public(prediction):
+        return {k: v for k, v in prediction.items() if not k.startswith('_')}
+
+    def _send_webhook(self, prediction):
+        body = json.dumps(self.public(prediction)).encode()
+        req = urllib.request.Request(prediction['webhook'], data=body,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(req, timeout=10).read()
+        except Exception as e:
+            print(f"[FakeReplicate] Webhook to {prediction['webhook']} failed: {e}")
+
+    def _webhook_timer(self, prediction_id):
+        """Complete predictions that have a webhook even if nobody polls them"""
+        with self._lock:
+            prediction = self.predictions.get(prediction_id)
+            if prediction:
+                self._refresh(prediction)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def do_POST(self):
+                server.requests.append(('POST', self.path))
+                if self.path == '/v1/predictions':
+                    data = self._body()
+                    prediction = {
+                        'id': uuid.uuid4().hex[:16],
+                        'model': 'fake/model',
+                        'version': data.get('version') or 'fake-version',
+                        'input': data.get('input'),
+                        'status': 'starting',
+                        'output': None,
+                        'error': None,
+                        'logs': '',
+                        'metrics': {},
+                        'webhook': data.get('webhook'),
+                        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                        'started_at': None,
+                        'completed_at': None,
+                        'urls': {},
+                        '_created': time.time(),
+                        '_latency': server.latency,
+                        '_fail': random.random() < server.fail_rate,
+                    }
+                    prediction['urls'] = {
+                        'get': f"{server.base_url}/v1/predictions/{prediction['id']}",
+                        'cancel': f"{server.base_url}/v1/predictions/{prediction['id']}/cancel",
+                    }
+                    with server._lock:
+                        server.predictions[prediction['id']] = prediction
+                    if prediction['webhook']:
+                        threading.Timer(server.latency, server._webhook_timer, args=(prediction['id'],)).start()
+                    return self._json(201, server.public(prediction))
+
+                if self.path == '/v1/files':
+                    length = int(self.headers.get('Content-Length') or 0)
+                    body = self.rfile.read(length)
+                    file_id = uuid.uuid4().hex[:16]
+                    with server._lock:
+                        server.files[file_id] = body
+                    return self._json(201, {
+                        'id': file_id,
+                        'name': 'input',
+                        'content_type': 'application/octet-stream',
+                        'size': len(body),
+                        'etag': file_id,
+                        'checksums': {},
+                        'metadata': {},
+                        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                        'expires_at': None,
+                        'urls': {'get': f"{server.base_url}/v1/files/{file_id}/download"},
+                    })
+
+                if self.path.startswith('/v1/predictions/') and self.path.endswith('/cancel'):
+                    prediction_id = self.path.split('/')[3]
+                    with server._lock:
+                        prediction = server.predictions.get(prediction_id)
+                        if not prediction:
+                            return self._json(404, {'detail': 'Not found'})
+                        if prediction['status'] not in ('succeeded', 'failed'):
+                            prediction['status'] = 'canceled'
+                    return self._json(200, server.public(prediction))
+
+                self._json(404, {'detail': 'Not found'})
+
+            def do_GET(self):
+                server.requests.append(('GET', self.path))
+                if self.path.startswith('/v1/predictions/'):
+                    prediction_id = self.path.split('/')[3]
+                    with server._lock:
+                        prediction = server.predictions.get(prediction_id)
+                        if not prediction:
+                            return self._json(404, {'detail': 'Not found'})
+                        server._refresh(prediction)
+                    return self._json(200, server.public(prediction))
+
+                if self.path.startswith('/files/'):
+                    output = io.BytesIO()
+                    Image.new('RGB', (64, 64), (200, 80, 40)).save(output, format='PNG')
+                    body = output.getvalue()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/png')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                self._json(404, {'detail': 'Not found'})
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Replicate API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=2.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeReplicateServer(args.host, args.port, args.latency, args.fail_rate)
+    print(f"[FakeReplicate] Listening on {fake.base_url}")
+    fake._server.serve_forever()
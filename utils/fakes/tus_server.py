@@ -0,0 +1,193 @@
+"""
+Fake TUS server (stand-in for Supabase Storage's resumable upload endpoint)
+
+Implements the TUS 1.0.0 subset used by TusUploader:
+- OPTIONS /storage/v1/upload/resumable          Tus-Extension (creation, optionally concatenation)
+- POST    /storage/v1/upload/resumable          create (Upload-Length, Upload-Metadata, Upload-Concat)
+- HEAD    /storage/v1/upload/resumable/<id>     Upload-Offset
+- PATCH   /storage/v1/upload/resumable/<id>     append a chunk at Upload-Offset
+
+Finished uploads are stored by objectName in `objects`. With drop_rate > 0
+some PATCH requests keep only the first half of the chunk and close the
+connection without a response, like a dropped upload.
+
+Usage:
+    python -m utils.fakes.tus_server --port 8083 --concatenation --drop-rate 0.2
+    SUPABASE_URL=http://localhost:8083 (uploads above SUPABASE_RESUMABLE_THRESHOLD_MB)
+"""
+
+import time
+import uuid
+import base64
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PREFIX = '/storage/v1/upload/resumable'
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class FakeTusServer:
+    """Threaded in-process fake of a TUS upload endpoint"""
+
+    def __init__(self, host='127.0.0.1', port=0, concatenation=False, drop_rate=0.0, max_chunk=None):
+        self.concatenation = concatenation
+        self.drop_rate = drop_rate
+        self.max_chunk = max_chunk
+        self.uploads = {}
+        self.objects = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _parse_metadata(value):
+        metadata = {}
+        for item in filter(None, (value or '').split(',')):
+            key, _, encoded = item.strip().partition(' ')
+            metadata[key] = base64.b64decode(encoded).decode() if encoded else ''
+        return metadata
+
+    def _finish(self, upload):
+        """Store a completed (non-partial) upload under its object name"""
+        upload['completed_at'] = time.time()
+        name = upload['metadata'].get('objectName')
+        if name and not upload['partial']:
+            self.objects[name] = bytes(upload['data'])
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, headers=None, body=b''):
+                self.send_response(status)
+                self.send_header('Tus-Resumable', '1.0.0')
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _upload(self):
+                upload_id = self.path.rsplit('/', 1)[1]
+                return server.uploads.get(upload_id)
+
+            def do_OPTIONS(self):
+                extensions = 'creation,termination' + (',concatenation' if server.concatenation else '')
+                self._reply(204, {'Tus-Version': '1.0.0', 'Tus-Extension': extensions})
+
+            def do_POST(self):
+                with server._lock:
+                    server.requests.append(('POST', self.path))
+                if self.path != PREFIX:
+                    return self._reply(404)
+                if not self.headers.get('Authorization'):
+                    return self._reply(401)
+
+                concat = self.headers.get('Upload-Concat', '')
+                upload = {
+                    'id': uuid.uuid4().hex[:16],
+                    'metadata': server._parse_metadata(self.headers.get('Upload-Metadata')),
+                    'partial': concat == 'partial',
+                    'data': bytearray(),
+                    'length': None,
+                    'completed_at': None,
+                }
+                with server._lock:
+                    if concat.startswith('final;'):
+                        if not server.concatenation:
+                            return self._reply(400, body=b'concatenation not supported')
+                        for url in concat[len('final;'):].split():
+                            part = server.uploads.get(url.rstrip('/').rsplit('/', 1)[1])
+                            if not part or part['completed_at'] is None:
+                                return self._reply(400, body=b'partial upload not complete')
+                            upload['data'] += part['data']
+                        upload['length'] = len(upload['data'])
+                        server._finish(upload)
+                    else:
+                        upload['length'] = int(self.headers['Upload-Length'])
+                        if upload['length'] == 0:
+                            server._finish(upload)
+                    server.uploads[upload['id']] = upload
+                self._reply(201, {'Location': f"{server.base_url}{PREFIX}/{upload['id']}"})
+
+            def do_HEAD(self):
+                with server._lock:
+                    server.requests.append(('HEAD', self.path))
+                    upload = self._upload()
+                    if not upload:
+                        return self._reply(404)
+                    self._reply(200, {
+                        'Upload-Offset': str(len(upload['data'])),
+                        'Upload-Length': str(upload['length']),
+                        'Cache-Control': 'no-store',
+                    })
+
+            def do_PATCH(self):
+                with server._lock:
+                    server.requests.append(('PATCH', self.path))
+                length = int(self.headers.get('Content-Length') or 0)
+                offset = int(self.headers.get('Upload-Offset', -1))
+                body = self.rfile.read(length)
+                with server._lock:
+                    upload = self._upload()
+                    if not upload:
+                        return self._reply(404)
+                    if self.headers.get('Content-Type') != 'application/offset+octet-stream':
+                        return self._reply(415)
+                    if offset != len(upload['data']):
+                        return self._reply(409, body=b'offset mismatch')
+                    if server.max_chunk and length > server.max_chunk:
+                        return self._reply(413)
+
+                    if server.drop_rate and length > 1 and random.random() < server.drop_rate:
+                        # Dropped connection: part of the chunk arrived, no response
+                        upload['data'] += body[:length // 2]
+                        self.close_connection = True
+                        self.connection.shutdown(2)
+                        return
+
+                    upload['data'] += body
+                    if len(upload['data']) >= upload['length']:
+                        server._finish(upload)
+                    self._reply(204, {'Upload-Offset': str(len(upload['data']))})
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake TUS upload server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8083)
+    parser.add_argument('--concatenation', action='store_true')
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeTusServer(args.host, args.port, args.concatenation, args.drop_rate)
+    print(f"[FakeTus] Listening on {fake.base_url}{PREFIX}")
+    fake._server.serve_forever()
@@ -0,0 +1,183 @@
+"""
+Fake VModel.AI API server
+
+Implements the subset of the VModel task API used by VModelTaskManager:
+- POST /api/tasks/v1/create          create a task, returns {'code': 200, 'result': {'task_id', ...}}
+- GET  /api/tasks/v1/get/<id>        status; 404 for the first `index_delay` seconds
+                                     (like VModel before a task is indexed), succeeds after `latency`
+- POST /api/tasks/v1/cancel/<id>
+- GET  /files/<id>.mp4               task output
+
+Usage:
+    python -m utils.fakes.vmodel_server --port 8082 --latency 15
+    VMODEL_API_TOKEN=fake VMODEL_API_BASE_URL=http://localhost:8082 python app.py
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class FakeVModelServer:
+    """Threaded in-process fake of the VModel task API"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=5.0, index_delay=0.5, fail_rate=0.0):
+        self.latency = latency
+        self.index_delay = index_delay
+        self.fail_rate = fail_rate
+        self.tasks = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def status_checks(self):
+        """Number of GET status requests received (to compare polling strategies)"""
+        return sum(1 for method, path in self.requests if method == 'GET' and '/tasks/v1/get/' in path)
+
+    def _refresh(self, task):
+        """Advance a task's status based on elapsed time"""
+        if task['status'] in ('succeeded', 'failed', 'canceled'):
+            return task
+        elapsed = time.time() - task['_created']
+        if elapsed >= task['_latency']:
+            if task['_fail']:
+                task['status'] = 'failed'
+                task['error'] = 'Fake task failure'
+            else:
+                task['status'] = 'succeeded'
+                task['output'] = [f"{self.base_url}/files/{task['task_id']}.mp4"]
+            task['completed_at'] = int(time.time())
+        elif elapsed > 0.2:
+            task['status'] = 'processing'
+        return task
+
+    @staticmethod
+    def public(task):
+        return {k: v for k, v in task.items() if not k.startswith('_')}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def _authorized(self):
+                if self.headers.get('Authorization', '').startswith('Bearer '):
+                    return True
+                self._json(401, {'code': 401, 'message': 'Unauthorized'})
+                return False
+
+            def do_POST(self):
+                with server._lock:
+                    server.requests.append(('POST', self.path))
+                if not self._authorized():
+                    return
+
+                if self.path == '/api/tasks/v1/create':
+                    data = self._body()
+                    task = {
+                        'task_id': uuid.uuid4().hex[:16],
+                        'version': data.get('version'),
+                        'status': 'starting',
+                        'output': None,
+                        'error': None,
+                        'create_at': int(time.time()),
+                        'completed_at': None,
+                        '_created': time.time(),
+                        '_latency': server.latency,
+                        '_fail': random.random() < server.fail_rate,
+                    }
+                    with server._lock:
+                        server.tasks[task['task_id']] = task
+                    return self._json(200, {'code': 200, 'result': {'task_id': task['task_id'], 'task_cost': 10}})
+
+                if self.path.startswith('/api/tasks/v1/cancel/'):
+                    task_id = self.path.rsplit('/', 1)[1]
+                    with server._lock:
+                        task = server.tasks.get(task_id)
+                        if not task:
+                            return self._json(404, {'code': 404, 'message': 'Task not found'})
+                        if task['status'] not in ('succeeded', 'failed'):
+                            task['status'] = 'canceled'
+                    return self._json(200, {'code': 200, 'result': server.public(task)})
+
+                self._json(404, {'code': 404, 'message': 'Not found'})
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append(('GET', self.path))
+
+                if self.path.startswith('/api/tasks/v1/get/'):
+                    if not self._authorized():
+                        return
+                    task_id = self.path.rsplit('/', 1)[1]
+                    with server._lock:
+                        task = server.tasks.get(task_id)
+                        if not task or time.time() - task['_created'] < server.index_delay:
+                            return self._json(404, {'code': 404, 'message': 'Task not found'})
+                        server._refresh(task)
+                    return self._json(200, {'code': 200, 'result': server.public(task)})
+
+                if self.path.startswith('/files/'):
+                    body = b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 1024
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'video/mp4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                self._json(404, {'code': 404, 'message': 'Not found'})
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake VModel API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=5.0)
+    parser.add_argument('--index-delay', type=float, default=0.5)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeVModelServer(args.host, args.port, args.latency, args.index_delay, args.fail_rate)
+    print(f"[FakeVModel] Listening on {fake.base_url}")
+    fake._server.serve_forever()
@@ -0,0 +1,218 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urljoin
+from utils.http_client import get_http_client
+
+
+class SpaceBusyError(Exception):
+    """All slots for the Space stayed in use for the whole acquire timeout"""
+
+
+def _parse_limits(value):
+    """'tonyassi/video-face-swap=2,marko/faceswap=1' -> {'tonyassi/video-face-swap': 2, ...}"""
+    limits = {}
+    for item in value.split(','):
+        if '=' in item:
+            space, limit = item.rsplit('=', 1)
+            limits[space.strip()] = int(limit)
+    return limits
+
+
+class _SpaceEntry:
+    def __init__(self, space, limit):
+        self.space = space
+        self.client = None
+        self.created_at = None
+        self.slots = threading.BoundedSemaphore(limit)
+        self.limit = limit
+        self.in_use = 0
+        self.connect_lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.next_connect_at = 0.0
+        self.counters = {'leases': 0, 'connects': 0, 'connect_errors': 0, 'evictions': 0, 'busy': 0}
+
+
+class GradioClientPool:
+    """
+    Shared gradio_client.Client instances for HuggingFace Spaces, keyed by Space name
+
+    Building a Client fetches the Space config and API info (seconds per call),
+    so each Space gets one client, created lazily on first lease() and reused
+    by every request. A Client runs predictions from several threads, so the
+    client is shared and a per-Space semaphore caps concurrent calls.
+
+    Clients are dropped (and rebuilt on the next lease) after
+    max_failures consecutive failed calls, when older than max_age, or when the
+    background health check can no longer fetch the Space config.
+    A failed connect is not retried for connect_backoff seconds.
+    """
+
+    def __init__(self, token=None, default_limit=2, limits=None, acquire_timeout=30, max_failures=2,
+                 max_age=3600, connect_backoff=30, health_interval=300):
+        self.token = token or None
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self.acquire_timeout = acquire_timeout
+        self.max_failures = max_failures
+        self.max_age = max_age
+        self.connect_backoff = connect_backoff
+        self.health_interval = health_interval
+        self._spaces = {}
+        self._lock = threading.Lock()
+        self._checker = None
+        if health_interval:
+            self._checker = threading.Thread(target=self._check_forever, name='gradio-health', daemon=True)
+            self._checker.start()
+
+    def _entry(self, space):
+        with self._lock:
+            if space not in self._spaces:
+                self._spaces[space] = _SpaceEntry(space, self.limits.get(space, self.default_limit))
+            return self._spaces[space]
+
+    def _create_client(self, space):
+        from gradio_client import Client
+        return Client(space, token=self.token, verbose=False)
+
+    def _evict(self, entry, reason, holders=0):
+        client, entry.client = entry.client, None
+        if client is None:
+            return
+        entry.counters['evictions'] += 1
+        print(f"[GradioPool] Dropping client for {entry.space} ({reason})")
+        if entry.in_use > holders:
+            # Other requests may still be predicting with it; it is released once they finish
+            return
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def client(self, space):
+        """Connected Client for the Space, creating it if needed (does not take a slot)"""
+        entry = self._entry(space)
+        with entry.connect_lock:
+            if entry.client is not None and time.time() - entry.created_at > self.max_age and not entry.in_use:
+                self._evict(entry, 'max age')
+            if entry.client is None:
+                if time.time() < entry.next_connect_at:
+                    raise Exception(f"HuggingFace Space {space} unavailable: {entry.last_error}")
+                start_time = time.time()
+                try:
+                    entry.client = self._create_client(space)
+                except Exception as e:
+                    entry.counters['connect_errors'] += 1
+                    entry.last_error = str(e)[:300]
+                    entry.next_connect_at = time.time() + self.connect_backoff
+                    raise
+                entry.created_at = time.time()
+                entry.counters['connects'] += 1
+                entry.consecutive_failures = 0
+                print(f"[GradioPool] Connected to {space} in {time.time() - start_time:.1f}s")
+            return entry.client
+
+    @contextmanager
+    def lease(self, space):
+        """
+        Borrow the shared Client for a Space, holding one of its concurrency slots
+        Raises SpaceBusyError when no slot frees up within acquire_timeout
+        """
+        entry = self._entry(space)
+        if not entry.slots.acquire(timeout=self.acquire_timeout):
+            entry.counters['busy'] += 1
+            raise SpaceBusyError(f"HuggingFace Space {space} busy ({entry.limit} calls in flight)")
+        with self._lock:
+            entry.in_use += 1
+            entry.counters['leases'] += 1
+        try:
+            client = self.client(space)
+            try:
+                yield client
+            except Exception as e:
+                with entry.connect_lock:
+                    entry.consecutive_failures += 1
+                    entry.last_error = str(e)[:300]
+                    if entry.consecutive_failures >= self.max_failures and entry.client is client:
+                        self._evict(entry, f"{entry.consecutive_failures} consecutive failures", holders=1)
+                raise
+            entry.consecutive_failures = 0
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+            entry.slots.release()
+
+    def check(self, space):
+        """Fetch the Space config with the existing client's URL; drop the client if that fails"""
+        entry = self._entry(space)
+        client = entry.client
+        if client is None:
+            return False
+        try:
+            headers = {'Authorization': f"Bearer {self.token}"} if self.token else {}
+            response = get_http_client().get(urljoin(client.src, 'config'), headers=headers, timeout=(5, 15))
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            with entry.connect_lock:
+                entry.last_error = str(e)[:300]
+                if entry.client is client:
+                    self._evict(entry, f"health check failed: {e}")
+            return False
+
+    def warm_up(self, spaces):
+        """Connect to the given Spaces in the background so the first request skips the handshake"""
+        def connect(space):
+            try:
+                self.client(space)
+            except Exception as e:
+                print(f"[GradioPool] Warm-up of {space} failed: {e}")
+
+        for space in spaces:
+            threading.Thread(target=connect, args=(space,), name='gradio-warmup', daemon=True).start()
+
+    def _check_forever(self):
+        while True:
+            time.sleep(self.health_interval)
+            with self._lock:
+                spaces = [space for space, entry in self._spaces.items() if entry.client is not None]
+            for space in spaces:
+                self.check(space)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                space: dict(
+                    entry.counters,
+                    connected=entry.client is not None,
+                    client_age_seconds=round(now - entry.created_at, 1) if entry.client is not None else None,
+                    limit=entry.limit,
+                    in_use=entry.in_use,
+                    consecutive_failures=entry.consecutive_failures,
+                    last_error=entry.last_error,
+                )
+                for space, entry in self._spaces.items()
+            }
+
+
+_gradio_pool = None
+_gradio_pool_lock = threading.Lock()
+
+
+def get_gradio_pool():
+    """Process-wide GradioClientPool"""
+    global _gradio_pool
+    with _gradio_pool_lock:
+        if _gradio_pool is None:
+            _gradio_pool = GradioClientPool(
+                token=os.getenv('HUGGINGFACE_PRO_TOKEN', ''),
+                default_limit=int(os.getenv('GRADIO_SPACE_CONCURRENCY', '2')),
+                limits=_parse_limits(os.getenv('GRADIO_SPACE_LIMITS', '')),
+                acquire_timeout=float(os.getenv('GRADIO_ACQUIRE_TIMEOUT', '30')),
+                max_age=int(os.getenv('GRADIO_CLIENT_MAX_AGE', '3600')),
+                health_interval=int(os.getenv('GRADIO_HEALTH_INTERVAL', '300'))
+            )
+        return _gradio_pool
@@ -0,0 +1,286 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+_local = threading.local()
+
+
+class HedgeError(Exception):
+    """Every provider attempt failed; errors maps provider name -> exception"""
+
+    def __init__(self, errors):
+        super().__init__(' / '.join(f"{name}: {error}" for name, error in errors.items()))
+        self.errors = errors
+
+
+class CancelToken:
+    """
+    Cancellation handle for one provider attempt
+    Provider code registers callbacks (e.g. cancel a Replicate prediction)
+    that run when the attempt loses the race
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[Hedge] Cancel callback failed: {e}")
+
+
+def current_cancel_token():
+    """CancelToken of the hedged attempt running on this thread, or None"""
+    return getattr(_local, 'cancel_token', None)
+
+
+def mark_cached():
+    """
+    Provider code answered from a cache: the current hedged attempt is not recorded
+    as a latency sample (millisecond hits would drag the hedge delay down to min_delay)
+    """
+    _local.cached = True
+
+
+@contextmanager
+def cancel_scope(token):
+    """Make token the current_cancel_token() for provider code run inside the block"""
+    previous = current_cancel_token()
+    _local.cancel_token = token
+    try:
+        yield token
+    finally:
+        _local.cancel_token = previous
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram of successful calls"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += 1
+        self.total_seconds += seconds
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given percentile (None if empty)"""
+        if not self.total:
+            return None
+        target = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+        return LATENCY_BUCKETS[-1]
+
+    def to_dict(self):
+        buckets = {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS, self.counts)}
+        buckets['inf'] = self.counts[-1]
+        return {
+            'count': self.total,
+            'errors': self.errors,
+            'avg_seconds': round(self.total_seconds / self.total, 3) if self.total else 0.0,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': buckets,
+        }
+
+
+class HedgedExecutor:
+    """
+    Runs a primary provider call and hedges it with a secondary provider
+
+    The secondary is started when the primary fails, or when the primary is
+    still running after the hedge delay - the primary's observed latency
+    percentile for that feature (so only the slow tail is duplicated).
+    Features listed as immediate start both providers at once.
+    The first successful result wins and the other attempt is cancelled.
+    Attempts that can't be cancelled (blocking replicate.run) keep running to
+    the end, so callers pass hedge_slow=False for them: then the secondary is
+    a plain fallback that only starts on failure.
+    """
+
+    def __init__(self, max_workers=32, percentile=0.95, default_delay=8.0, min_delay=1.0,
+                 max_delay=60.0, min_samples=20, immediate_features=()):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.immediate_features = set(immediate_features)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._histograms = {}
+        self._counters = {'calls': 0, 'hedged': 0, 'primary_wins': 0, 'secondary_wins': 0, 'failures': 0,
+                          'cached': 0, 'fallback_only': 0}
+        self._lock = threading.Lock()
+
+    def _histogram(self, feature, provider):
+        key = f"{feature}:{provider}"
+        if key not in self._histograms:
+            self._histograms[key] = LatencyHistogram()
+        return self._histograms[key]
+
+    def _record(self, feature, provider, seconds, ok):
+        with self._lock:
+            histogram = self._histogram(feature, provider)
+            if ok:
+                histogram.record(seconds)
+            else:
+                histogram.errors += 1
+
+    def hedge_delay(self, feature, provider):
+        """Seconds to wait for the primary before starting the secondary"""
+        if feature in self.immediate_features:
+            return 0.0
+        with self._lock:
+            histogram = self._histogram(feature, provider)
+            if histogram.total < self.min_samples:
+                return self.default_delay
+            delay = histogram.percentile(self.percentile)
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def _attempt(self, feature, provider, func, token):
+        start_time = time.time()
+        _local.cached = False
+        try:
+            with cancel_scope(token):
+                result = func()
+        except Exception:
+            if not token.cancelled:
+                self._record(feature, provider, time.time() - start_time, False)
+            raise
+        if _local.cached:
+            with self._lock:
+                self._counters['cached'] += 1
+        else:
+            self._record(feature, provider, time.time() - start_time, True)
+        return result
+
+    def run(self, feature, primary, secondary, hedge_slow=True):
+        """
+        Run (name, callable) pairs and return the first successful result
+        hedge_slow=False: the primary can't be cancelled, so the secondary only starts
+        when the primary fails (a hedge would leave both running and billed)
+        Raises HedgeError when both fail
+        """
+        primary_name, primary_func = primary
+        secondary_name, secondary_func = secondary
+        with self._lock:
+            self._counters['calls'] += 1
+
+        attempts = {}
+
+        def start(name, func):
+            token = CancelToken()
+            future = self._executor.submit(self._attempt, feature, name, func, token)
+            attempts[future] = (name, token)
+            return future
+
+        pending = {start(primary_name, primary_func)}
+        if hedge_slow:
+            delay = self.hedge_delay(feature, primary_name)
+        else:
+            delay = None
+            with self._lock:
+                self._counters['fallback_only'] += 1
+        hedged = False
+        errors = {}
+
+        while pending:
+            timeout = None if hedged else delay
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name, _ = attempts[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[name] = e
+                    print(f"[Hedge] {feature}: {name} failed: {e}")
+                    continue
+
+                for other, (_, token) in attempts.items():
+                    if other is not future:
+                        token.cancel()
+                        other.cancel()
+                with self._lock:
+                    self._counters['primary_wins' if name == primary_name else 'secondary_wins'] += 1
+                if hedged:
+                    print(f"[Hedge] {feature}: {name} won")
+                return result
+
+            if not hedged:
+                # Primary failed, or is slower than the hedge delay
+                hedged = True
+                with self._lock:
+                    self._counters['hedged'] += 1
+                reason = 'failed' if primary_name in errors else f"slower than {delay:.1f}s"
+                print(f"[Hedge] {feature}: {primary_name} {reason}, starting {secondary_name}")
+                pending.add(start(secondary_name, secondary_func))
+
+        with self._lock:
+            self._counters['failures'] += 1
+        raise HedgeError(errors)
+
+    def stats(self):
+        with self._lock:
+            histograms = {key: histogram.to_dict() for key, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+        return dict(
+            counters,
+            percentile=self.percentile,
+            default_delay=self.default_delay,
+            immediate_features=sorted(self.immediate_features),
+            latency=histograms,
+        )
+
+
+_hedged_executor = None
+_hedged_executor_lock = threading.Lock()
+
+
+def get_hedged_executor():
+    """Process-wide HedgedExecutor (created lazily, after Gunicorn forks)"""
+    global _hedged_executor
+    with _hedged_executor_lock:
+        if _hedged_executor is None:
+            immediate = os.getenv('HEDGE_IMMEDIATE_FEATURES', '')
+            _hedged_executor = HedgedExecutor(
+                max_workers=int(os.getenv('HEDGE_WORKERS', '32')),
+                percentile=float(os.getenv('HEDGE_PERCENTILE', '0.95')),
+                default_delay=float(os.getenv('HEDGE_DEFAULT_DELAY', '8')),
+                min_delay=float(os.getenv('HEDGE_MIN_DELAY', '1')),
+                max_delay=float(os.getenv('HEDGE_MAX_DELAY', '60')),
+                min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', '20')),
+                immediate_features=[feature.strip() for feature in immediate.split(',') if feature.strip()]
+            )
+        return _hedged_executor
@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpClient:
+    """
+    Shared outbound HTTP client for provider calls (Replicate downloads, HF Inference, VModel)
+
+    - One requests.Session with keep-alive connection pools per host
+    - Explicit (connect, read) timeouts on every call
+    - Per-host concurrency limits (semaphores)
+    - Metrics: requests, errors, latency, waits and new connections (handshakes) per host
+    """
+
+    def __init__(self, pool_connections=32, pool_maxsize=32, connect_timeout=5.0, read_timeout=120.0,
+                 default_host_limit=32, host_limits=None, connect_retries=2):
+        self.timeout = (connect_timeout, read_timeout)
+        self.default_host_limit = default_host_limit
+        self.host_limits = host_limits or {}
+
+        # Only connection errors are retried: provider calls are not idempotent
+        retry = Retry(total=connect_retries, connect=connect_retries, read=0, status=0,
+                      backoff_factor=0.3, allowed_methods=None)
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self._semaphores = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                limit = self.host_limits.get(host, self.default_host_limit)
+                self._semaphores[host] = threading.BoundedSemaphore(limit)
+                self._metrics[host] = {
+                    'limit': limit,
+                    'requests': 0,
+                    'errors': 0,
+                    'in_flight': 0,
+                    'total_seconds': 0.0,
+                    'wait_seconds': 0.0,
+                }
+            return self._semaphores[host], self._metrics[host]
+
+    def request(self, method, url, **kwargs):
+        """Same contract as requests.request; a default timeout is always applied"""
+        host = urlsplit(url).netloc
+        semaphore, metrics = self._host_state(host)
+        kwargs.setdefault('timeout', self.timeout)
+
+        wait_start = time.time()
+        semaphore.acquire()
+        start_time = time.time()
+        with self._lock:
+            metrics['wait_seconds'] += start_time - wait_start
+            metrics['in_flight'] += 1
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                metrics['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                metrics['in_flight'] -= 1
+                metrics['requests'] += 1
+                metrics['total_seconds'] += time.time() - start_time
+            semaphore.release()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _pool_stats(self):
+        """Connection pool counters from urllib3 (num_connections == TCP/TLS handshakes)"""
+        pools = {}
+        pool_manager = self.adapter.poolmanager
+        for key in list(pool_manager.pools.keys()):
+            try:
+                pool = pool_manager.pools[key]
+            except KeyError:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            pools[host] = {
+                'scheme': pool.scheme,
+                'new_connections': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                'max_size': pool.pool.maxsize if pool.pool else 0,
+            }
+        return pools
+
+    def stats(self):
+        with self._lock:
+            hosts = {host: dict(metrics) for host, metrics in self._metrics.items()}
+        for metrics in hosts.values():
+            completed = metrics['requests']
+            metrics['avg_seconds'] = round(metrics['total_seconds'] / completed, 4) if completed else 0.0
+        return {
+            'timeout': {'connect': self.timeout[0], 'read': self.timeout[1]},
+            'hosts': hosts,
+            'pools': self._pool_stats(),
+        }
+
+
+def _parse_host_limits(value):
+    """Parse "host=limit,host=limit" into a dict"""
+    limits = {}
+    for item in value.split(','):
+        if '=' in item:
+            host, limit = item.split('=', 1)
+            limits[host.strip()] = int(limit)
+    return limits
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Process-wide HttpClient (created lazily, after Gunicorn forks)"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient(
+                pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '32')),
+                connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+                read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '120')),
+                default_host_limit=int(os.getenv('HTTP_HOST_LIMIT', '32')),
+                host_limits=_parse_host_limits(os.getenv('HTTP_HOST_LIMITS', ''))
+            )
+        return _http_client
@@ -1,8 +1,114 @@
 import io
+import os
 from PIL import Image
 import base64
 
+# Uploads whose header declares more pixels are rejected before any decoding
+MAX_IMAGE_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(64 * 1000 * 1000)))
+
+EXIF_ORIENTATION = 0x0112
+
+# EXIF orientation -> transpose that makes the image upright
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Modes Image.reduce() supports, and what the others are converted to first
+REDUCIBLE_MODES = ('L', 'LA', 'La', 'I', 'F', 'RGB', 'RGBA', 'RGBa', 'CMYK', 'YCbCr', 'LAB', 'HSV')
+REDUCE_CONVERSIONS = {'1': 'L', 'PA': 'RGBA', 'I;16': 'I', 'I;16B': 'I', 'I;16L': 'I'}
+
+
+class ImageTooLargeError(ValueError):
+    """Image dimensions exceed IMAGE_MAX_PIXELS (possible decompression bomb)"""
+
 class ImageProcessor:
+    @staticmethod
+    def _open(stream):
+        """Image.open (header only) with oversized images rejected"""
+        try:
+            image = Image.open(stream)
+        except Image.DecompressionBombError as e:
+            raise ImageTooLargeError(str(e))
+        ImageProcessor.check_pixels(image)
+        return image
+    
+    @staticmethod
+    def check_pixels(image):
+        """Raise ImageTooLargeError if the (not yet decoded) image declares too many pixels"""
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise ImageTooLargeError(
+                f"Image too large: {image.width}x{image.height} exceeds {MAX_IMAGE_PIXELS} pixels")
+    
+    @staticmethod
+    def open_upload(file):
+        """
+        Open an uploaded image (Flask FileStorage or file-like) and keep its
+        original encoded bytes so providers can receive them without re-encoding
+        Only the header is read; raises ImageTooLargeError for oversized images
+        """
+        stream = file.stream if hasattr(file, 'stream') else file
+        data = stream.read()
+        image = ImageProcessor._open(io.BytesIO(data))
+        image.source_bytes = data
+        image.source_size = image.size
+        return image
+    
+    @staticmethod
+    def source_bytes(image):
+        """Original upload bytes of an image opened with open_upload, if still unmodified"""
+        data = getattr(image, 'source_bytes', None)
+        if data is None or getattr(image, 'source_size', None) != image.size:
+            return None
+        return data
+    
+    @staticmethod
+    def load_image(source, max_size=None, exif_transpose=True):
+        """
+        Decode an image (bytes, path, file-like or FileStorage) straight at reduced size
+        
+        The longest side ends up at most max_size. JPEGs are decoded with DCT
+        scaling (draft mode) at the smallest 1/2, 1/4 or 1/8 scale still larger
+        than the target, other formats are shrunk with reduce() (box filter,
+        integer factor) first; LANCZOS only runs on what is left. A 12 MP JPEG
+        loaded for 1024 px is decoded at 1/2 scale instead of in full.
+        
+        Oversized headers raise ImageTooLargeError before anything is decoded.
+        With exif_transpose the result is rotated upright.
+        """
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        elif hasattr(source, 'stream'):
+            source = source.stream
+        image = ImageProcessor._open(source)
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1) if exif_transpose else 1
+        
+        if max_size and max(image.size) > max_size:
+            ratio = max_size / max(image.size)
+            target = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+            if image.format == 'JPEG':
+                image.draft(image.mode, target)
+            factor = min(image.width // target[0], image.height // target[1])
+            if factor >= 2:
+                if image.mode not in REDUCIBLE_MODES:
+                    # reduce() and LANCZOS only handle "continuous" modes; palette/1-bit images are expanded
+                    image = image.convert(REDUCE_CONVERSIONS.get(image.mode) or
+                                          ('RGBA' if 'transparency' in image.info else 'RGB'))
+                image = image.reduce(factor)
+            if image.size != target:
+                image = image.resize(target, Image.Resampling.LANCZOS)
+        else:
+            image.load()
+        
+        if orientation in ORIENTATION_TRANSPOSE:
+            image = image.transpose(ORIENTATION_TRANSPOSE[orientation])
+        return image
+    
     @staticmethod
     def resize_image(image, max_size=1024):
         """Resize image while maintaining aspect ratio"""
@@ -41,7 +147,7 @@ class ImageProcessor:
     def validate_image(file):
         """Validate uploaded image file"""
         try:
-            image = Image.open(file.stream)
+            image = ImageProcessor._open(file.stream)
             file.stream.seek(0)
             return True, image
         except Exception as e:
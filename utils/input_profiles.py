@@ -0,0 +1,187 @@
+import io
+import os
+import threading
+from PIL import Image, ImageOps
+from utils.image_processor import ImageProcessor, EXIF_ORIENTATION
+
+
+class InputProfile:
+    """
+    What a model wants to receive: longest side, color mode, EXIF handling and encoding
+
+    max_side: larger inputs are downscaled (LANCZOS) to fit; the model works at
+        about this resolution anyway, so the extra pixels only cost upload time
+    mode: color mode the model expects (alpha is flattened onto white for RGB)
+    exif_transpose: apply the EXIF orientation so the model sees the photo upright
+        (providers ignore the tag, phone photos are often stored sideways)
+    format / quality: encoding when the upload can't be sent as is; upscalers
+        get PNG so JPEG artifacts aren't magnified
+    """
+
+    def __init__(self, max_side=1024, mode='RGB', exif_transpose=True, format='JPEG', quality=92):
+        self.max_side = max_side
+        self.mode = mode
+        self.exif_transpose = exif_transpose
+        self.format = format
+        self.quality = quality
+
+    def to_dict(self):
+        return {'max_side': self.max_side, 'mode': self.mode, 'exif_transpose': self.exif_transpose,
+                'format': self.format, 'quality': self.quality}
+
+
+# Keyed by Replicate "owner/name" (version stripped) or "hf:<model id>"
+PROFILES = {
+    'stability-ai/sdxl': InputProfile(max_side=1024),
+    'lucataco/remove-bg': InputProfile(max_side=1536, quality=95),
+    'tencentarc/gfpgan': InputProfile(max_side=1536, format='PNG'),
+    'nightmareai/real-esrgan': InputProfile(max_side=2048, format='PNG'),
+    'hf:briaai/RMBG-1.4': InputProfile(max_side=1024, quality=95),
+    'hf:tencentarc/gfpgan': InputProfile(max_side=1024, format='PNG'),
+    'hf:caidas/swin2SR-classical-sr-x2-64': InputProfile(max_side=1024, format='PNG'),
+}
+
+DEFAULT_PROFILE = InputProfile(max_side=2048, format='PNG')
+
+
+def _parse_max_sides(value):
+    """'stability-ai/sdxl=768,hf:briaai/RMBG-1.4=1024' -> {'stability-ai/sdxl': 768, ...}"""
+    sides = {}
+    for item in value.split(','):
+        if '=' in item:
+            key, side = item.rsplit('=', 1)
+            sides[key.strip()] = int(side)
+    return sides
+
+
+class InputPreprocessor:
+    """
+    Applies the model's InputProfile to an image before it is sent to a provider
+
+    Uploads already within the profile (size, mode, upright, JPEG/PNG) are
+    sent byte for byte; everything else is transposed, downscaled, converted
+    and encoded once per image and profile, so a hedged Replicate + HF call
+    pair or a retry doesn't redo the work.
+    """
+
+    def __init__(self, profiles=None, default=None, enabled=True, max_sides=None):
+        self.profiles = dict(profiles or PROFILES)
+        self.default = default or DEFAULT_PROFILE
+        self.enabled = enabled
+        for key, side in (max_sides or {}).items():
+            base = self.profiles.get(key, self.default)
+            self.profiles[key] = InputProfile(side, base.mode, base.exif_transpose, base.format, base.quality)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def profile(self, model):
+        """Profile for a model id ("owner/name:version" or "hf:<model id>")"""
+        return self.profiles.get(model.split(':')[0] if not model.startswith('hf:') else model, self.default)
+
+    def prepare(self, image, model):
+        """Encoded bytes + mimetype to send to the model"""
+        key = model if model.startswith('hf:') else model.split(':')[0]
+        prepared = getattr(image, 'prepared_inputs', None)
+        if prepared is None:
+            prepared = image.prepared_inputs = {}
+        if key in prepared:
+            return prepared[key]
+
+        source = ImageProcessor.source_bytes(image)
+        if not self.enabled:
+            data, mimetype = self._passthrough(image, source) or self._encode(image, DEFAULT_PROFILE)
+            prepared[key] = (data, mimetype)
+            return data, mimetype
+
+        profile = self.profile(model)
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1) if profile.exif_transpose else 1
+        resize = max(image.size) > profile.max_side
+        convert = profile.mode is not None and image.mode != profile.mode
+
+        action = 'passthrough'
+        result = None
+        if not resize and not convert and orientation == 1:
+            result = self._passthrough(image, source)
+        if result is None:
+            action = 'resized' if resize else 'encoded'
+            if resize and source is not None:
+                # Decode the upload straight at the target size (JPEG draft mode / reduce())
+                image = ImageProcessor.load_image(source, profile.max_side, profile.exif_transpose)
+            else:
+                if orientation != 1:
+                    image = ImageOps.exif_transpose(image)
+                image = ImageProcessor.resize_image(image, profile.max_side)
+            result = self._encode(self._convert(image, profile.mode), profile)
+
+        prepared[key] = result
+        self._count(key, action, len(source) if source is not None else None, len(result[0]), orientation != 1)
+        return result
+
+    @staticmethod
+    def _passthrough(image, source):
+        if source is not None and image.format in ('JPEG', 'PNG'):
+            return source, Image.MIME[image.format]
+        return None
+
+    @staticmethod
+    def _convert(image, mode):
+        if mode is None or image.mode == mode:
+            return image
+        if mode == 'RGB' and (image.mode in ('RGBA', 'LA') or 'transparency' in image.info):
+            # Flatten alpha onto white rather than letting convert() turn it black
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert(mode)
+
+    @staticmethod
+    def _encode(image, profile):
+        output = io.BytesIO()
+        if profile.format == 'JPEG':
+            image.save(output, format='JPEG', quality=profile.quality, optimize=True)
+        else:
+            image.save(output, format=profile.format)
+        return output.getvalue(), Image.MIME[profile.format]
+
+    def _count(self, key, action, source_size, sent_size, transposed):
+        with self._lock:
+            counters = self._counters.setdefault(key, {
+                'passthrough': 0, 'resized': 0, 'encoded': 0, 'transposed': 0,
+                'source_bytes': 0, 'sent_bytes': 0,
+            })
+            counters[action] += 1
+            counters['transposed'] += int(transposed)
+            if source_size is not None:
+                # Only uploads with known original bytes, so the two totals compare
+                counters['source_bytes'] += source_size
+                counters['sent_bytes'] += sent_size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'models': {key: dict(counters, profile=self.profile(key).to_dict())
+                           for key, counters in self._counters.items()},
+            }
+
+
+_input_preprocessor = None
+_input_preprocessor_lock = threading.Lock()
+
+
+def get_input_preprocessor():
+    """Process-wide InputPreprocessor"""
+    global _input_preprocessor
+    with _input_preprocessor_lock:
+        if _input_preprocessor is None:
+            _input_preprocessor = InputPreprocessor(
+                enabled=os.getenv('INPUT_PREPROCESSING', 'true').lower() == 'true',
+                max_sides=_parse_max_sides(os.getenv('INPUT_MAX_SIDE_OVERRIDES', ''))
+            )
+        return _input_preprocessor
+
+
+def prepare_input(image, model):
+    """Bytes + mimetype of image prepared for model ("owner/name:version" or "hf:<model id>")"""
+    return get_input_preprocessor().prepare(image, model)
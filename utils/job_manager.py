@@ -0,0 +1,309 @@
+import os
+import io
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+TERMINAL_STATUSES = ('succeeded', 'failed')
+
+
+class JobQueueFullError(Exception):
+    """Raised when the worker pool already has max_pending jobs waiting"""
+
+
+class JobStore:
+    """
+    Base class for job state backends
+    Jobs are plain dicts: id, feature, status, created_at, started_at,
+    finished_at, error, result_mimetype, result_size
+    """
+
+    def create(self, job):
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def set_result(self, job_id, data, mimetype):
+        raise NotImplementedError
+
+    def get_result(self, job_id):
+        """Return (bytes, mimetype) or None"""
+        raise NotImplementedError
+
+    def purge(self, older_than):
+        """Delete finished jobs created before the given timestamp"""
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """Process-local job store (single Gunicorn worker or development)"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def set_result(self, job_id, data, mimetype):
+        with self._lock:
+            self._results[job_id] = (data, mimetype)
+            if job_id in self._jobs:
+                self._jobs[job_id].update(result_mimetype=mimetype, result_size=len(data))
+
+    def get_result(self, job_id):
+        with self._lock:
+            return self._results.get(job_id)
+
+    def purge(self, older_than):
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['status'] in TERMINAL_STATUSES and job['created_at'] < older_than
+            ]
+            for job_id in expired:
+                self._jobs.pop(job_id, None)
+                self._results.pop(job_id, None)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite job store - shared by all Gunicorn workers on the same host,
+    so a job submitted on one worker can be polled from another
+    """
+
+    COLUMNS = ('id', 'feature', 'status', 'created_at', 'started_at',
+               'finished_at', 'error', 'result_mimetype', 'result_size')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                feature TEXT,
+                status TEXT,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                error TEXT,
+                result_mimetype TEXT,
+                result_size INTEGER,
+                result BLOB
+            )
+            """
+        )
+        self._conn.commit()
+
+    def create(self, job):
+        values = [job.get(column) for column in self.COLUMNS]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                values
+            )
+            self._conn.commit()
+
+    def update(self, job_id, **fields):
+        if not fields:
+            return
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                list(fields.values()) + [job_id]
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def set_result(self, job_id, data, mimetype):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET result = ?, result_mimetype = ?, result_size = ? WHERE id = ?",
+                (sqlite3.Binary(data), mimetype, len(data), job_id)
+            )
+            self._conn.commit()
+
+    def get_result(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, result_mimetype FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return bytes(row[0]), row[1]
+
+    def purge(self, older_than):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND created_at < ?",
+                TERMINAL_STATUSES + (older_than,)
+            )
+            self._conn.commit()
+
+
+class JobManager:
+    """
+    Runs slow provider calls (Replicate, HF) on a bounded worker pool
+    so request handlers can return a job id immediately
+    """
+
+    def __init__(self, store=None, max_workers=4, max_pending=32, ttl=3600):
+        self.store = store or MemoryJobStore()
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, feature, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) and return the new job dict
+        func may return a ProviderResult, PIL Image, (bytes, mimetype) or a JSON-serializable dict
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError(f"Job queue full ({self.max_pending} pending)")
+            self._pending += 1
+
+        try:
+            self.store.purge(time.time() - self.ttl)
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'feature': feature,
+                'status': 'queued',
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None,
+                'result_mimetype': None,
+                'result_size': None,
+            }
+            self.store.create(job)
+            self._executor.submit(self._run, job['id'], func, args, kwargs)
+        except Exception:
+            # The slot is only released by _run, which never starts if anything above fails
+            self._finish_pending()
+            raise
+        return job
+
+    def _run(self, job_id, func, args, kwargs):
+        self.store.update(job_id, status='running', started_at=time.time())
+        try:
+            data, mimetype = self._serialize_result(func(*args, **kwargs))
+            self.store.set_result(job_id, data, mimetype)
+            self.store.update(job_id, status='succeeded', finished_at=time.time())
+            print(f"[Jobs] {job_id} succeeded ({len(data)} bytes)")
+        except Exception as e:
+            self.store.update(job_id, status='failed', error=str(e), finished_at=time.time())
+            print(f"[Jobs] {job_id} failed: {e}")
+        finally:
+            self._finish_pending()
+
+    def _finish_pending(self):
+        with self._changed:
+            self._pending -= 1
+            self._changed.notify_all()
+
+    @staticmethod
+    def _serialize_result(result):
+        """Convert a job return value to (bytes, mimetype)"""
+        if hasattr(result, 'read') and hasattr(result, 'mimetype'):
+            # ProviderResult: keep the provider's native encoding
+            return result.read(), result.mimetype
+        if hasattr(result, 'save'):
+            output = io.BytesIO()
+            result.save(output, format='PNG')
+            return output.getvalue(), 'image/png'
+        if isinstance(result, tuple):
+            return result
+        return json.dumps(result).encode(), 'application/json'
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def get_result(self, job_id):
+        return self.store.get_result(job_id)
+
+    def wait(self, job_id, timeout):
+        """
+        Long-poll until the job finishes or timeout expires
+        Re-reads the store periodically so jobs run by other workers are seen
+        """
+        deadline = time.time() + timeout
+        job = self.store.get(job_id)
+        while job and job['status'] not in TERMINAL_STATUSES:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            with self._changed:
+                self._changed.wait(min(remaining, 0.5))
+            job = self.store.get(job_id)
+        return job
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            'store': type(self.store).__name__,
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': pending,
+        }
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Process-wide JobManager, created lazily so Gunicorn --preload forks before threads start"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            backend = os.getenv('JOB_STORE', 'memory').lower()
+            if backend == 'sqlite':
+                db_path = os.getenv('JOB_DB_PATH', os.path.join(tempfile.gettempdir(), 'aiforce_jobs.db'))
+                store = SQLiteJobStore(db_path)
+            else:
+                store = MemoryJobStore()
+
+            _job_manager = JobManager(
+                store=store,
+                max_workers=int(os.getenv('JOB_WORKERS', '4')),
+                max_pending=int(os.getenv('JOB_MAX_PENDING', '32')),
+                ttl=int(os.getenv('JOB_TTL_SECONDS', '3600'))
+            )
+        return _job_manager
@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from flask import Request
+from utils.scratch import get_scratch_manager, scratch_file
+
+CHUNK_SIZE = 1024 * 1024
+
+# Uploads with a total request size above this are spooled to named files on disk
+SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD_BYTES', str(512 * 1024)))
+
+
+class MediaFile:
+    """
+    A media file on local disk, passed through the video pipeline instead of bytes
+
+    Providers open or upload it by path / file handle, so memory use stays
+    bounded by the copy chunk size whatever the file size.
+    owned=True means the pipeline created it and deletes it with cleanup().
+    """
+
+    def __init__(self, path, owned=False):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.owned = owned
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def read(self):
+        """Whole file as bytes - only for small files (e.g. face images)"""
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def cleanup(self):
+        if self.owned:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class StreamingRequest(Request):
+    """
+    Request class that spools large file uploads straight into named temp files
+
+    Werkzeug's default spools large uploads to an anonymous temp file, which
+    then has to be copied again to get a path providers can use. Here the
+    parser writes each upload chunk by chunk into a named file, and
+    ingest_media() hands that path to providers without another copy.
+    Files are deleted when the request is closed.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= SPOOL_THRESHOLD:
+            return BytesIO()
+        suffix = os.path.splitext(filename or '')[1][:10]
+        # Under the scratch root so spooled uploads count towards the disk quota
+        spooled = tempfile.NamedTemporaryFile('wb+', suffix=suffix, prefix='upload_', delete=False,
+                                              dir=get_scratch_manager().root)
+        self.__dict__.setdefault('_spooled_paths', []).append(spooled.name)
+        return spooled
+
+    def close(self):
+        super().close()
+        for path in self.__dict__.pop('_spooled_paths', []):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def copy_to_temp_file(source, suffix=''):
+    """
+    Chunked copy of a file-like object (or bytes) to a new file in the current
+    scratch session (see utils.scratch); returns the path
+    """
+    path = scratch_file(suffix)
+    with open(path, 'wb') as temp:
+        if isinstance(source, (bytes, bytearray)):
+            temp.write(source)
+        else:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            shutil.copyfileobj(source, temp, CHUNK_SIZE)
+    return path
+
+
+def pin_media(media):
+    """
+    MediaFile that lives in the current scratch session: the upload spool file is
+    deleted when the request closes, which abandoned workers may outlive
+    """
+    if media.owned:
+        return media
+    path = scratch_file(os.path.splitext(media.path)[1])
+    try:
+        os.link(media.path, path)
+    except OSError:
+        shutil.copyfile(media.path, path)
+    return MediaFile(path, owned=True)
+
+
+def spooled_path(file_data):
+    """Path of an upload that StreamingRequest already spooled to disk, or None"""
+    stream = getattr(file_data, 'stream', file_data)
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        if hasattr(stream, 'flush'):
+            stream.flush()
+        return name
+    return None
+
+
+def ingest_media(file_data, suffix=''):
+    """
+    Turn an upload (MediaFile, FileStorage, file-like or bytes) into a MediaFile
+
+    Uploads already spooled to disk are used in place; anything else is
+    copied to a temp file in chunks (owned, delete with cleanup()).
+    """
+    if isinstance(file_data, MediaFile):
+        return file_data
+
+    path = spooled_path(file_data)
+    if path:
+        return MediaFile(path)
+
+    stream = getattr(file_data, 'stream', file_data)
+    return MediaFile(copy_to_temp_file(stream, suffix), owned=True)
@@ -0,0 +1,126 @@
+import os
+import mimetypes
+import threading
+from flask import request, send_file, abort, current_app
+from werkzeug.security import safe_join
+from utils.template_catalog import get_template_catalog
+
+STATIC_ROOT = 'static'
+
+# Cache-Control for URLs whose content can never change (hash in the path or ?v=<hash>)
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+# Length of the sha256 prefix that listings publish as ?v=
+VERSION_LENGTH = 16
+
+
+class MediaServer:
+    """
+    Static media responses: strong ETags, Range / conditional GET, cache policy, proxy offload
+
+    - ETags are content hashes (the template catalog's sha256; the hash directory
+      of derived files), so they stay valid across restarts and workers, unlike
+      werkzeug's mtime-based default
+    - Range requests get 206 with Content-Range (video scrubbing), If-None-Match
+      and If-Range are honored
+    - Content-hashed URLs (static/templates/derived/<hash>/..., or ?v= equal
+      to the file's published 16-char hash prefix) are cached for a year as immutable; everything else is
+      cached for max_age seconds and then revalidated
+    - With offload='x-accel' (nginx) or 'x-sendfile' (Apache, lighttpd) the
+      response carries only headers and the proxy sends the bytes, so a sync
+      Gunicorn worker is free again at once instead of for the whole download
+    """
+
+    def __init__(self, root=STATIC_ROOT, offload=None, accel_prefix='/_media/', max_age=300):
+        self.root = root
+        self.offload = offload or None
+        self.accel_prefix = accel_prefix.rstrip('/') + '/'
+        self.max_age = max_age
+        self._counters = {'served': 0, 'offloaded': 0, 'not_modified': 0, 'partial': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _content_hash(self, path):
+        """Hash identifying the file's content, or None to fall back to werkzeug's ETag"""
+        relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+        parts = relative.split('/')
+        if parts[:2] == ['templates', 'derived'] and len(parts) > 3:
+            return f"{parts[2]}-{parts[-1]}"
+        entry = get_template_catalog().entry_for_path(path)
+        return entry['sha256'][:32] if entry else None
+
+    def send(self, directory, filename):
+        """Serve directory/filename (directory inside the static root); 404 if missing"""
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        content_hash = self._content_hash(path)
+        version = request.args.get('v')
+        immutable = content_hash is not None and (
+            '/derived/' in path.replace(os.sep, '/')
+            or (version is not None and len(version) == VERSION_LENGTH and content_hash[:VERSION_LENGTH] == version))
+        cache_control = IMMUTABLE_CACHE if immutable else f"public, max-age={self.max_age}, must-revalidate"
+
+        if self.offload:
+            response = self._offload(path, content_hash)
+        else:
+            response = send_file(path, conditional=True, etag=content_hash if content_hash else True)
+            if response.status_code == 206:
+                self._count('partial')
+
+        response.headers['Cache-Control'] = cache_control
+        if response.status_code == 304:
+            self._count('not_modified')
+        self._count('served')
+        return response
+
+    def _offload(self, path, content_hash):
+        """Headers-only response; the proxy serves the file (and handles Range itself)"""
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = current_app.response_class(mimetype=mimetype)
+        stat = os.stat(path)
+        response.set_etag(content_hash or f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        response.last_modified = stat.st_mtime
+        if request.if_none_match.contains(response.get_etag()[0]):
+            response.status_code = 304
+            return response
+
+        if self.offload == 'x-accel':
+            relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + relative
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        self._count('offloaded')
+        return response
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, offload=self.offload, accel_prefix=self.accel_prefix,
+                        max_age=self.max_age)
+
+
+_media_server = None
+_media_server_lock = threading.Lock()
+
+
+def get_media_server():
+    """Process-wide MediaServer (MEDIA_OFFLOAD=x-accel|x-sendfile when a proxy fronts the app)"""
+    global _media_server
+    with _media_server_lock:
+        if _media_server is None:
+            offload = os.getenv('MEDIA_OFFLOAD', '').strip().lower()
+            _media_server = MediaServer(
+                offload=offload if offload in ('x-accel', 'x-sendfile') else None,
+                accel_prefix=os.getenv('MEDIA_ACCEL_PREFIX', '/_media/'),
+                max_age=int(os.getenv('MEDIA_MAX_AGE', '300'))
+            )
+        return _media_server
+
+
+def send_media(directory, filename):
+    """Serve a file under the static root through the process-wide MediaServer"""
+    return get_media_server().send(directory, filename)
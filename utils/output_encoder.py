@@ -0,0 +1,176 @@
+import io
+import os
+from flask import request
+from PIL import Image, features
+
+# format name -> (PIL format, mimetype)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'avif': ('AVIF', 'image/avif'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+ALIASES = {'jpg': 'jpeg', 'image/webp': 'webp', 'image/avif': 'avif', 'image/jpeg': 'jpeg', 'image/png': 'png'}
+
+# Encoder quality per tier; 'lossless' keeps every pixel (PNG / lossless WebP)
+QUALITY_TIERS = {
+    'low': {'webp': 60, 'avif': 45, 'jpeg': 65},
+    'medium': {'webp': 75, 'avif': 55, 'jpeg': 80},
+    'high': {'webp': 88, 'avif': 70, 'jpeg': 92},
+    'lossless': {},
+}
+
+# Photo-like outputs default to WebP; cut-outs keep PNG so clients get the alpha channel everywhere
+FEATURE_DEFAULTS = {
+    'hd-upscale': ('webp', 'high'),
+    'restore': ('webp', 'high'),
+    'cartoonify': ('webp', 'high'),
+    'face-swap': ('webp', 'high'),
+    'template-face-swap': ('webp', 'high'),
+    'style-transfer': ('webp', 'high'),
+    'ai-hugs': ('webp', 'high'),
+    'future-baby': ('webp', 'high'),
+    'template-styles': ('webp', 'high'),
+    'muscle-enhance': ('webp', 'high'),
+    'text-to-image': ('webp', 'high'),
+    'remove-bg': ('png', 'lossless'),
+}
+
+DEFAULT_FORMAT = os.getenv('OUTPUT_DEFAULT_FORMAT', 'webp')
+DEFAULT_QUALITY = os.getenv('OUTPUT_DEFAULT_QUALITY', 'high')
+
+LOSSY_MIMETYPES = ('image/jpeg', 'image/webp', 'image/avif')
+
+
+def supported_formats():
+    """Formats this Pillow build can encode"""
+    return [name for name in FORMATS if name not in ('webp', 'avif') or features.check(name)]
+
+
+class OutputSpec:
+    """
+    Target encoding for a result: format name plus a quality tier or an explicit 1-100 quality
+
+    Built per request by negotiate() and carried into background jobs / uploads,
+    which have no request context.
+    """
+
+    def __init__(self, format='png', quality='lossless', format_requested=False, quality_requested=False,
+                 accepted=None):
+        self.format = format
+        self.quality = quality
+        self.format_requested = format_requested  # form field, not a default or the Accept header
+        self.quality_requested = quality_requested
+        self.accepted = accepted  # mimetypes the client accepts (None = anything)
+
+    @property
+    def mimetype(self):
+        return FORMATS[self.format][1]
+
+    def quality_value(self):
+        if isinstance(self.quality, int):
+            return self.quality
+        return QUALITY_TIERS.get(self.quality, QUALITY_TIERS['high']).get(self.format)
+
+    def passes_through(self, mimetype):
+        """
+        True if a provider output already encoded as mimetype can be sent as is:
+        it is the target format, or it is already lossy (re-encoding would only
+        add artifacts) and the client accepts it and asked for nothing specific
+        """
+        if self.quality_requested:
+            return False
+        if mimetype == self.mimetype:
+            return True
+        return (not self.format_requested and mimetype in LOSSY_MIMETYPES
+                and (self.accepted is None or mimetype in self.accepted))
+
+    def to_dict(self):
+        return {'format': self.format, 'quality': self.quality, 'mimetype': self.mimetype}
+
+
+def _parse_quality(value):
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value.isdigit():
+        return max(1, min(int(value), 100))
+    return value if value in QUALITY_TIERS else None
+
+
+def negotiate(feature=None):
+    """
+    Pick the output encoding for the current request
+
+    1. `format` / `quality` form field (or query arg), e.g. format=avif&quality=medium
+    2. Accept header: the client's preferred supported image type, ties going
+       to the feature default (a bare */* gets the feature default)
+    3. FEATURE_DEFAULTS, then OUTPUT_DEFAULT_FORMAT / OUTPUT_DEFAULT_QUALITY
+    """
+    default_format, default_quality = FEATURE_DEFAULTS.get(feature, (DEFAULT_FORMAT, DEFAULT_QUALITY))
+    supported = supported_formats()
+    if default_format not in supported:
+        default_format = 'webp' if 'webp' in supported else 'png'
+
+    requested = request.values.get('format', '').strip().lower()
+    requested = ALIASES.get(requested, requested)
+    quality = _parse_quality(request.values.get('quality'))
+    accept = request.accept_mimetypes
+    accepted = {mimetype for _, mimetype in FORMATS.values() if accept[mimetype]} if accept else None
+
+    if requested in supported:
+        return OutputSpec(requested, quality or default_quality, True, quality is not None, accepted)
+
+    # Accept header; the default is listed first so it wins ties and */*
+    candidates = [default_format] + [name for name in supported if name != default_format]
+    best = accept.best_match([FORMATS[name][1] for name in candidates])
+    chosen = ALIASES.get(best, default_format) if best else default_format
+    tier = quality or ('lossless' if chosen == 'png' else default_quality)
+    return OutputSpec(chosen, tier, False, quality is not None, accepted)
+
+
+def encode(image, spec):
+    """Encode a PIL image with the spec; returns (bytes, mimetype)"""
+    pil_format = FORMATS[spec.format][0]
+    quality = spec.quality_value()
+    output = io.BytesIO()
+
+    if spec.format == 'jpeg':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG has no alpha: flatten onto white
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(output, format=pil_format, quality=quality or 92, progressive=True, optimize=True)
+    elif spec.format == 'webp':
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+        if quality is None:
+            image.save(output, format=pil_format, lossless=True, method=4)
+        else:
+            image.save(output, format=pil_format, quality=quality, method=4)
+    elif spec.format == 'avif':
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+        image.save(output, format=pil_format, quality=quality if quality is not None else 90, speed=8)
+    else:
+        image.save(output, format=pil_format)
+
+    return output.getvalue(), spec.mimetype
+
+
+def encode_result(result, spec):
+    """
+    Encode a PIL Image or ProviderResult; returns (bytes, mimetype)
+    ProviderResults are passed through untouched when spec.passes_through() allows
+    """
+    if hasattr(result, 'to_image'):
+        data = result.read()
+        if spec.passes_through(result.mimetype):
+            return data, result.mimetype
+        result = result.to_image()
+    return encode(result, spec)
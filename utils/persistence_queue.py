@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.job_manager import get_job_manager
+from utils.supabase_storage import get_supabase_storage
+
+
+class PersistenceQueueFull(Exception):
+    """Raised when max_pending uploads are already waiting; callers upload synchronously instead"""
+
+
+class PersistenceQueue:
+    """
+    Write-behind uploads of results to Supabase Storage
+
+    enqueue() assigns the storage path and public URL up front and returns
+    at once; the upload runs on a bounded worker pool with retries.
+    Progress is kept in the job store (id = storage path, feature
+    'persist:<feature>'), so with JOB_STORE=sqlite any worker can report it.
+    """
+
+    def __init__(self, storage, store, max_workers=4, max_pending=64, max_retries=3, retry_backoff=2.0,
+                 ttl=3600):
+        self.storage = storage
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='persist')
+        self._pending = 0
+        self._counters = {'queued': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'overflows': 0}
+        self._lock = threading.Lock()
+
+    def enqueue(self, data, content_type, user_id=None, feature_type='general'):
+        """
+        Queue an upload of encoded bytes and return {'path', 'filename', 'url'} immediately
+        Raises PersistenceQueueFull when the queue is at max_pending
+        """
+        if not self.storage.client:
+            raise Exception('Supabase not configured')
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters['overflows'] += 1
+                raise PersistenceQueueFull(f"Persistence queue full ({self.max_pending} pending)")
+            self._pending += 1
+            self._counters['queued'] += 1
+
+        try:
+            self.store.purge(time.time() - self.ttl)
+
+            filepath, filename = self.storage.new_path(content_type, user_id, feature_type)
+            url = self.storage.get_image_url(filepath)
+            self.store.create({
+                'id': filepath,
+                'feature': f"persist:{feature_type}",
+                'status': 'queued',
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None,
+                'result_mimetype': content_type,
+                'result_size': len(data),
+            })
+            self._executor.submit(self._upload, filepath, data, content_type)
+        except Exception:
+            # The slot is only released by _upload, which never starts if anything above fails
+            self._finish_pending()
+            raise
+        return {'path': filepath, 'filename': filename, 'url': url}
+
+    def _upload(self, filepath, data, content_type):
+        self.store.update(filepath, status='running', started_at=time.time())
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    # upsert: an earlier attempt may have stored the object before failing
+                    self.storage.upload_file(data, filepath, content_type, upsert=attempt > 0)
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        raise
+                    with self._lock:
+                        self._counters['retries'] += 1
+                    print(f"[Persist] {filepath} upload failed ({e}), retrying")
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+            self.store.update(filepath, status='succeeded', finished_at=time.time())
+            with self._lock:
+                self._counters['succeeded'] += 1
+        except Exception as e:
+            self.store.update(filepath, status='failed', error=str(e), finished_at=time.time())
+            with self._lock:
+                self._counters['failed'] += 1
+            print(f"[Persist] {filepath} failed: {e}")
+        finally:
+            self._finish_pending()
+
+    def _finish_pending(self):
+        with self._lock:
+            self._pending -= 1
+
+    def status(self, filepath):
+        """Persistence record for a storage path, or None if unknown (or expired)"""
+        return self.store.get(filepath)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._pending, max_pending=self.max_pending,
+                        max_workers=self.max_workers, store=type(self.store).__name__)
+
+
+_persistence_queue = None
+_persistence_queue_lock = threading.Lock()
+
+
+def get_persistence_queue():
+    """Process-wide PersistenceQueue (shares the job store so status is visible from every worker)"""
+    global _persistence_queue
+    with _persistence_queue_lock:
+        if _persistence_queue is None:
+            _persistence_queue = PersistenceQueue(
+                storage=get_supabase_storage(),
+                store=get_job_manager().store,
+                max_workers=int(os.getenv('PERSIST_WORKERS', '4')),
+                max_pending=int(os.getenv('PERSIST_MAX_PENDING', '64')),
+                max_retries=int(os.getenv('PERSIST_MAX_RETRIES', '3')),
+                ttl=int(os.getenv('JOB_TTL_SECONDS', '3600'))
+            )
+        return _persistence_queue
@@ -0,0 +1,267 @@
+import os
+import hmac
+import time
+import base64
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future, InvalidStateError
+import replicate
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'canceled')
+
+
+def _resolve(future, result=None, error=None):
+    """Complete a future unless the caller already cancelled it (cancel() can race from another thread)"""
+    try:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class PredictionEngine:
+    """
+    Tracks many in-flight Replicate predictions from a single asyncio loop
+
+    Instead of replicate.run (one blocked thread per prediction), submit()
+    creates the prediction and returns a concurrent.futures.Future. The
+    future is completed either by the webhook route (handle_webhook) or by
+    one shared poller that re-checks predictions with exponential backoff.
+
+    Modes:
+    - poll: shared poller only
+    - webhook: predictions are created with a webhook URL; the poller still
+      runs as a slow safety net for lost webhooks (or webhooks delivered to
+      another Gunicorn worker)
+    """
+
+    def __init__(self, api_token=None, base_url=None, mode='poll', webhook_url=None,
+                 poll_initial=1.0, poll_max=10.0, webhook_safety_poll=30.0,
+                 max_concurrent_polls=32, timeout=600):
+        self.mode = mode
+        self.webhook_url = webhook_url
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.webhook_safety_poll = webhook_safety_poll
+        self.max_concurrent_polls = max_concurrent_polls
+        self.timeout = timeout
+
+        client_kwargs = {'api_token': api_token}
+        if base_url:
+            client_kwargs['base_url'] = base_url
+        self.client = replicate.Client(**client_kwargs)
+
+        # prediction id -> {'future', 'model', 'created_at', 'next_poll_at', 'polls'}
+        self._inflight = {}
+        self._stats = {'created': 0, 'succeeded': 0, 'failed': 0, 'canceled': 0, 'webhooks': 0, 'polls': 0}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='prediction-engine', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._poll_forever(), self._loop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, model, input):
+        """
+        Create a prediction for "owner/name:version" and return a Future
+        resolving to the raw prediction output (URL string or list of URLs)
+        Cancelling the Future cancels the prediction on Replicate
+        """
+        future = Future()
+        asyncio.run_coroutine_threadsafe(self._create(model, input, future), self._loop)
+        return future
+
+    def run(self, model, input, timeout=None):
+        """Blocking convenience wrapper with the same contract as replicate.run"""
+        return self.submit(model, input).result(timeout=timeout or self.timeout)
+
+    async def _create(self, model, input, future):
+        try:
+            version = model.split(':', 1)[1] if ':' in model else None
+            params = {}
+            if self.mode == 'webhook' and self.webhook_url:
+                params['webhook'] = self.webhook_url
+                params['webhook_events_filter'] = ['completed']
+
+            if version:
+                prediction = await self.client.predictions.async_create(version=version, input=input, **params)
+            else:
+                prediction = await self.client.predictions.async_create(model=model, input=input, **params)
+        except Exception as e:
+            _resolve(future, error=e)
+            return
+
+        self._stats['created'] += 1
+        now = time.time()
+        first_poll = self.webhook_safety_poll if self.mode == 'webhook' and self.webhook_url else self.poll_initial
+        self._inflight[prediction.id] = {
+            'future': future,
+            'model': model,
+            'created_at': now,
+            'next_poll_at': now + first_poll,
+            'polls': 0,
+        }
+        print(f"[Predictions] Created {prediction.id} for {model} ({len(self._inflight)} in flight)")
+
+        # Fast models may already be done (or failed) at creation time
+        self._complete(prediction.id, prediction.status, prediction.output, prediction.error)
+
+    def _complete(self, prediction_id, status, output, error):
+        """Resolve the future for a finished prediction (runs on the loop thread)"""
+        if status not in TERMINAL_STATUSES:
+            return
+        entry = self._inflight.pop(prediction_id, None)
+        if not entry or entry['future'].done():
+            return
+
+        elapsed = time.time() - entry['created_at']
+        if status == 'succeeded':
+            self._stats['succeeded'] += 1
+            print(f"[Predictions] {prediction_id} succeeded in {elapsed:.1f}s")
+            _resolve(entry['future'], result=output)
+        else:
+            self._stats['failed'] += 1
+            print(f"[Predictions] {prediction_id} {status}: {error}")
+            _resolve(entry['future'], error=Exception(f"Prediction {prediction_id} {status}: {error}"))
+
+    def _next_delay(self, polls):
+        if self.mode == 'webhook' and self.webhook_url:
+            return self.webhook_safety_poll
+        return min(self.poll_initial * (1.5 ** polls), self.poll_max)
+
+    async def _poll_forever(self):
+        semaphore = asyncio.Semaphore(self.max_concurrent_polls)
+
+        async def poll_one(prediction_id, entry):
+            async with semaphore:
+                try:
+                    prediction = await self.client.predictions.async_get(prediction_id)
+                except Exception as e:
+                    print(f"[Predictions] Poll {prediction_id} failed: {e}")
+                    return
+                self._stats['polls'] += 1
+                entry['polls'] += 1
+                entry['next_poll_at'] = time.time() + self._next_delay(entry['polls'])
+                self._complete(prediction_id, prediction.status, prediction.output, prediction.error)
+
+        while True:
+            # The only poller of this process: one bad iteration must not strand every prediction
+            try:
+                await self._poll_due(poll_one)
+            except Exception as e:
+                print(f"[Predictions] Poll loop error: {e}")
+            await asyncio.sleep(0.2)
+
+    async def _poll_due(self, poll_one):
+        now = time.time()
+        due = []
+        for prediction_id, entry in list(self._inflight.items()):
+            if entry['future'].cancelled():
+                # Caller gave up (e.g. a hedged call won on another provider)
+                self._inflight.pop(prediction_id, None)
+                self._stats['canceled'] += 1
+                print(f"[Predictions] Canceling {prediction_id}")
+                asyncio.ensure_future(self._cancel(prediction_id))
+            elif now - entry['created_at'] > self.timeout:
+                self._inflight.pop(prediction_id, None)
+                _resolve(entry['future'],
+                         error=TimeoutError(f"Prediction {prediction_id} timed out after {self.timeout}s"))
+                asyncio.ensure_future(self._cancel(prediction_id))
+            elif entry['next_poll_at'] <= now:
+                # Push next_poll_at forward so a slow GET isn't issued twice
+                entry['next_poll_at'] = now + self.poll_max
+                due.append(poll_one(prediction_id, entry))
+
+        if due:
+            await asyncio.gather(*due)
+
+    async def _cancel(self, prediction_id):
+        try:
+            await self.client.predictions.async_cancel(prediction_id)
+        except Exception as e:
+            print(f"[Predictions] Cancel {prediction_id} failed: {e}")
+
+    def handle_webhook(self, payload):
+        """
+        Complete a prediction from a Replicate webhook payload
+        Thread-safe; returns True if the prediction belongs to this process
+        """
+        prediction_id = payload.get('id')
+        if not prediction_id:
+            return False
+
+        done = Future()
+
+        def complete():
+            self._stats['webhooks'] += 1
+            known = prediction_id in self._inflight
+            self._complete(prediction_id, payload.get('status'), payload.get('output'), payload.get('error'))
+            done.set_result(known)
+
+        self._loop.call_soon_threadsafe(complete)
+        return done.result(timeout=5)
+
+    def stats(self):
+        return dict(self._stats, in_flight=len(self._inflight), mode=self.mode)
+
+
+def verify_webhook_signature(secret, headers, body):
+    """
+    Verify a Replicate webhook signature
+    Replicate signs "{webhook-id}.{webhook-timestamp}.{body}" with HMAC-SHA256
+    using the base64 part of the "whsec_..." signing secret.
+    """
+    webhook_id = headers.get('webhook-id')
+    timestamp = headers.get('webhook-timestamp')
+    signatures = headers.get('webhook-signature', '')
+    if not webhook_id or not timestamp or not signatures:
+        return False
+
+    key = base64.b64decode(secret.split('_', 1)[1] if secret.startswith('whsec_') else secret)
+    signed_content = f"{webhook_id}.{timestamp}.".encode() + body
+    expected = base64.b64encode(hmac.new(key, signed_content, hashlib.sha256).digest()).decode()
+
+    for signature in signatures.split():
+        _, _, value = signature.partition(',')
+        if hmac.compare_digest(value, expected):
+            return True
+    return False
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_prediction_engine():
+    """
+    Process-wide PredictionEngine, or None when REPLICATE_PREDICTION_MODE=run
+    (the default, which keeps using blocking replicate.run)
+    """
+    global _engine
+    mode = os.getenv('REPLICATE_PREDICTION_MODE', 'run').lower()
+    if mode not in ('poll', 'webhook'):
+        return None
+
+    with _engine_lock:
+        if _engine is None:
+            webhook_url = os.getenv('REPLICATE_WEBHOOK_URL') or None
+            if mode == 'webhook' and webhook_url and not os.getenv('REPLICATE_WEBHOOK_SECRET'):
+                # Unsigned webhooks would let anyone complete a prediction with an arbitrary output URL
+                print("[Predictions] REPLICATE_WEBHOOK_SECRET not set, webhooks disabled (polling only)")
+                webhook_url = None
+            _engine = PredictionEngine(
+                api_token=os.getenv('REPLICATE_API_TOKEN'),
+                base_url=os.getenv('REPLICATE_API_BASE_URL') or None,
+                mode=mode,
+                webhook_url=webhook_url,
+                timeout=int(os.getenv('REPLICATE_PREDICTION_TIMEOUT', '600'))
+            )
+        return _engine
@@ -0,0 +1,219 @@
+import os
+import time
+import threading
+from collections import deque
+from utils.hedged_executor import current_cancel_token
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """The provider's circuit is open; it is skipped until the cooldown expires"""
+
+
+class ProviderHealth:
+    """Rolling outcomes and circuit state for one provider/model"""
+
+    def __init__(self, key, window, max_samples=200):
+        self.key = key
+        self.window = window
+        self.samples = deque(maxlen=max_samples)  # (timestamp, ok, seconds)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.last_error = None
+        self.last_error_at = None
+
+    def _recent(self, now):
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        return self.samples
+
+    def error_rate(self, now):
+        samples = self._recent(now)
+        if not samples:
+            return 0.0
+        return sum(1 for _, ok, _ in samples if not ok) / len(samples)
+
+    def avg_latency(self, now):
+        """Average latency of recent successful calls (None if there are none)"""
+        latencies = [seconds for _, ok, seconds in self._recent(now) if ok]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def to_dict(self, now):
+        samples = self._recent(now)
+        latencies = sorted(seconds for _, ok, seconds in samples if ok)
+        avg_latency = self.avg_latency(now)
+        return {
+            'state': self.state,
+            'calls': len(samples),
+            'error_rate': round(self.error_rate(now), 3),
+            'avg_seconds': round(avg_latency, 2) if avg_latency is not None else None,
+            'p95_seconds': round(latencies[int(0.95 * (len(latencies) - 1))], 2) if latencies else None,
+            'consecutive_failures': self.consecutive_failures,
+            'opened_at': self.opened_at,
+            'last_error': self.last_error,
+            'last_error_at': self.last_error_at,
+        }
+
+
+class HealthRegistry:
+    """
+    Per-provider health scoring and circuit breakers
+
+    - closed: calls go through; the circuit opens after failure_threshold
+      consecutive failures, or when the rolling error rate reaches
+      max_error_rate over at least min_calls calls
+    - open: calls fail fast with CircuitOpenError for cooldown seconds
+    - half_open: one probe call is let through; success closes the circuit,
+      failure re-opens it
+    """
+
+    def __init__(self, window=300, failure_threshold=3, max_error_rate=0.5, min_calls=10, cooldown=60):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        if key not in self._providers:
+            self._providers[key] = ProviderHealth(key, self.window)
+        return self._providers[key]
+
+    def _acquire(self, key):
+        """True if a call may go to the provider now (claims the half-open probe)"""
+        with self._lock:
+            health = self._get(key)
+            if health.state == OPEN:
+                if time.time() - health.opened_at < self.cooldown:
+                    return False
+                health.state = HALF_OPEN
+                health.probe_in_flight = False
+                print(f"[Health] {key} half-open, probing")
+            if health.state == HALF_OPEN:
+                if health.probe_in_flight:
+                    return False
+                health.probe_in_flight = True
+            return True
+
+    def is_available(self, key):
+        """True unless the circuit is open and still cooling down"""
+        with self._lock:
+            health = self._get(key)
+            if health.state == OPEN:
+                return time.time() - health.opened_at >= self.cooldown
+            return not (health.state == HALF_OPEN and health.probe_in_flight)
+
+    def record(self, key, ok, seconds, error=None):
+        now = time.time()
+        with self._lock:
+            health = self._get(key)
+            health.samples.append((now, ok, seconds))
+            health.probe_in_flight = False
+            if ok:
+                health.consecutive_failures = 0
+                if health.state != CLOSED:
+                    print(f"[Health] {key} recovered, circuit closed")
+                health.state = CLOSED
+                return
+
+            health.consecutive_failures += 1
+            health.last_error = str(error)[:300] if error else None
+            health.last_error_at = now
+            recent = health._recent(now)
+            tripped = (
+                health.state == HALF_OPEN
+                or health.consecutive_failures >= self.failure_threshold
+                or (len(recent) >= self.min_calls and health.error_rate(now) >= self.max_error_rate)
+            )
+            if tripped and health.state != OPEN:
+                health.state = OPEN
+                health.opened_at = now
+                print(f"[Health] {key} circuit opened ({health.consecutive_failures} consecutive failures, "
+                      f"error rate {health.error_rate(now):.0%})")
+
+    def call(self, key, func, enforce=True):
+        """
+        Run func() and record the outcome under key
+        With enforce=True an open circuit raises CircuitOpenError without calling func
+        """
+        if not self._acquire(key) and enforce:
+            raise CircuitOpenError(f"{key} circuit open, skipping")
+
+        start_time = time.time()
+        try:
+            result = func()
+        except Exception as e:
+            cancel_token = current_cancel_token()
+            if cancel_token and cancel_token.cancelled:
+                # Lost a race/hedge - not the provider's fault
+                with self._lock:
+                    self._get(key).probe_in_flight = False
+            else:
+                self.record(key, False, time.time() - start_time, e)
+            raise
+        self.record(key, True, time.time() - start_time)
+        return result
+
+    def order(self, items, key=lambda item: item):
+        """
+        Sort a fallback chain by health: available providers first, then lower
+        recent error rate (in 10% steps), then lower average latency.
+        Providers without data keep their configured order after measured ones.
+        """
+        now = time.time()
+
+        def sort_key(item):
+            provider_key = key(item)
+            with self._lock:
+                health = self._get(provider_key)
+                error_rate = health.error_rate(now)
+                latency = health.avg_latency(now)
+            return (
+                not self.is_available(provider_key),
+                round(error_rate, 1),
+                latency if latency is not None else float('inf'),
+            )
+
+        return sorted(items, key=sort_key)
+
+    def snapshot(self, keys=None):
+        now = time.time()
+        with self._lock:
+            selected = keys if keys is not None else list(self._providers)
+            return {key: self._get(key).to_dict(now) for key in selected}
+
+    def stats(self):
+        return {
+            'window_seconds': self.window,
+            'failure_threshold': self.failure_threshold,
+            'max_error_rate': self.max_error_rate,
+            'min_calls': self.min_calls,
+            'cooldown_seconds': self.cooldown,
+            'providers': self.snapshot(),
+        }
+
+
+_health_registry = None
+_health_registry_lock = threading.Lock()
+
+
+def get_health_registry():
+    """Process-wide HealthRegistry"""
+    global _health_registry
+    with _health_registry_lock:
+        if _health_registry is None:
+            _health_registry = HealthRegistry(
+                window=int(os.getenv('HEALTH_WINDOW_SECONDS', '300')),
+                failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3')),
+                max_error_rate=float(os.getenv('CIRCUIT_MAX_ERROR_RATE', '0.5')),
+                min_calls=int(os.getenv('CIRCUIT_MIN_CALLS', '10')),
+                cooldown=int(os.getenv('CIRCUIT_COOLDOWN_SECONDS', '60'))
+            )
+        return _health_registry
@@ -0,0 +1,146 @@
+import base64
+from io import BytesIO
+from PIL import Image
+from utils.http_client import get_http_client
+
+CHUNK_SIZE = 64 * 1024
+
+
+def sniff_mimetype(data):
+    """Detect image mimetype from the file header"""
+    try:
+        image_format = Image.open(BytesIO(data)).format
+        return Image.MIME.get(image_format, 'application/octet-stream')
+    except Exception:
+        return 'application/octet-stream'
+
+
+class ProviderResult:
+    """
+    A provider output in its native encoding (bytes in memory or a remote URL)
+
+    Lets responses and storage uploads pass the provider's bytes through
+    untouched; PIL is only involved when to_image() is called.
+    """
+
+    def __init__(self, data=None, url=None, mimetype=None):
+        self.data = data
+        self.url = url
+        self.mimetype = mimetype
+        self.content_length = len(data) if data is not None else None
+        self._response = None
+        self._on_complete = []
+
+    def on_complete(self, callback):
+        """
+        callback(data, mimetype) once the whole body has been received, whether it was
+        read() or streamed to a response with iter_chunks(); used to fill caches without
+        buffering the download before the first byte is sent
+        """
+        if self.data is not None:
+            callback(self.data, self.mimetype)
+        else:
+            self._on_complete.append(callback)
+        return self
+
+    def _completed(self):
+        callbacks, self._on_complete = self._on_complete, []
+        for callback in callbacks:
+            try:
+                callback(self.data, self.mimetype)
+            except Exception as e:
+                print(f"[ProviderResult] Completion callback failed: {e}")
+
+    @classmethod
+    def from_output(cls, output):
+        """Build from a normalized Replicate output (FileOutput, URL, data URI or bytes)"""
+        if hasattr(output, 'url'):
+            url = output.url() if callable(output.url) else output.url
+            if url:
+                return cls.from_output(url)
+
+        if isinstance(output, str):
+            if output.startswith('data:'):
+                header, _, payload = output.partition(',')
+                mimetype = header[5:].split(';')[0] or None
+                return cls(data=base64.b64decode(payload), mimetype=mimetype)
+            return cls(url=output)
+
+        if hasattr(output, 'read'):
+            data = output.read()
+            return cls(data=data, mimetype=sniff_mimetype(data))
+
+        if isinstance(output, (bytes, bytearray)):
+            return cls(data=bytes(output), mimetype=sniff_mimetype(output))
+
+        raise Exception(f"Cannot handle output type: {type(output)}")
+
+    @classmethod
+    def from_response(cls, response):
+        """Wrap a successful HF Inference (requests) response"""
+        mimetype = response.headers.get('Content-Type', '').split(';')[0]
+        if not mimetype.startswith('image/'):
+            mimetype = sniff_mimetype(response.content)
+        return cls(data=response.content, mimetype=mimetype)
+
+    def open(self):
+        """
+        Start the download (headers only) so mimetype and content_length are known
+        before deciding whether to pass the body through
+        """
+        if self.data is not None or self._response is not None:
+            return self
+        response = get_http_client().get(self.url, stream=True)
+        response.raise_for_status()
+        self._response = response
+        mimetype = response.headers.get('Content-Type', '').split(';')[0]
+        if mimetype.startswith('image/'):
+            self.mimetype = mimetype
+        if response.headers.get('Content-Length'):
+            self.content_length = int(response.headers['Content-Length'])
+        return self
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """Yield the body in chunks without buffering it whole"""
+        if self.data is not None:
+            for offset in range(0, len(self.data), chunk_size):
+                yield self.data[offset:offset + chunk_size]
+            return
+
+        self.open()
+        # Only buffered when someone waits for the full body (cache fill)
+        chunks = [] if self._on_complete else None
+        try:
+            for chunk in self._response.iter_content(chunk_size):
+                if chunks is not None:
+                    chunks.append(chunk)
+                yield chunk
+        finally:
+            self.close()
+        if chunks is not None:
+            self.data = b''.join(chunks)
+            self.content_length = len(self.data)
+            self._completed()
+
+    def read(self):
+        """Return the full body as bytes (downloads once, then kept in memory)"""
+        if self.data is None:
+            self.open()
+            try:
+                self.data = self._response.content
+            finally:
+                self.close()
+            self.content_length = len(self.data)
+            if not self.mimetype or not self.mimetype.startswith('image/'):
+                self.mimetype = sniff_mimetype(self.data)
+            self._completed()
+        return self.data
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+    def to_image(self):
+        """Decode to a PIL Image (only when a transform is actually needed)"""
+        return Image.open(BytesIO(self.read()))
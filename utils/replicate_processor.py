@@ -1,9 +1,58 @@
 import os
+import time
+import hashlib
+import threading
 import replicate
-import requests
 from io import BytesIO
-from PIL import Image
+from collections import OrderedDict
 import base64
+from utils.input_profiles import prepare_input
+from utils.provider_result import ProviderResult
+from utils.prediction_engine import get_prediction_engine
+from utils.hedged_executor import get_hedged_executor, current_cancel_token, mark_cached, HedgeError
+from utils.provider_health import get_health_registry
+from utils.result_cache import get_result_cache, make_cache_key, image_cache_bytes
+
+# Result cache policy per operation:
+# - always: output depends only on input + params (cached by default)
+# - seeded: SDXL, cached only when a seed is given and RESULT_CACHE_SEEDED=true
+CACHE_POLICY = {
+    'upscale_image': 'always',
+    'restore_photo': 'always',
+    'remove_background': 'always',
+    'cartoonify': 'seeded',
+    'style_transfer': 'seeded',
+    'generate_image_from_text': 'seeded',
+}
+
+class ProviderFallbackError(Exception):
+    """Replicate failed and the Hugging Face fallback failed too"""
+    
+    def __init__(self, replicate_error, hf_error):
+        super().__init__(f"Both Replicate and HF failed: {replicate_error} / {hf_error}")
+        self.replicate_error = replicate_error
+        self.hf_error = hf_error
+    
+    def to_dict(self):
+        return {
+            'error': 'Both Replicate and HF failed',
+            'replicate_error': str(self.replicate_error),
+            'hf_error': self.hf_error
+        }
+
+def run_hedged(feature, replicate_call, hf_call):
+    """
+    Replicate primary, Hugging Face hedge/fallback
+    HF starts when Replicate fails or runs past its hedge delay; the first success wins.
+    Hedging on latency needs the prediction engine (REPLICATE_PREDICTION_MODE=poll/webhook),
+    which can cancel the losing prediction; with blocking replicate.run HF is a plain fallback.
+    Raises ProviderFallbackError when both fail.
+    """
+    try:
+        return get_hedged_executor().run(feature, ('replicate', replicate_call), ('huggingface', hf_call),
+                                         hedge_slow=get_prediction_engine() is not None)
+    except HedgeError as e:
+        raise ProviderFallbackError(e.errors.get('replicate'), str(e.errors.get('huggingface')))
 
 class ReplicateProcessor:
     """
@@ -14,35 +63,130 @@ class ReplicateProcessor:
         self.replicate_token = os.getenv('REPLICATE_API_TOKEN')
         self.hf_token = os.getenv('HUGGINGFACE_API_TOKEN')
         
-    def _image_to_data_uri(self, image):
+        # Inputs larger than this are uploaded via the Files API instead of inlined as data URIs
+        self.data_uri_max_bytes = int(os.getenv('REPLICATE_DATA_URI_MAX_BYTES', str(256 * 1024)))
+        self.upload_ttl = int(os.getenv('REPLICATE_UPLOAD_TTL_SECONDS', '3600'))
+        
+        # sha256(input bytes) -> (file url, expires_at), reused across retries and fallbacks
+        self._upload_handles = OrderedDict()
+        self._upload_lock = threading.Lock()
+        
+    def _run_model(self, model, input):
+        """
+        Run a Replicate model and return its raw output
+        Uses the shared PredictionEngine when REPLICATE_PREDICTION_MODE is poll/webhook,
+        otherwise the blocking replicate.run
+        """
+        engine = get_prediction_engine()
+        if engine:
+            future = engine.submit(model, input)
+            # Inside a hedged call: cancel the prediction if the other provider wins
+            cancel_token = current_cancel_token()
+            if cancel_token:
+                cancel_token.add_callback(future.cancel)
+            return future.result(timeout=engine.timeout)
+        return replicate.run(model, input=input)
+    
+    def _encode_input(self, image, model):
+        """
+        Encoded bytes + mimetype to send for an image
+        Applies the model's input profile (downscale, orientation, color mode);
+        uploads already within it are sent as-is
+        """
+        return prepare_input(image, model)
+    
+    def _image_to_data_uri(self, image, model):
         """Convert PIL Image to data URI for Replicate"""
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
+        data, mimetype = self._encode_input(image, model)
+        img_str = base64.b64encode(data).decode()
+        return f"data:{mimetype};base64,{img_str}"
+    
+    def _image_input(self, image, model):
+        """
+        Replicate input value for an image
+        Small images are inlined as data URIs, larger ones uploaded once via the Files API
+        """
+        data, mimetype = self._encode_input(image, model)
+        if len(data) <= self.data_uri_max_bytes:
+            return f"data:{mimetype};base64,{base64.b64encode(data).decode()}"
+        
+        try:
+            return self._upload_input(data, mimetype)
+        except Exception as e:
+            print(f"[Replicate] File upload failed ({e}), falling back to data URI")
+            return f"data:{mimetype};base64,{base64.b64encode(data).decode()}"
+    
+    def _upload_input(self, data, mimetype):
+        """Upload input bytes to Replicate (or reuse a previous upload) and return the file URL"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._upload_lock:
+            handle = self._upload_handles.get(digest)
+            if handle and handle[1] > time.time():
+                self._upload_handles.move_to_end(digest)
+                return handle[0]
+        
+        engine = get_prediction_engine()
+        client = engine.client if engine else replicate.default_client
+        extension = 'jpg' if mimetype == 'image/jpeg' else mimetype.split('/')[-1]
+        
+        start_time = time.time()
+        uploaded = client.files.create(BytesIO(data), filename=f"input.{extension}", content_type=mimetype)
+        url = uploaded.urls['get']
+        print(f"[Replicate] Uploaded {len(data)} bytes as {uploaded.id} in {time.time() - start_time:.2f}s")
+        
+        with self._upload_lock:
+            self._upload_handles[digest] = (url, time.time() + self.upload_ttl)
+            while len(self._upload_handles) > 256:
+                self._upload_handles.popitem(last=False)
+        return url
     
     def _download_image(self, url_or_file):
         """Download image from URL/FileOutput and return PIL Image"""
-        # Handle FileOutput objects (has read() method)
-        if hasattr(url_or_file, 'read'):
-            return Image.open(BytesIO(url_or_file.read()))
-        
-        # Handle FileOutput with url() method
-        if hasattr(url_or_file, 'url'):
-            url = url_or_file.url() if callable(url_or_file.url) else url_or_file.url
-            response = requests.get(url)
-            return Image.open(BytesIO(response.content))
-        
-        # Handle string URLs
-        if isinstance(url_or_file, str):
-            response = requests.get(url_or_file)
-            return Image.open(BytesIO(response.content))
-        
-        # Try to use it as bytes directly
-        try:
-            return Image.open(BytesIO(url_or_file))
-        except:
-            raise Exception(f"Cannot handle output type: {type(url_or_file)}")
+        return ProviderResult.from_output(url_or_file).to_image()
+    
+    def _is_cacheable(self, operation, input):
+        policy = CACHE_POLICY.get(operation)
+        if policy == 'always':
+            return True
+        if policy == 'seeded':
+            return input.get('seed') is not None and os.getenv('RESULT_CACHE_SEEDED', 'false').lower() == 'true'
+        return False
+    
+    def _predict(self, operation, model, input, image=None, image_field='image', passthrough=False):
+        """
+        Run a model through the result cache
+        
+        Args:
+            operation: ReplicateProcessor method name (cache policy + key)
+            model: Full "owner/name:version" model id
+            input: Model input without the image
+            image: Optional PIL Image, sent as input[image_field]
+            passthrough: Return a ProviderResult (native bytes/URL) instead of a PIL Image
+        """
+        cache = get_result_cache() if self._is_cacheable(operation, input) else None
+        if cache:
+            key = make_cache_key(model, operation, image_cache_bytes(image) if image is not None else None, input)
+            cached = cache.get(key, operation)
+            if cached:
+                print(f"[Replicate] Cache hit for {operation}")
+                mark_cached()
+                result = ProviderResult(data=cached[0], mimetype=cached[1])
+                return result if passthrough else result.to_image()
+        
+        def run():
+            model_input = input
+            if image is not None:
+                model_input = dict(input, **{image_field: self._image_input(image, model)})
+            return self._run_model(model, model_input)
+        
+        # Fails fast with CircuitOpenError while this model's circuit is open
+        output = get_health_registry().call(f"replicate:{model.split(':')[0]}", run)
+        result = ProviderResult.from_output(self._normalize_replicate_output(output))
+        
+        if cache:
+            # Filled once the body has gone through (streamed to the client or read), not up front
+            result.on_complete(lambda data, mimetype: cache.put(key, data, mimetype, operation))
+        return result if passthrough else result.to_image()
     
     def _normalize_replicate_output(self, output):
         """
@@ -78,31 +222,32 @@ class ReplicateProcessor:
         except (StopIteration, TypeError):
             raise Exception("Replicate returned invalid output format")
     
-    def upscale_image(self, image, scale=4):
+    def upscale_image(self, image, scale=4, passthrough=False):
         """Upscale image using Real-ESRGAN. Raises exception on failure."""
         if not self.replicate_token:
             raise Exception("No Replicate token available")
         
-        input_uri = self._image_to_data_uri(image)
-        output = replicate.run(
+        return self._predict(
+            'upscale_image',
             "nightmareai/real-esrgan:f121d640bd286e1fdc67f9799164c1d5be36ff74576ee11c803ae5b665dd46aa",
-            input={"image": input_uri, "scale": scale, "face_enhance": False}
+            {"scale": scale, "face_enhance": False},
+            image=image,
+            passthrough=passthrough
         )
-        result_url = self._normalize_replicate_output(output)
-        return self._download_image(result_url)
     
-    def restore_photo(self, image, version="v1.3", scale=2):
+    def restore_photo(self, image, version="v1.3", scale=2, passthrough=False):
         """Restore old/damaged photos using GFPGAN. Raises exception on failure."""
         if not self.replicate_token:
             raise Exception("No Replicate token available")
         
-        input_uri = self._image_to_data_uri(image)
-        output = replicate.run(
+        return self._predict(
+            'restore_photo',
             "tencentarc/gfpgan:9283608cc6b7be6b65a8e44983db012355fde4132009bf99d976b2f0896856a3",
-            input={"img": input_uri, "version": version, "scale": scale}
+            {"version": version, "scale": scale},
+            image=image,
+            image_field="img",
+            passthrough=passthrough
         )
-        result_url = self._normalize_replicate_output(output)
-        return self._download_image(result_url)
     
     def swap_face(self, source_face_image, target_image):
         """Swap faces - currently disabled, use HuggingFace fallback. Raises exception."""
@@ -110,39 +255,38 @@ class ReplicateProcessor:
         # Raise exception to trigger HuggingFace fallback
         raise Exception("Replicate face swap unavailable, using HuggingFace fallback")
     
-    def cartoonify(self, image, style="general"):
+    def cartoonify(self, image, style="general", seed=None, passthrough=False):
         """Transform photo to cartoon/anime style. Raises exception on failure."""
         if not self.replicate_token:
             raise Exception("Replicate token required for cartoonify")
         
-        input_uri = self._image_to_data_uri(image)
-        
         # Use SDXL with cartoon prompt
         if style in ["anime", "japanese"]:
             prompt = "anime style illustration, japanese animation, vibrant colors, manga art"
         else:
             prompt = "cartoon illustration, pixar style, 3D animation, colorful, fun"
         
-        output = replicate.run(
+        params = {
+            "prompt": prompt,
+            "strength": 0.8,
+            "num_inference_steps": 30
+        }
+        if seed is not None:
+            params["seed"] = int(seed)
+        
+        return self._predict(
+            'cartoonify',
             "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
-            input={
-                "image": input_uri,
-                "prompt": prompt,
-                "strength": 0.8,
-                "num_inference_steps": 30
-            }
+            params,
+            image=image,
+            passthrough=passthrough
         )
-        
-        result_url = self._normalize_replicate_output(output)
-        return self._download_image(result_url)
     
-    def style_transfer(self, content_image, style="oil_painting"):
+    def style_transfer(self, content_image, style="oil_painting", seed=None, passthrough=False):
         """Apply artistic style transfer. Raises exception on failure."""
         if not self.replicate_token:
             raise Exception("Replicate token required for style transfer")
         
-        input_uri = self._image_to_data_uri(content_image)
-        
         style_prompts = {
             "oil_painting": "oil painting, thick brush strokes, impressionist style",
             "watercolor": "watercolor painting, soft colors, flowing",
@@ -153,47 +297,55 @@ class ReplicateProcessor:
         
         prompt = style_prompts.get(style, style_prompts["oil_painting"])
         
-        output = replicate.run(
+        params = {"prompt": prompt, "strength": 0.7, "num_inference_steps": 30}
+        if seed is not None:
+            params["seed"] = int(seed)
+        
+        return self._predict(
+            'style_transfer',
             "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
-            input={"image": input_uri, "prompt": prompt, "strength": 0.7, "num_inference_steps": 30}
+            params,
+            image=content_image,
+            passthrough=passthrough
         )
-        
-        result_url = self._normalize_replicate_output(output)
-        return self._download_image(result_url)
     
-    def remove_background(self, image):
+    def remove_background(self, image, passthrough=False):
         """Remove background from image. Raises exception on failure."""
         if not self.replicate_token:
             raise Exception("No Replicate token available")
         
-        input_uri = self._image_to_data_uri(image)
-        output = replicate.run(
+        return self._predict(
+            'remove_background',
             "lucataco/remove-bg:95fcc2a26d3899cd6c2691c900465aaeff466285a65c14638cc5f36f34befaf1",
-            input={"image": input_uri}
+            {},
+            image=image,
+            passthrough=passthrough
         )
-        result_url = self._normalize_replicate_output(output)
-        return self._download_image(result_url)
     
     def generate_depth_map(self, image):
         """Generate depth map - currently unavailable. Raises exception."""
         # Depth map models currently unavailable on Replicate
         raise Exception("Depth map feature temporarily unavailable")
     
-    def generate_image_from_text(self, prompt, negative_prompt="", width=512, height=512):
+    def generate_image_from_text(self, prompt, negative_prompt="", width=512, height=512, seed=None, passthrough=False):
         """Generate image from text prompt. Raises exception on failure."""
         if not self.replicate_token:
             raise Exception("No Replicate token available")
         
-        output = replicate.run(
+        params = {
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "width": width,
+            "height": height,
+            "num_inference_steps": 30,
+            "guidance_scale": 7.5
+        }
+        if seed is not None:
+            params["seed"] = int(seed)
+        
+        return self._predict(
+            'generate_image_from_text',
             "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
-            input={
-                "prompt": prompt,
-                "negative_prompt": negative_prompt,
-                "width": width,
-                "height": height,
-                "num_inference_steps": 30,
-                "guidance_scale": 7.5
-            }
+            params,
+            passthrough=passthrough
         )
-        result_url = self._normalize_replicate_output(output)
-        return self._download_image(result_url)
@@ -1,6 +1,85 @@
 import io
-from flask import send_file, jsonify
-from utils.supabase_storage import SupabaseStorage
+from flask import send_file, jsonify, request, Response, current_app
+from utils.supabase_storage import get_supabase_storage
+from utils.job_manager import get_job_manager, JobQueueFullError
+from utils.provider_result import ProviderResult
+from utils.output_encoder import negotiate, encode, encode_result
+from utils.template_catalog import get_template_catalog
+
+def send_result(result, feature=None):
+    """
+    Send a processing result (PIL Image or ProviderResult) in the negotiated output format
+    
+    The format comes from the `format`/`quality` fields, the Accept header or
+    the feature's default (see utils.output_encoder.negotiate). ProviderResults
+    that can pass through are streamed in the provider's encoding without decoding.
+    """
+    spec = negotiate(feature)
+    if isinstance(result, ProviderResult):
+        result.open()
+        mimetype = result.mimetype or 'application/octet-stream'
+        if spec.passes_through(mimetype):
+            response = Response(result.iter_chunks(), mimetype=mimetype, direct_passthrough=True)
+            if result.content_length is not None:
+                response.content_length = result.content_length
+            response.vary.add('Accept')
+            return response
+        result = result.to_image()
+    
+    data, mimetype = encode(result, spec)
+    response = send_file(io.BytesIO(data), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+def send_catalog_listing(kind, build, base_url=''):
+    """
+    JSON listing from the template catalog with an ETag
+    
+    build() runs once per catalog version and base URL; the serialized body is
+    reused until a template changes. If-None-Match hits get a bodyless 304.
+    """
+    body, etag = get_template_catalog().cached_listing(kind, base_url, lambda: current_app.json.dumps(build()))
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Clients may keep the listing but must revalidate (cheap 304) before using it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def wants_async():
+    """True if the client asked for a job id instead of waiting for the result"""
+    return request.form.get('async', 'false').lower() == 'true'
+
+def submit_async_job(feature, func, *args, **kwargs):
+    """
+    Queue func(*args, **kwargs) on the job pool and return a 202 response
+    
+    PIL images in args are loaded first because the upload streams
+    are closed once the request ends.
+    """
+    for arg in list(args) + list(kwargs.values()):
+        if hasattr(arg, 'load') and hasattr(arg, 'mode'):
+            arg.load()
+    
+    # Negotiate now: the worker thread has no request context
+    spec = negotiate(feature)
+    
+    def run_and_encode(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if hasattr(result, 'save') or isinstance(result, ProviderResult):
+            return encode_result(result, spec)
+        return result
+    
+    try:
+        job = get_job_manager().submit(feature, run_and_encode, *args, **kwargs)
+    except JobQueueFullError as e:
+        return jsonify({'error': 'Server busy', 'details': str(e)}), 503
+    
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': f"/api/jobs/{job['id']}"
+    }), 202
 
 def process_and_respond(result_image, feature_type='general', save_to_storage=False, user_id=None):
     """
@@ -16,17 +95,13 @@ def process_and_respond(result_image, feature_type='general', save_to_storage=Fa
         Flask response (image bytes or JSON with URL)
     """
     
-    # If save_to_storage is requested, upload to Supabase
+    # If save_to_storage is requested, upload to Supabase (same encoding as the response)
     if save_to_storage:
-        storage = SupabaseStorage()
-        upload_result = storage.upload_image(result_image, user_id, feature_type)
+        storage = get_supabase_storage()
+        upload_result = storage.upload_image(result_image, user_id, feature_type, output=negotiate(feature_type))
         
         if upload_result['success']:
             # Return JSON with image URL
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            
             return jsonify({
                 'success': True,
                 'message': 'Image processed and saved',
@@ -34,15 +109,6 @@ def process_and_respond(result_image, feature_type='general', save_to_storage=Fa
                 'filename': upload_result['filename'],
                 'path': upload_result['path']
             })
-        else:
-            # Storage failed, still return image bytes
-            output = io.BytesIO()
-            result_image.save(output, format='PNG')
-            output.seek(0)
-            return send_file(output, mimetype='image/png')
-    
-    # Default: return image bytes
-    output = io.BytesIO()
-    result_image.save(output, format='PNG')
-    output.seek(0)
-    return send_file(output, mimetype='image/png')
+    
+    # Default (or storage failed): return image bytes
+    return send_result(result_image, feature_type)
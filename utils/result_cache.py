@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from utils.image_processor import ImageProcessor
+
+
+def make_cache_key(model, operation, input_bytes, params):
+    """
+    Content-addressed key for a provider call
+    (model version, operation, normalized input bytes, parameters)
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode())
+    digest.update(b'\0')
+    digest.update(operation.encode())
+    digest.update(b'\0')
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    digest.update(b'\0')
+    if input_bytes:
+        digest.update(input_bytes)
+    return digest.hexdigest()
+
+
+def image_cache_bytes(image):
+    """
+    Cache key bytes for a PIL image
+    Unmodified uploads are keyed by their encoded bytes, which avoids decoding
+    the image and copying its pixels; in-memory images fall back to the pixels.
+    """
+    data = ImageProcessor.source_bytes(image)
+    if data is not None:
+        return b"source:" + data
+    return f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode() + image.tobytes()
+
+
+class MemoryTier:
+    """LRU cache bounded by total bytes"""
+
+    def __init__(self, max_bytes, max_item_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes or max_bytes // 4
+        self.current_bytes = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, data, mimetype):
+        if len(data) > self.max_item_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old:
+                self.current_bytes -= len(old[0])
+            self._items[key] = (data, mimetype)
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes and self._items:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
+
+
+class DiskTier:
+    """
+    On-disk cache with TTL and size-bounded eviction (least recently used first)
+    Each entry is <key>.bin plus a <key>.json metadata sidecar
+    """
+
+    def __init__(self, directory, max_bytes, ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.current_bytes = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        """Yield (key, mtime, size) for every stored entry"""
+        for prefix in os.listdir(self.directory):
+            folder = os.path.join(self.directory, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for filename in os.listdir(folder):
+                if filename.endswith('.bin'):
+                    try:
+                        stat = os.stat(os.path.join(folder, filename))
+                    except FileNotFoundError:
+                        continue
+                    yield filename[:-4], stat.st_mtime, stat.st_size
+
+    def _remove(self, key):
+        base = self._path(key)
+        try:
+            size = os.path.getsize(base + '.bin')
+            os.remove(base + '.bin')
+            self.current_bytes -= size
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(base + '.json')
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        base = self._path(key)
+        try:
+            mtime = os.path.getmtime(base + '.bin')
+            if time.time() - mtime > self.ttl:
+                with self._lock:
+                    self._remove(key)
+                    self.expirations += 1
+                return None
+            with open(base + '.json') as f:
+                mimetype = json.load(f)['mimetype']
+            with open(base + '.bin', 'rb') as f:
+                data = f.read()
+            # Touch on hit so eviction is least-recently-used; TTL counts from last use
+            os.utime(base + '.bin')
+            return data, mimetype
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def put(self, key, data, mimetype):
+        if len(data) > self.max_bytes:
+            return
+        base = self._path(key)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        with self._lock:
+            self._remove(key)
+            # Write to temp names then rename so readers never see partial files
+            with open(base + '.json.tmp', 'w') as f:
+                json.dump({'mimetype': mimetype, 'size': len(data), 'stored_at': time.time()}, f)
+            with open(base + '.bin.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(base + '.json.tmp', base + '.json')
+            os.replace(base + '.bin.tmp', base + '.bin')
+            self.current_bytes += len(data)
+
+            if self.current_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        now = time.time()
+        for key, mtime, _ in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self.current_bytes <= self.max_bytes * 0.9:
+                break
+            self._remove(key)
+            if now - mtime > self.ttl:
+                self.expirations += 1
+            else:
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class ResultCache:
+    """
+    Two-tier (memory LRU + disk) cache of provider result bytes
+    Entries are (bytes, mimetype) so results keep the provider's native format
+    """
+
+    def __init__(self, memory_tier=None, disk_tier=None):
+        self.memory = memory_tier
+        self.disk = disk_tier
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+        self._by_operation = {}
+        self._lock = threading.Lock()
+
+    def _count(self, operation, counter):
+        with self._lock:
+            self._counters[counter] += 1
+            op_counters = self._by_operation.setdefault(operation, {'hits': 0, 'misses': 0})
+            if counter in ('memory_hits', 'disk_hits'):
+                op_counters['hits'] += 1
+            elif counter == 'misses':
+                op_counters['misses'] += 1
+
+    def get(self, key, operation='unknown'):
+        if self.memory:
+            item = self.memory.get(key)
+            if item:
+                self._count(operation, 'memory_hits')
+                return item
+        if self.disk:
+            item = self.disk.get(key)
+            if item:
+                self._count(operation, 'disk_hits')
+                if self.memory:
+                    self.memory.put(key, *item)
+                return item
+        self._count(operation, 'misses')
+        return None
+
+    def put(self, key, data, mimetype, operation='unknown'):
+        if self.memory:
+            self.memory.put(key, data, mimetype)
+        if self.disk:
+            try:
+                self.disk.put(key, data, mimetype)
+            except OSError as e:
+                print(f"[Cache] Disk write failed: {e}")
+        self._count(operation, 'stores')
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            by_operation = {op: dict(c) for op, c in self._by_operation.items()}
+        hits = counters['memory_hits'] + counters['disk_hits']
+        lookups = hits + counters['misses']
+        return dict(
+            counters,
+            hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            operations=by_operation,
+            memory=self.memory.stats() if self.memory else None,
+            disk=self.disk.stats() if self.disk else None,
+        )
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Process-wide ResultCache, or None when RESULT_CACHE_ENABLED=false"""
+    global _result_cache
+    if os.getenv('RESULT_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    with _result_cache_lock:
+        if _result_cache is None:
+            memory_bytes = int(os.getenv('RESULT_CACHE_MEMORY_MB', '64')) * 1024 * 1024
+            disk_bytes = int(os.getenv('RESULT_CACHE_DISK_MB', '1024')) * 1024 * 1024
+            disk_tier = None
+            if disk_bytes > 0:
+                disk_tier = DiskTier(
+                    os.getenv('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'aiforce_result_cache')),
+                    disk_bytes,
+                    int(os.getenv('RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+                )
+            _result_cache = ResultCache(
+                memory_tier=MemoryTier(memory_bytes) if memory_bytes > 0 else None,
+                disk_tier=disk_tier
+            )
+        return _result_cache
@@ -0,0 +1,202 @@
+import os
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from utils.http_client import get_http_client
+
+TUS_VERSION = '1.0.0'
+
+
+class ResumableUploadError(Exception):
+    """A chunk kept failing after all retries; the upload can be resumed later"""
+
+
+class _Source:
+    """Random-access reader over bytes or a local file path (chunks read on demand, never the whole file)"""
+
+    def __init__(self, source):
+        self.source = source
+        if isinstance(source, (bytes, bytearray)):
+            self.size = len(source)
+            self.fingerprint = None
+        else:
+            stat = os.stat(source)
+            self.size = stat.st_size
+            self.fingerprint = f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime}"
+
+    def read(self, offset, length):
+        if isinstance(self.source, (bytes, bytearray)):
+            return memoryview(self.source)[offset:offset + length]
+        with open(self.source, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+class TusUploader:
+    """
+    Resumable chunked uploads over the TUS protocol (Supabase Storage's resumable endpoint)
+
+    - Each file is sent in chunk_size PATCH requests, so memory use is one chunk
+      per request in flight whatever the file size
+    - A failed chunk is retried: the server's Upload-Offset (HEAD) says where
+      to continue, so a dropped connection costs at most one chunk
+    - Servers announcing the "concatenation" extension get `parallel` partial
+      uploads in flight at once, joined by a final upload; otherwise chunks go
+      one after another (Supabase: sequential, 6 MB chunks)
+    - Upload URLs of local files are remembered by path/size/mtime and object
+      name, so a retried upload of the same file resumes instead of starting over
+    """
+
+    def __init__(self, endpoint, headers=None, chunk_size=6 * 1024 * 1024, parallel=4, max_retries=5,
+                 retry_backoff=1.0):
+        self.endpoint = endpoint
+        self.headers = dict(headers or {}, **{'Tus-Resumable': TUS_VERSION})
+        self.chunk_size = chunk_size
+        self.parallel = parallel
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._extensions = None
+        self._resume_urls = {}  # fingerprint -> upload URL
+        self._executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='tus')
+        self._counters = {'uploads': 0, 'bytes': 0, 'chunks': 0, 'retries': 0, 'resumed': 0, 'failures': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def extensions(self):
+        """TUS extensions announced by the server (OPTIONS), cached"""
+        if self._extensions is None:
+            try:
+                response = get_http_client().request('OPTIONS', self.endpoint, headers=self.headers,
+                                                     timeout=(5, 15))
+                value = response.headers.get('Tus-Extension', '')
+                self._extensions = {name.strip() for name in value.split(',') if name.strip()}
+            except Exception as e:
+                print(f"[TUS] OPTIONS failed, assuming core protocol only: {e}")
+                return set()
+        return self._extensions
+
+    @staticmethod
+    def _metadata(metadata):
+        return ','.join(f"{key} {base64.b64encode(str(value).encode()).decode()}"
+                        for key, value in metadata.items() if value is not None)
+
+    def _create(self, length, metadata=None, concat=None, extra_headers=None):
+        headers = dict(self.headers, **(extra_headers or {}))
+        if length is not None:
+            headers['Upload-Length'] = str(length)
+        if metadata:
+            headers['Upload-Metadata'] = self._metadata(metadata)
+        if concat:
+            headers['Upload-Concat'] = concat
+        response = get_http_client().post(self.endpoint, headers=headers, timeout=(5, 30))
+        if response.status_code != 201 or 'Location' not in response.headers:
+            raise ResumableUploadError(f"TUS create failed: HTTP {response.status_code} {response.text[:200]}")
+        return urljoin(self.endpoint, response.headers['Location'])
+
+    def _offset(self, upload_url):
+        response = get_http_client().request('HEAD', upload_url, headers=self.headers, timeout=(5, 15))
+        if response.status_code in (404, 410):
+            return None
+        response.raise_for_status()
+        return int(response.headers['Upload-Offset'])
+
+    def _send_range(self, upload_url, source, start, end, offset=0):
+        """PATCH source[start:end] to upload_url from the server's offset, retrying and resuming on errors"""
+        attempt = 0
+        while offset < end - start:
+            length = min(self.chunk_size, end - start - offset)
+            try:
+                chunk = source.read(start + offset, length)
+                headers = dict(self.headers, **{
+                    'Upload-Offset': str(offset),
+                    'Content-Type': 'application/offset+octet-stream',
+                })
+                response = get_http_client().request('PATCH', upload_url, data=bytes(chunk), headers=headers,
+                                                     timeout=(5, 120))
+                if response.status_code != 204:
+                    raise ResumableUploadError(f"HTTP {response.status_code} {response.text[:200]}")
+                offset = int(response.headers.get('Upload-Offset', offset + length))
+                attempt = 0
+                self._count('chunks')
+                self._count('bytes', length)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise ResumableUploadError(f"Chunk at {start + offset} failed after {self.max_retries} retries: {e}")
+                self._count('retries')
+                print(f"[TUS] Chunk at {start + offset} failed ({e}), resuming (attempt {attempt})")
+                time.sleep(self.retry_backoff * attempt)
+                try:
+                    server_offset = self._offset(upload_url)
+                except Exception:
+                    server_offset = None
+                if server_offset is not None:
+                    offset = server_offset
+
+    def _upload_sequential(self, source, metadata, extra_headers):
+        resume_key = f"{source.fingerprint}>{metadata.get('objectName')}" if source.fingerprint else None
+        upload_url = self._resume_urls.get(resume_key) if resume_key else None
+        offset = 0
+        if upload_url:
+            offset = self._offset(upload_url)
+            if offset is None:
+                upload_url = None
+            else:
+                self._count('resumed')
+                print(f"[TUS] Resuming {metadata.get('objectName')} at {offset}/{source.size} bytes")
+        if not upload_url:
+            upload_url = self._create(source.size, metadata, extra_headers=extra_headers)
+            if resume_key:
+                self._resume_urls[resume_key] = upload_url
+
+        self._send_range(upload_url, source, 0, source.size, offset)
+        if resume_key:
+            self._resume_urls.pop(resume_key, None)
+        return upload_url
+
+    def _upload_parallel(self, source, metadata, extra_headers):
+        """Concatenation extension: one partial upload per part, several in flight, joined by a final upload"""
+        parts = max(1, min(self.parallel, -(-source.size // self.chunk_size)))
+        part_size = -(-source.size // parts)
+        ranges = [(start, min(start + part_size, source.size)) for start in range(0, source.size, part_size)]
+
+        def upload_part(start, end):
+            part_url = self._create(end - start, concat='partial')
+            self._send_range(part_url, source, start, end)
+            return part_url
+
+        part_urls = [future.result() for future in
+                     [self._executor.submit(upload_part, start, end) for start, end in ranges]]
+        return self._create(None, metadata, concat='final;' + ' '.join(part_urls), extra_headers=extra_headers)
+
+    def upload(self, source, metadata, headers=None):
+        """
+        Upload bytes or a local file path
+        metadata becomes the TUS Upload-Metadata (e.g. bucketName, objectName, contentType);
+        headers are extra headers for the creation request (e.g. x-upsert)
+        Returns the upload URL
+        """
+        source = _Source(source)
+        start_time = time.time()
+        try:
+            if 'concatenation' in self.extensions() and source.size > self.chunk_size:
+                upload_url = self._upload_parallel(source, metadata, headers)
+            else:
+                upload_url = self._upload_sequential(source, metadata, headers)
+        except Exception:
+            self._count('failures')
+            raise
+        self._count('uploads')
+        elapsed = time.time() - start_time
+        print(f"[TUS] Uploaded {metadata.get('objectName')} ({source.size // 1024} KB) in {elapsed:.1f}s")
+        return upload_url
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, chunk_size=self.chunk_size, parallel=self.parallel,
+                        pending_resumes=len(self._resume_urls))
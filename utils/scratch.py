@@ -0,0 +1,233 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class ScratchQuotaExceeded(Exception):
+    """Scratch disk usage stayed above the quota for the whole wait timeout"""
+
+
+def _tree_size(path):
+    total = 0
+    for folder, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(folder, filename))
+            except FileNotFoundError:
+                continue
+    return total
+
+
+class ScratchDir:
+    """
+    A per-request scratch directory; everything in it is deleted on close()
+    Work that may outlive the request (abandoned race losers) retain()s it, and
+    the directory is only deleted when the last holder has closed it.
+    """
+
+    def __init__(self, manager, path, label):
+        self.manager = manager
+        self.path = path
+        self.label = label
+        self.created_at = time.time()
+        self._holders = 1
+        self._holders_lock = threading.Lock()
+
+    def retain(self):
+        """Keep the directory until a matching close()"""
+        with self._holders_lock:
+            self._holders += 1
+        return self
+
+    def file(self, suffix=''):
+        """Path for a new file inside this scratch directory (not created yet)"""
+        return os.path.join(self.path, f"{uuid.uuid4().hex[:12]}{suffix}")
+
+    @contextmanager
+    def activate(self):
+        """Make this the current_scratch() on the calling thread (e.g. in worker threads)"""
+        previous = current_scratch()
+        _local.scratch = self
+        try:
+            yield self
+        finally:
+            _local.scratch = previous
+
+    def close(self):
+        with self._holders_lock:
+            self._holders -= 1
+            if self._holders:
+                return
+        self.manager._release(self)
+
+
+def current_scratch():
+    """ScratchDir of the session active on this thread, or None"""
+    return getattr(_local, 'scratch', None)
+
+
+class ScratchManager:
+    """
+    Scratch space for processors, with guaranteed cleanup and a disk quota
+
+    - session(): context-managed per-request directory, removed on exit
+      (also on exceptions), and the current_scratch() for code running inside it
+    - quota: new sessions wait while usage is over quota_bytes (backpressure)
+      and fail with ScratchQuotaExceeded after wait_timeout
+    - a background sweeper deletes anything older than max_age under the root,
+      i.e. files orphaned by crashed workers
+    """
+
+    def __init__(self, root, quota_bytes, max_age=3600, sweep_interval=300, wait_timeout=30):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self.wait_timeout = wait_timeout
+        os.makedirs(root, exist_ok=True)
+
+        self._active = {}
+        self._counters = {
+            'sessions': 0, 'cleaned_bytes': 0, 'swept_files': 0, 'swept_bytes': 0,
+            'quota_waits': 0, 'quota_rejections': 0,
+        }
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._sweeper = threading.Thread(target=self._sweep_forever, name='scratch-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def usage(self):
+        """Bytes currently on disk under the scratch root (all workers)"""
+        return _tree_size(self.root)
+
+    @contextmanager
+    def session(self, label='request'):
+        scratch = self.open(label)
+        try:
+            with scratch.activate():
+                yield scratch
+        finally:
+            scratch.close()
+
+    def open(self, label='request'):
+        """Create a ScratchDir, waiting for disk space if over quota (caller must close() it)"""
+        deadline = time.time() + self.wait_timeout
+        waited = False
+        while self.usage() >= self.quota_bytes:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                with self._lock:
+                    self._counters['quota_rejections'] += 1
+                raise ScratchQuotaExceeded(
+                    f"Scratch disk usage over quota ({self.quota_bytes // (1024 * 1024)} MB), try again later"
+                )
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._counters['quota_waits'] += 1
+                print(f"[Scratch] Over quota, waiting for space ({label})")
+            with self._released:
+                self._released.wait(min(remaining, 1.0))
+
+        path = os.path.join(self.root, f"{label}-{uuid.uuid4().hex[:12]}")
+        os.makedirs(path)
+        scratch = ScratchDir(self, path, label)
+        with self._lock:
+            self._active[path] = scratch
+            self._counters['sessions'] += 1
+        return scratch
+
+    def _release(self, scratch):
+        size = _tree_size(scratch.path)
+        shutil.rmtree(scratch.path, ignore_errors=True)
+        with self._released:
+            if self._active.pop(scratch.path, None) is not None:
+                self._counters['cleaned_bytes'] += size
+            self._released.notify_all()
+
+    def loose_file(self, suffix=''):
+        """Path for a file outside any session; removed by the sweeper once older than max_age"""
+        return os.path.join(self.root, f"loose-{uuid.uuid4().hex[:12]}{suffix}")
+
+    def sweep(self):
+        """Delete entries under the root older than max_age that no session here is using"""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            active = set(self._active)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if path in active:
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                if os.path.isdir(path):
+                    size = _tree_size(path)
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            with self._released:
+                self._counters['swept_files'] += 1
+                self._counters['swept_bytes'] += size
+                self._released.notify_all()
+            print(f"[Scratch] Swept orphan {name} ({size} bytes)")
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[Scratch] Sweep failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            active = [
+                {'label': scratch.label, 'age_seconds': round(time.time() - scratch.created_at, 1)}
+                for scratch in self._active.values()
+            ]
+        return dict(
+            counters,
+            root=self.root,
+            bytes_in_use=self.usage(),
+            quota_bytes=self.quota_bytes,
+            active_sessions=len(active),
+            active=active,
+        )
+
+
+def scratch_file(suffix=''):
+    """New file path in the current scratch session, or a loose file swept after max_age"""
+    scratch = current_scratch()
+    if scratch:
+        return scratch.file(suffix)
+    return get_scratch_manager().loose_file(suffix)
+
+
+_scratch_manager = None
+_scratch_manager_lock = threading.Lock()
+
+
+def get_scratch_manager():
+    """Process-wide ScratchManager (created lazily so the sweeper starts after Gunicorn forks)"""
+    global _scratch_manager
+    with _scratch_manager_lock:
+        if _scratch_manager is None:
+            _scratch_manager = ScratchManager(
+                root=os.getenv('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'aiforce_scratch')),
+                quota_bytes=int(os.getenv('SCRATCH_QUOTA_MB', '2048')) * 1024 * 1024,
+                max_age=int(os.getenv('SCRATCH_MAX_AGE_SECONDS', '3600')),
+                sweep_interval=int(os.getenv('SCRATCH_SWEEP_INTERVAL', '300')),
+                wait_timeout=float(os.getenv('SCRATCH_WAIT_SECONDS', '30'))
+            )
+        return _scratch_manager
@@ -1,27 +1,99 @@
 import os
 import io
+import time
+import threading
 from datetime import datetime
-from supabase import create_client, Client
+import httpx
+from supabase import create_client, Client, ClientOptions
 from PIL import Image
 import uuid
+from utils.hedged_executor import LatencyHistogram
+from utils.resumable_upload import TusUploader
+from utils.output_encoder import encode
+
+EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+    'image/avif': 'avif',
+    'image/gif': 'gif',
+}
+
+BUCKET = 'ai-photos'
 
 class SupabaseStorage:
     """
     Supabase Storage Manager for AI Photo Editor
     Saves processed images to Supabase Storage bucket
+    
+    Use get_supabase_storage() - one instance per worker, shared by all threads.
+    Every call goes through one pooled keep-alive httpx client instead of new
+    HTTP sessions per request; per-operation latency is exposed via stats().
+    Uploads above resumable_threshold bytes go through the resumable (TUS)
+    endpoint in chunks instead of one request body.
     """
     
-    def __init__(self):
+    def __init__(self, pool_size=20, connect_timeout=5.0, read_timeout=60.0,
+                 resumable_threshold=6 * 1024 * 1024, chunk_size=6 * 1024 * 1024, parallel=4):
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_KEY')
+        self.resumable_threshold = resumable_threshold
+        self.resumable = None
+        self._latency = {}
+        self._lock = threading.Lock()
         
         if self.supabase_url and self.supabase_key:
-            self.client: Client = create_client(self.supabase_url, self.supabase_key)
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                follow_redirects=True
+            )
+            self.client: Client = create_client(
+                self.supabase_url, self.supabase_key, options=ClientOptions(httpx_client=http_client)
+            )
+            # Build the storage client now; lazy creation on first use could race between threads
+            self.client.storage
+            self.resumable = TusUploader(
+                f"{self.supabase_url.rstrip('/')}/storage/v1/upload/resumable",
+                headers={'Authorization': f"Bearer {self.supabase_key}", 'apikey': self.supabase_key},
+                chunk_size=chunk_size,
+                parallel=parallel
+            )
         else:
             self.client = None
             print("Warning: Supabase credentials not found. Storage disabled.")
     
-    def upload_image(self, image, user_id=None, feature_type='general'):
+    @property
+    def bucket(self):
+        return self.client.storage.from_(BUCKET)
+    
+    def _upload(self, filepath, source, content_type, upsert=False):
+        """Upload bytes or a local file path; large files use the resumable endpoint"""
+        size = len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+        if size > self.resumable_threshold:
+            metadata = {'bucketName': BUCKET, 'objectName': filepath, 'contentType': content_type}
+            headers = {'x-upsert': 'true'} if upsert else None
+            return self._timed('upload_resumable', lambda: self.resumable.upload(source, metadata, headers))
+        
+        file_options = {"content-type": content_type}
+        if upsert:
+            file_options["upsert"] = "true"
+        return self._timed('upload', lambda: self.bucket.upload(filepath, source, file_options))
+    
+    def _timed(self, operation, func):
+        """Run func() and record its latency under operation"""
+        start_time = time.time()
+        try:
+            result = func()
+        except Exception:
+            with self._lock:
+                self._latency.setdefault(operation, LatencyHistogram()).errors += 1
+            raise
+        with self._lock:
+            self._latency.setdefault(operation, LatencyHistogram()).record(time.time() - start_time)
+        return result
+    
+    def upload_image(self, image, user_id=None, feature_type='general', output=None):
         """
         Upload processed image to Supabase Storage
         
@@ -29,6 +101,44 @@ class SupabaseStorage:
             image: PIL Image object
             user_id: Optional user ID for organizing files
             feature_type: Type of AI feature (hd-upscale, face-swap, etc.)
+            output: OutputSpec from utils.output_encoder.negotiate (default: PNG)
+        
+        Returns:
+            dict with 'success', 'url', 'path'
+        """
+        if not self.client:
+            return {'success': False, 'error': 'Supabase not configured'}
+        
+        if output:
+            data, content_type = encode(image, output)
+            return self.upload_bytes(data, content_type, user_id, feature_type)
+        
+        # Convert PIL Image to bytes
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format='PNG')
+        return self.upload_bytes(img_byte_arr.getvalue(), 'image/png', user_id, feature_type)
+    
+    @staticmethod
+    def new_path(content_type, user_id=None, feature_type='general'):
+        """
+        Unique storage path for a new result (assigned before the upload, e.g. for write-behind)
+        
+        Returns:
+            (filepath, filename)
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        unique_id = str(uuid.uuid4())[:8]
+        extension = EXTENSIONS.get(content_type, 'png')
+        filename = f"{feature_type}_{timestamp}_{unique_id}.{extension}"
+        
+        # Add user folder if user_id provided
+        if user_id:
+            return f"{user_id}/{filename}", filename
+        return f"public/{filename}", filename
+    
+    def upload_bytes(self, data, content_type, user_id=None, feature_type='general'):
+        """
+        Upload already-encoded image bytes (e.g. a provider's native output) without re-encoding
         
         Returns:
             dict with 'success', 'url', 'path'
@@ -37,31 +147,13 @@ class SupabaseStorage:
             return {'success': False, 'error': 'Supabase not configured'}
         
         try:
-            # Generate unique filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"{feature_type}_{timestamp}_{unique_id}.png"
-            
-            # Add user folder if user_id provided
-            if user_id:
-                filepath = f"{user_id}/{filename}"
-            else:
-                filepath = f"public/{filename}"
-            
-            # Convert PIL Image to bytes
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
+            filepath, filename = self.new_path(content_type, user_id, feature_type)
             
             # Upload to Supabase Storage bucket 'ai-photos'
-            response = self.client.storage.from_('ai-photos').upload(
-                filepath,
-                img_byte_arr.read(),
-                file_options={"content-type": "image/png"}
-            )
+            self._upload(filepath, data, content_type)
             
             # Get public URL
-            public_url = self.client.storage.from_('ai-photos').get_public_url(filepath)
+            public_url = self.get_image_url(filepath)
             
             return {
                 'success': True,
@@ -76,12 +168,23 @@ class SupabaseStorage:
                 'error': str(e)
             }
     
+    def upload_file(self, source, filepath, content_type, upsert=False):
+        """
+        Upload bytes or a local file path (streamed from disk) to filepath in the bucket
+        Raises on failure; returns the public URL
+        """
+        if not self.client:
+            raise Exception("SUPABASE_URL and SUPABASE_KEY required for Supabase storage")
+        
+        self._upload(filepath, source, content_type, upsert)
+        return self.get_image_url(filepath)
+    
     def get_image_url(self, filepath):
         """Get public URL for stored image"""
         if not self.client:
             return None
         
-        return self.client.storage.from_('ai-photos').get_public_url(filepath)
+        return self._timed('public_url', lambda: self.bucket.get_public_url(filepath))
     
     def delete_image(self, filepath):
         """Delete image from storage"""
@@ -89,7 +192,7 @@ class SupabaseStorage:
             return {'success': False, 'error': 'Supabase not configured'}
         
         try:
-            self.client.storage.from_('ai-photos').remove([filepath])
+            self._timed('delete', lambda: self.bucket.remove([filepath]))
             return {'success': True}
         except Exception as e:
             return {'success': False, 'error': str(e)}
@@ -100,8 +203,38 @@ class SupabaseStorage:
             return []
         
         try:
-            files = self.client.storage.from_('ai-photos').list(user_id)
+            files = self._timed('list', lambda: self.bucket.list(user_id))
             return files
         except Exception as e:
             print(f"Error listing images: {e}")
             return []
+    
+    def stats(self):
+        with self._lock:
+            latency = {operation: histogram.to_dict() for operation, histogram in self._latency.items()}
+        return {
+            'enabled': self.client is not None,
+            'bucket': BUCKET,
+            'latency': latency,
+            'resumable_threshold': self.resumable_threshold,
+            'resumable': self.resumable.stats() if self.resumable else None,
+        }
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_supabase_storage():
+    """Process-wide SupabaseStorage (one client and connection pool per worker)"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = SupabaseStorage(
+                pool_size=int(os.getenv('SUPABASE_POOL_SIZE', '20')),
+                read_timeout=float(os.getenv('SUPABASE_TIMEOUT', '60')),
+                resumable_threshold=int(float(os.getenv('SUPABASE_RESUMABLE_THRESHOLD_MB', '6')) * 1024 * 1024),
+                chunk_size=int(float(os.getenv('SUPABASE_CHUNK_MB', '6')) * 1024 * 1024),
+                parallel=int(os.getenv('SUPABASE_UPLOAD_PARALLEL', '4'))
+            )
+        return _storage
@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import fcntl
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.template_catalog import file_locked
+
+SIDECAR_SUFFIX = '.faces.json'
+SIDECAR_VERSION = 1
+
+
+def sidecar_path(template_path):
+    """static/templates/videos/dance1.mp4 -> static/templates/videos/dance1.faces.json"""
+    return os.path.splitext(template_path)[0] + SIDECAR_SUFFIX
+
+
+def load_sidecar(template_path, sha256=None):
+    """Parsed sidecar of a template, or None if missing, unreadable or for other content"""
+    try:
+        with open(sidecar_path(template_path)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != SIDECAR_VERSION or (sha256 and index.get('sha256') != sha256):
+        return None
+    return index
+
+
+def face_segments(face_frames, fps, stride, max_gap_seconds=0.5):
+    """
+    [start, end] seconds of the stretches with faces; gaps up to max_gap_seconds are bridged
+    Use to trim a template to the part a swap actually changes.
+    """
+    segments = []
+    for frame in face_frames:
+        start = frame / fps
+        end = (frame + stride) / fps
+        if segments and start - segments[-1][1] <= max_gap_seconds:
+            segments[-1][1] = round(end, 3)
+        else:
+            segments.append([round(start, 3), round(end, 3)])
+    return segments
+
+
+def _detector(cv2, model_path, size):
+    """YuNet (boxes + 5 landmarks) when a model file is configured, else OpenCV's Haar cascade (boxes only)"""
+    if model_path:
+        detector = cv2.FaceDetectorYN.create(model_path, '', size, 0.7, 0.3, 50)
+        return 'yunet', detector
+
+    cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+    return 'haar', cascade
+
+
+def _detect(cv2, kind, detector, frame, scale):
+    """Faces in a (downscaled) BGR frame as [x, y, w, h, score%, landmarks...] in source pixels"""
+    if kind == 'yunet':
+        _, found = detector.detect(frame)
+        faces = []
+        for face in found if found is not None else []:
+            values = [int(round(value / scale)) for value in face[:14]]
+            faces.append(values[:4] + [int(face[14] * 100)] + values[4:])
+        return faces
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    rects = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(24, 24))
+    return [[int(round(value / scale)) for value in rect] + [100] for rect in rects]
+
+
+def analyze_template(path, sha256, options):
+    """
+    Face analysis of one template video, written to its sidecar (runs in a pool process)
+
+    Every `stride`-th frame is decoded at analysis_width and searched for faces;
+    scene cuts come from the HSV histogram distance between analyzed frames, and
+    each scene's keyframe is the frame with the largest face area (its first
+    frame if it has no faces). The sidecar holds only frames with faces:
+
+        {"faces": [[frame, [[x, y, w, h, score%, lx1, ly1, ... lx5, ly5], ...]], ...],
+         "scenes": [[first, last], ...], "keyframes": [...], "segments": [[start_s, end_s], ...],
+         "summary": {...}, "sha256", "fps", "frame_count", "width", "height", ...}
+
+    Returns the summary. A file lock keeps two workers from analyzing the same
+    template at once; a sidecar for the same content is reused.
+    """
+    import cv2
+
+    with open(sidecar_path(path) + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        existing = load_sidecar(path, sha256)
+        if existing:
+            return existing['summary']
+
+        start_time = time.time()
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise Exception(f"Cannot open video {path}")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        scale = min(1.0, options['analysis_width'] / width) if width else 1.0
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        stride = max(1, options['stride'])
+        kind, detector = _detector(cv2, options['model_path'], size)
+
+        faces, scenes, keyframes = [], [], []
+        scene_start, best = 0, (0, 0)  # best = (face area, frame) of the current scene
+        previous_hist = None
+        frame_index = analyzed = 0
+        while True:
+            # grab() skips decoding the frames between analyzed ones
+            if frame_index % stride and capture.grab():
+                frame_index += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if scale < 1.0:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            analyzed += 1
+
+            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+            hist = cv2.calcHist([hsv], [0, 1], None, [32, 32], [0, 180, 0, 256])
+            cv2.normalize(hist, hist)
+            if previous_hist is not None and \
+                    cv2.compareHist(previous_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > options['cut_threshold']:
+                scenes.append([scene_start, frame_index - 1])
+                keyframes.append(best[1] if best[0] else scene_start)
+                scene_start, best = frame_index, (0, frame_index)
+            previous_hist = hist
+
+            found = _detect(cv2, kind, detector, frame, scale)
+            if found:
+                faces.append([frame_index, found])
+                area = max(face[2] * face[3] for face in found)
+                if area > best[0]:
+                    best = (area, frame_index)
+            frame_index += 1
+        capture.release()
+
+        if frame_index:
+            scenes.append([scene_start, frame_index - 1])
+            keyframes.append(best[1] if best[0] else scene_start)
+
+        summary = {
+            'detector': kind,
+            'frames_analyzed': analyzed,
+            'frames_with_faces': len(faces),
+            'face_coverage': round(len(faces) / analyzed, 3) if analyzed else 0.0,
+            'max_faces': max((len(found) for _, found in faces), default=0),
+            'scenes': len(scenes),
+            'seconds': round(time.time() - start_time, 1),
+        }
+        index = {
+            'version': SIDECAR_VERSION,
+            'sha256': sha256,
+            'fps': fps,
+            'frame_count': frame_index,
+            'width': width,
+            'height': height,
+            'stride': stride,
+            'face_format': 'x,y,w,h,score%' + (',landmarks(5x2)' if kind == 'yunet' else ''),
+            'faces': faces,
+            'scenes': scenes,
+            'keyframes': keyframes,
+            'segments': face_segments([frame for frame, _ in faces], fps, stride),
+            'summary': summary,
+        }
+        tmp_path = sidecar_path(path) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(tmp_path, sidecar_path(path))
+        return summary
+
+
+class TemplateAnalyzer:
+    """
+    Offline face analysis of template videos into sidecar indexes
+
+    Attached to the TemplateCatalog like TemplateDerivatives: every new or
+    changed video (after upload_template, or queued by submit_missing() once
+    per serving process) is analyzed once on a process pool. The sidecar on
+    disk is the source of truth: the catalog resolver copies its summary onto
+    the entry in every process, whichever process wrote it. The sidecar
+    (<template>.faces.json) carries the per-frame faces, scene cuts, keyframes
+    and face segments for trimming or for providers that take precomputed tracks.
+    Needs OpenCV (opencv-python-headless); without it templates stay unanalyzed.
+    """
+
+    def __init__(self, max_workers=1, stride=1, analysis_width=480, cut_threshold=0.5, model_path=None):
+        self.max_workers = max_workers
+        self.options = {
+            'stride': stride,
+            'analysis_width': analysis_width,
+            'cut_threshold': cut_threshold,
+            'model_path': model_path or None,
+        }
+        self.available = importlib.util.find_spec('cv2') is not None
+        self._executor = None
+        self._pending = {}  # sha256 -> future
+        self._counters = {'submitted': 0, 'reused': 0, 'analyzed': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def attach(self, catalog):
+        """Follow the catalog: queue new or changed videos, pick up finished sidecars (starts no processes)"""
+        catalog.add_listener(lambda kind, entry: self.submit(catalog, entry) if kind == 'video' else None)
+        catalog.add_resolver(lambda kind, entry: self.resolve(catalog, entry) if kind == 'video' else None)
+
+    def submit_missing(self, catalog):
+        """Queue every template video that has no analysis yet"""
+        for entry in catalog.videos():
+            if entry['analysis'] is None:
+                self.submit(catalog, entry)
+
+    def resolve(self, catalog, entry):
+        """Record the summary of a sidecar another process has written for entry"""
+        if entry['analysis'] is not None:
+            return
+        index = load_sidecar(entry['path'], entry['sha256'])
+        if index:
+            catalog.set_analysis(entry['id'], entry['sha256'], index['summary'])
+
+    def pending(self, entry):
+        """True while the template is being analyzed here or in another process"""
+        with self._lock:
+            if entry['sha256'] in self._pending:
+                return True
+        return file_locked(sidecar_path(entry['path']) + '.lock')
+
+    def submit(self, catalog, entry):
+        """Queue analysis of a template video (no-op if its sidecar is current or it is in progress anywhere)"""
+        index = load_sidecar(entry['path'], entry['sha256'])
+        if index:
+            with self._lock:
+                self._counters['reused'] += 1
+            catalog.set_analysis(entry['id'], entry['sha256'], index['summary'])
+            return None
+        if not self.available:
+            print(f"[TemplateAnalysis] OpenCV not installed, {entry['filename']} not analyzed")
+            return None
+
+        with self._lock:
+            future = self._pending.get(entry['sha256'])
+            if future:
+                return future
+            if file_locked(sidecar_path(entry['path']) + '.lock'):
+                # Another worker is analyzing it; resolve() picks the sidecar up when it is done
+                return None
+            self._counters['submitted'] += 1
+            future = self._pool().submit(analyze_template, entry['path'], entry['sha256'], self.options)
+            self._pending[entry['sha256']] = future
+
+        def done(future):
+            with self._lock:
+                self._pending.pop(entry['sha256'], None)
+            try:
+                summary = future.result()
+            except Exception as e:
+                with self._lock:
+                    self._counters['failed'] += 1
+                print(f"[TemplateAnalysis] {entry['filename']} failed: {e}")
+                return
+            with self._lock:
+                self._counters['analyzed'] += 1
+            catalog.set_analysis(entry['id'], entry['sha256'], summary)
+            print(f"[TemplateAnalysis] {entry['filename']}: {summary['frames_with_faces']}/"
+                  f"{summary['frames_analyzed']} frames with faces, {summary['scenes']} scenes "
+                  f"in {summary['seconds']}s")
+
+        future.add_done_callback(done)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending), max_workers=self.max_workers,
+                        available=self.available, detector='yunet' if self.options['model_path'] else 'haar')
+
+
+_template_analyzer = None
+_template_analyzer_lock = threading.Lock()
+
+
+def get_template_analyzer():
+    """Process-wide TemplateAnalyzer"""
+    global _template_analyzer
+    with _template_analyzer_lock:
+        if _template_analyzer is None:
+            _template_analyzer = TemplateAnalyzer(
+                max_workers=int(os.getenv('TEMPLATE_ANALYSIS_WORKERS', '1')),
+                stride=int(os.getenv('TEMPLATE_ANALYSIS_STRIDE', '1')),
+                analysis_width=int(os.getenv('TEMPLATE_ANALYSIS_WIDTH', '480')),
+                model_path=os.getenv('TEMPLATE_FACE_MODEL') or None
+            )
+        return _template_analyzer
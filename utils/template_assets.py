@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from utils.media_ingest import MediaFile
+
+
+class TemplateAsset(MediaFile):
+    """
+    A template file on local disk (e.g. static/templates/videos/dance1.mp4)
+
+    Passed to providers instead of an upload so they can reuse a remote copy
+    from the TemplateAssetRegistry rather than re-uploading the file.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, owned=False)
+
+
+class TemplateAssetRegistry:
+    """
+    Tracks remote copies (URL / file id) of template files per provider, keyed by content hash
+
+    Each template is uploaded to each provider once; it is re-uploaded only when
+    the file content changes (new hash) or the remote copy has expired.
+    The index is a JSON file so it survives restarts and is shared by Gunicorn workers.
+    """
+
+    def __init__(self, index_path, expiry_margin=600):
+        self.index_path = index_path
+        self.expiry_margin = expiry_margin
+        self._index = self._load()
+        self._hashes = {}  # path -> (mtime, size, sha256)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'uploads': 0, 'upload_errors': 0, 'invalidations': 0}
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def content_hash(self, path):
+        """sha256 of the file, recomputed only when its mtime or size changes"""
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        self._hashes[path] = (stat.st_mtime, stat.st_size, sha256)
+        return sha256
+
+    def _valid(self, entry):
+        expires_at = entry.get('expires_at')
+        return expires_at is None or time.time() < expires_at - self.expiry_margin
+
+    def remote_url(self, provider, path, uploader):
+        """
+        URL of the provider's copy of path, uploading it first if needed
+
+        Args:
+            provider: Name of the remote (e.g. 'replicate', 'supabase')
+            path: Local template file
+            uploader: callable(path, sha256) -> {'url', 'file_id'?, 'expires_at'?}
+        """
+        sha256 = self.content_hash(path)
+        key = f"{provider}:{sha256}"
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # One upload per key even when several requests miss at the same time
+        with key_lock:
+            with self._lock:
+                entry = self._index.get(key)
+                if not entry or not self._valid(entry):
+                    # Another worker may have uploaded it since we loaded the index
+                    entry = self._load().get(key)
+                if entry and self._valid(entry):
+                    self._counters['hits'] += 1
+                    return entry['url']
+
+            start_time = time.time()
+            try:
+                uploaded = uploader(path, sha256)
+            except Exception:
+                with self._lock:
+                    self._counters['upload_errors'] += 1
+                raise
+
+            entry = {
+                'url': uploaded['url'],
+                'file_id': uploaded.get('file_id'),
+                'expires_at': uploaded.get('expires_at'),
+                'filename': os.path.basename(path),
+                'size': os.path.getsize(path),
+                'uploaded_at': time.time(),
+            }
+            with self._lock:
+                self._counters['uploads'] += 1
+                self._index = self._load()
+                self._index[key] = entry
+                self._save()
+            print(f"[TemplateAssets] Uploaded {entry['filename']} to {provider} in {time.time() - start_time:.1f}s")
+            return entry['url']
+
+    def invalidate(self, provider, path):
+        """Forget the provider's copy (e.g. the remote rejected the URL) so the next call re-uploads"""
+        key = f"{provider}:{self.content_hash(path)}"
+        with self._lock:
+            self._index = self._load()
+            if self._index.pop(key, None):
+                self._counters['invalidations'] += 1
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            entries = [dict(entry, key=key, valid=self._valid(entry)) for key, entry in self._index.items()]
+            return dict(self._counters, entries=entries)
+
+
+_template_assets = None
+_template_assets_lock = threading.Lock()
+
+
+def get_template_assets():
+    """Process-wide TemplateAssetRegistry"""
+    global _template_assets
+    with _template_assets_lock:
+        if _template_assets is None:
+            _template_assets = TemplateAssetRegistry(
+                os.getenv('TEMPLATE_ASSET_INDEX', os.path.join(tempfile.gettempdir(), 'aiforce_template_assets.json'))
+            )
+        return _template_assets
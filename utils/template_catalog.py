@@ -0,0 +1,370 @@
+import os
+import time
+import struct
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+TEMPLATES_ROOT = os.path.join('static', 'templates')
+IMAGE_CATEGORIES = ('female', 'male', 'mixed')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.webm')
+
+
+def _boxes(f, start, end):
+    """(type, payload_start, payload_end) of the ISO-BMFF boxes between start and end"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+
+def _find_box(f, start, end, box_type):
+    for found, payload_start, payload_end in _boxes(f, start, end):
+        if found == box_type:
+            return payload_start, payload_end
+    return None
+
+
+def probe_mp4(path):
+    """
+    Duration (seconds) and frame size of an MP4/MOV from its moov box, without decoding
+    Returns {'duration', 'width', 'height'}; values are None when not found
+    """
+    info = {'duration': None, 'width': None, 'height': None}
+    with open(path, 'rb') as f:
+        moov = _find_box(f, 0, os.path.getsize(path), b'moov')
+        if not moov:
+            return info
+
+        mvhd = _find_box(f, *moov, b'mvhd')
+        if mvhd:
+            f.seek(mvhd[0])
+            version = f.read(1)[0]
+            f.seek(mvhd[0] + (20 if version == 1 else 12))
+            if version == 1:
+                timescale, duration = struct.unpack('>IQ', f.read(12))
+            else:
+                timescale, duration = struct.unpack('>II', f.read(8))
+            if timescale:
+                info['duration'] = round(duration / timescale, 3)
+
+        # Frame size: tkhd of the first track with one (audio tracks have 0x0)
+        for box_type, payload_start, payload_end in _boxes(f, *moov):
+            if box_type != b'trak':
+                continue
+            tkhd = _find_box(f, payload_start, payload_end, b'tkhd')
+            if not tkhd:
+                continue
+            f.seek(tkhd[1] - 8)
+            width, height = struct.unpack('>II', f.read(8))
+            if width and height:
+                info['width'], info['height'] = width >> 16, height >> 16
+                break
+    return info
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_locked(lock_path):
+    """True if another open file holds an flock on lock_path (work in progress in some process)"""
+    try:
+        with open(lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+class TemplateCatalog:
+    """
+    In-memory index of the template images and videos under static/templates
+
+    Built once at startup. Afterwards the directories are re-scanned at most
+    every check_interval seconds (a stat per file); only new or changed files
+    (different mtime or size) are probed and hashed again. Each entry keeps
+    size, content hash, dimensions and, for videos, duration; `derivatives`
+    holds the URLs of thumbnails / poster frames / preview clips and
+    `analysis` the face analysis summary of videos, once they exist. Listeners
+    (add_listener) are told about new and changed entries; resolvers
+    (add_resolver) run on every refresh and fill those fields in from disk, so
+    work finished by another process (Gunicorn worker, pool) shows up here too.
+
+    `version` changes whenever the set of templates or any of their contents
+    does, so listings can be cached and served with an ETag derived from it.
+    """
+
+    def __init__(self, root=TEMPLATES_ROOT, image_categories=IMAGE_CATEGORIES, video_dir='videos',
+                 check_interval=5.0, max_listings=32):
+        self.root = root
+        self.image_categories = image_categories
+        self.video_dir = os.path.join(root, video_dir)
+        self.check_interval = check_interval
+        self.max_listings = max_listings
+        self.version = None
+        self._images = {}  # id -> entry
+        self._videos = {}  # id -> entry
+        self._checked_at = 0.0
+        # (kind, version, base_url) -> cached listing payload; LRU because base_url comes from the Host header
+        self._responses = OrderedDict()
+        self._listeners = []
+        self._resolvers = []
+        self._scan_lock = threading.Lock()  # one scan at a time; readers only wait for the final swap
+        self._counters = {'scans': 0, 'probes': 0, 'probe_errors': 0, 'stale_lookups': 0}
+        self._lock = threading.RLock()
+
+    def add_listener(self, listener):
+        """listener(kind, entry) is called for every template added or changed by a later refresh()"""
+        self._listeners.append(listener)
+
+    def add_resolver(self, resolver):
+        """
+        resolver(kind, entry) is called for every template on each refresh()
+        Used to pick up results other processes wrote to disk; it should return quickly when there is nothing new.
+        """
+        self._resolvers.append(resolver)
+
+    def _stat_files(self, folder, extensions):
+        files = {}
+        try:
+            with os.scandir(folder) as scan:
+                for item in scan:
+                    if item.is_file() and item.name.lower().endswith(extensions):
+                        stat = item.stat()
+                        files[item.name] = (item.path, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return files
+
+    def _probe(self, path, kind):
+        """Dimensions (and video duration) of a template file"""
+        with self._lock:
+            self._counters['probes'] += 1
+        try:
+            if kind == 'image':
+                with Image.open(path) as image:
+                    return {'width': image.width, 'height': image.height}
+            if path.lower().endswith(('.mp4', '.mov')):
+                return probe_mp4(path)
+        except Exception as e:
+            with self._lock:
+                self._counters['probe_errors'] += 1
+            print(f"[TemplateCatalog] Could not probe {path}: {e}")
+        return {'width': None, 'height': None} if kind == 'image' else \
+            {'duration': None, 'width': None, 'height': None}
+
+    def _entry(self, previous, template_id, filename, category, kind, stat):
+        path, mtime_ns, size = stat
+        if previous and previous['mtime_ns'] == mtime_ns and previous['size'] == size:
+            return previous
+        entry = {
+            'id': template_id,
+            'filename': filename,
+            'category': category,
+            'path': path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': _sha256(path),
+            'derivatives': {},
+            'analysis': None,
+        }
+        entry.update(self._probe(path, kind))
+        return entry
+
+    def refresh(self, force=False):
+        """
+        Re-scan the template directories (at most every check_interval seconds unless force)
+        Returns True if the catalog version changed
+        """
+        with self._lock:
+            if not force and time.time() - self._checked_at < self.check_interval:
+                return False
+            # Callers arriving while this scan runs keep using the current entries
+            self._checked_at = time.time()
+        with self._scan_lock:
+            version = self.version
+            changed_entries = self._scan()
+            with self._lock:
+                entries = [('image', entry) for entry in self._images.values()] + \
+                    [('video', entry) for entry in self._videos.values()]
+        for kind, entry in changed_entries:
+            for listener in self._listeners:
+                try:
+                    listener(kind, entry)
+                except Exception as e:
+                    print(f"[TemplateCatalog] Listener failed for {entry['filename']}: {e}")
+        for kind, entry in entries:
+            for resolver in self._resolvers:
+                try:
+                    resolver(kind, entry)
+                except Exception as e:
+                    print(f"[TemplateCatalog] Resolver failed for {entry['filename']}: {e}")
+        return self.version != version
+
+    def _scan(self):
+        """
+        Re-index the directories; returns [(kind, entry)] of new or changed templates
+        Files are stat'ed, probed and hashed without holding the catalog lock (a new
+        video can take seconds to hash); only the swap to the new index is locked.
+        """
+        with self._lock:
+            self._checked_at = time.time()
+            self._counters['scans'] += 1
+            previous_images, previous_videos = dict(self._images), dict(self._videos)
+
+        images = {}
+        for category in self.image_categories:
+            for filename, stat in self._stat_files(os.path.join(self.root, category), IMAGE_EXTENSIONS).items():
+                clean_name = filename.replace('.jpg', '').replace('.jpeg', '').replace('.png', '')
+                template_id = f"{category}_{clean_name}"
+                images[template_id] = self._entry(previous_images.get(template_id), template_id, filename,
+                                                  category, 'image', stat)
+
+        videos = {}
+        for filename, stat in self._stat_files(self.video_dir, VIDEO_EXTENSIONS).items():
+            template_id = filename.rsplit('.', 1)[0]
+            videos[template_id] = self._entry(previous_videos.get(template_id), template_id, filename,
+                                              'videos', 'video', stat)
+
+        with self._lock:
+            changed_entries = [('image', entry) for template_id, entry in images.items()
+                               if entry is not self._images.get(template_id)]
+            changed_entries += [('video', entry) for template_id, entry in videos.items()
+                                if entry is not self._videos.get(template_id)]
+            self._images, self._videos = images, videos
+            self._update_version()
+            return changed_entries
+
+    def _update_version(self):
+        digest = hashlib.sha1()
+        for template_id, entry in sorted(self._images.items()) + sorted(self._videos.items()):
+            digest.update(f"{template_id}:{entry['filename']}:{entry['sha256']}:"
+                          f"{sorted(entry['derivatives'].items())}:{entry['analysis']}\n".encode())
+        version = digest.hexdigest()[:16]
+        if version != self.version:
+            self.version = version
+            self._responses.clear()
+
+    def _annotate(self, template_id, sha256, field, value):
+        """Set a field computed from the file's content (ignored if the file has changed since)"""
+        with self._lock:
+            entry = self._images.get(template_id) or self._videos.get(template_id)
+            if entry and entry['sha256'] == sha256:
+                entry[field] = value
+                self._update_version()
+
+    def set_derivatives(self, template_id, sha256, derivatives):
+        """Record derivative URLs for a template"""
+        self._annotate(template_id, sha256, 'derivatives', dict(derivatives))
+
+    def set_analysis(self, template_id, sha256, summary):
+        """Record the face analysis summary of a template video"""
+        self._annotate(template_id, sha256, 'analysis', dict(summary))
+
+    def images(self):
+        self.refresh()
+        with self._lock:
+            return sorted(self._images.values(), key=lambda entry: (entry['category'], entry['filename']))
+
+    def videos(self):
+        self.refresh()
+        with self._lock:
+            return sorted(self._videos.values(), key=lambda entry: entry['filename'])
+
+    def image(self, template_id):
+        """Entry of a template image by id (<category>_<name>), or None"""
+        self.refresh()
+        with self._lock:
+            return self._images.get(template_id)
+
+    def video(self, template_id):
+        """Entry of a template video by id (filename without extension), or None"""
+        self.refresh()
+        with self._lock:
+            return self._videos.get(template_id)
+
+    def entry_for_path(self, path):
+        """
+        Entry of the template stored at path, or None (no re-scan; used on every media request)
+
+        The file is stat'ed against the entry, so a template replaced since the last
+        scan gets None (no stale hash) until the next refresh re-indexes it
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            match = None
+            for entry in list(self._images.values()) + list(self._videos.values()):
+                if os.path.normpath(entry['path']) == path:
+                    match = entry
+                    break
+        if match is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_mtime_ns != match['mtime_ns'] or stat.st_size != match['size']:
+            with self._lock:
+                self._counters['stale_lookups'] += 1
+            return None
+        return match
+
+    def cached_listing(self, kind, base_url, build):
+        """
+        Listing payload for (kind, base_url), built by build() once per catalog version
+        Returns (payload, etag)
+        """
+        self.refresh()
+        with self._lock:
+            key = (kind, self.version, base_url)
+            if key in self._responses:
+                self._responses.move_to_end(key)
+            else:
+                self._responses[key] = build()
+                while len(self._responses) > self.max_listings:
+                    self._responses.popitem(last=False)
+            etag = hashlib.sha1(f"{kind}:{self.version}:{base_url}".encode()).hexdigest()[:20]
+            return self._responses[key], etag
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, version=self.version, images=len(self._images), videos=len(self._videos),
+                        cached_listings=len(self._responses),
+                        checked_seconds_ago=round(time.time() - self._checked_at, 1))
+
+
+_template_catalog = None
+_template_catalog_lock = threading.Lock()
+
+
+def get_template_catalog():
+    """Process-wide TemplateCatalog"""
+    global _template_catalog
+    with _template_catalog_lock:
+        if _template_catalog is None:
+            _template_catalog = TemplateCatalog(
+                check_interval=float(os.getenv('TEMPLATE_CATALOG_CHECK_SECONDS', '5')),
+                max_listings=int(os.getenv('TEMPLATE_LISTING_CACHE_SIZE', '32'))
+            )
+        return _template_catalog
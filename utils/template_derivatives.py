@@ -0,0 +1,232 @@
+import os
+import json
+import fcntl
+import shutil
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.image_processor import ImageProcessor
+from utils.template_catalog import file_locked
+
+DERIVED_DIR = os.path.join('static', 'templates', 'derived')
+THUMBNAIL_SIZES = (256, 512)
+MANIFEST = 'manifest.json'
+
+
+def _save_webp(image, path, quality):
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    tmp_path = path + '.tmp'
+    image.save(tmp_path, format='WEBP', quality=quality, method=6)
+    os.replace(tmp_path, path)
+
+
+def _image_derivatives(path, out_dir, sizes, quality):
+    derived = {}
+    for size in sizes:
+        name = f"thumb_{size}.webp"
+        # Decoded straight at the thumbnail size (JPEG draft mode)
+        _save_webp(ImageProcessor.load_image(path, size), os.path.join(out_dir, name), quality)
+        derived[f"thumb_{size}"] = name
+    return derived
+
+
+def _video_derivatives(path, out_dir, ffmpeg, poster_size, preview_seconds, preview_height, quality):
+    derived = {}
+    poster_png = os.path.join(out_dir, 'poster.png')
+    # A frame 1s in skips fade-ins; clips shorter than that fall back to the first frame
+    for seek in ('1', '0'):
+        result = subprocess.run([ffmpeg, '-v', 'error', '-y', '-ss', seek, '-i', path, '-frames:v', '1', poster_png],
+                                capture_output=True, timeout=120)
+        if result.returncode == 0 and os.path.exists(poster_png):
+            break
+    if os.path.exists(poster_png):
+        _save_webp(ImageProcessor.load_image(poster_png, poster_size), os.path.join(out_dir, 'poster.webp'), quality)
+        os.remove(poster_png)
+        derived['poster'] = 'poster.webp'
+
+    preview_tmp = os.path.join(out_dir, 'preview.tmp.mp4')
+    result = subprocess.run([
+        ffmpeg, '-v', 'error', '-y', '-i', path, '-t', str(preview_seconds), '-an',
+        '-vf', f"scale=-2:'min({preview_height},ih)'", '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '32',
+        '-pix_fmt', 'yuv420p', '-movflags', '+faststart', preview_tmp
+    ], capture_output=True, timeout=600)
+    if result.returncode == 0:
+        os.replace(preview_tmp, os.path.join(out_dir, 'preview.mp4'))
+        derived['preview'] = 'preview.mp4'
+    else:
+        print(f"[Derivatives] Preview clip for {path} failed: {result.stderr.decode(errors='replace')[-300:]}")
+    return derived
+
+
+def generate_derivatives(path, kind, out_dir, options):
+    """
+    Build the derivatives of one template file into out_dir (runs in a pool process)
+
+    Images get WebP thumbnails per size; videos a WebP poster frame and a short,
+    silent, low-bitrate MP4 preview. out_dir is named after the content hash,
+    so a finished manifest means there is nothing to do; a file lock keeps two
+    Gunicorn workers from building the same template at once.
+    Returns {name: filename in out_dir}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    with open(os.path.join(out_dir, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                return json.load(f)
+
+        if kind == 'image':
+            derived = _image_derivatives(path, out_dir, options['sizes'], options['quality'])
+        else:
+            derived = _video_derivatives(path, out_dir, options['ffmpeg'], options['poster_size'],
+                                         options['preview_seconds'], options['preview_height'], options['quality'])
+
+        # A video whose ffmpeg runs all failed gets no manifest, so it is retried on the next start
+        if derived or kind == 'image':
+            with open(manifest_path + '.tmp', 'w') as f:
+                json.dump(derived, f)
+            os.replace(manifest_path + '.tmp', manifest_path)
+        return derived
+
+
+class TemplateDerivatives:
+    """
+    Thumbnails, poster frames and preview clips for the template catalog
+
+    Attached to the TemplateCatalog: every new or changed template (after
+    upload_template, or found by a re-scan) is queued on a process pool, and
+    submit_missing() queues the ones without derivatives once per serving
+    process. The pool is only created by the first submit, so it never exists
+    in a Gunicorn master that forks workers afterwards.
+    Derivatives live in static/templates/derived/<sha256 prefix>/ and are reused
+    across restarts and workers: the catalog resolver reads finished manifests
+    from disk on every refresh, so each process sees derivatives built by any
+    other, and the derivative URLs on the catalog entry change the catalog
+    version and so the listing ETags.
+    """
+
+    def __init__(self, derived_dir=DERIVED_DIR, max_workers=2, sizes=THUMBNAIL_SIZES, quality=80,
+                 poster_size=720, preview_seconds=4, preview_height=360, ffmpeg=None):
+        self.derived_dir = derived_dir
+        self.max_workers = max_workers
+        self.options = {
+            'sizes': tuple(sizes),
+            'quality': quality,
+            'poster_size': poster_size,
+            'preview_seconds': preview_seconds,
+            'preview_height': preview_height,
+            'ffmpeg': ffmpeg or shutil.which('ffmpeg'),
+        }
+        self._executor = None
+        self._pending = {}  # sha256 -> future
+        self._counters = {'submitted': 0, 'reused': 0, 'generated': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: the worker process must not inherit this process's threads and locks
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def out_dir(self, entry):
+        return os.path.join(self.derived_dir, entry['sha256'][:16])
+
+    def _urls(self, entry, derived):
+        out_dir = self.out_dir(entry).replace(os.sep, '/')
+        return {name: f"/{out_dir}/{filename}" for name, filename in derived.items()}
+
+    def attach(self, catalog):
+        """Follow the catalog: queue new or changed templates, pick up finished derivatives (starts no processes)"""
+        catalog.add_listener(lambda kind, entry: self.submit(catalog, kind, entry))
+        catalog.add_resolver(lambda kind, entry: self.resolve(catalog, entry))
+
+    def submit_missing(self, catalog):
+        """Queue every template that has no derivatives yet"""
+        for entry in catalog.images():
+            if not entry['derivatives']:
+                self.submit(catalog, 'image', entry)
+        for entry in catalog.videos():
+            if not entry['derivatives']:
+                self.submit(catalog, 'video', entry)
+
+    def _load_manifest(self, entry):
+        try:
+            with open(os.path.join(self.out_dir(entry), MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def resolve(self, catalog, entry):
+        """Record derivatives another process has finished for entry"""
+        if entry['derivatives']:
+            return
+        derived = self._load_manifest(entry)
+        if derived:
+            catalog.set_derivatives(entry['id'], entry['sha256'], self._urls(entry, derived))
+
+    def submit(self, catalog, kind, entry):
+        """Queue derivative generation for a catalog entry (no-op if built, in progress here or in another process)"""
+        if kind == 'video' and not self.options['ffmpeg']:
+            print(f"[Derivatives] ffmpeg not found, no poster/preview for {entry['filename']}")
+            return None
+        derived = self._load_manifest(entry)
+        if derived is not None:
+            with self._lock:
+                self._counters['reused'] += 1
+            catalog.set_derivatives(entry['id'], entry['sha256'], self._urls(entry, derived))
+            return None
+
+        with self._lock:
+            future = self._pending.get(entry['sha256'])
+            if future:
+                return future
+            if file_locked(os.path.join(self.out_dir(entry), '.lock')):
+                # Another worker is building it; resolve() picks the manifest up when it is done
+                return None
+            self._counters['submitted'] += 1
+            future = self._pool().submit(generate_derivatives, entry['path'], kind, self.out_dir(entry),
+                                         self.options)
+            self._pending[entry['sha256']] = future
+
+        def done(future):
+            with self._lock:
+                self._pending.pop(entry['sha256'], None)
+            try:
+                derived = future.result()
+            except Exception as e:
+                with self._lock:
+                    self._counters['failed'] += 1
+                print(f"[Derivatives] {entry['filename']} failed: {e}")
+                return
+            with self._lock:
+                self._counters['generated'] += 1
+            catalog.set_derivatives(entry['id'], entry['sha256'], self._urls(entry, derived))
+            print(f"[Derivatives] {entry['filename']}: {', '.join(derived) or 'nothing'}")
+
+        future.add_done_callback(done)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending), max_workers=self.max_workers,
+                        ffmpeg=self.options['ffmpeg'])
+
+
+_template_derivatives = None
+_template_derivatives_lock = threading.Lock()
+
+
+def get_template_derivatives():
+    """Process-wide TemplateDerivatives"""
+    global _template_derivatives
+    with _template_derivatives_lock:
+        if _template_derivatives is None:
+            _template_derivatives = TemplateDerivatives(
+                max_workers=int(os.getenv('DERIVATIVE_WORKERS', '2')),
+                ffmpeg=os.getenv('FFMPEG_PATH') or None
+            )
+        return _template_derivatives
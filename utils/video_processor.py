@@ -5,8 +5,28 @@ import replicate
 from io import BytesIO
 from PIL import Image
 import base64
-from gradio_client import Client
-import tempfile
+import mimetypes
+from datetime import datetime
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+from utils.hedged_executor import CancelToken, cancel_scope, current_cancel_token
+from utils.provider_health import get_health_registry, CircuitOpenError
+from utils.template_assets import TemplateAsset, get_template_assets
+from utils.media_ingest import ingest_media, pin_media, copy_to_temp_file
+from utils.scratch import get_scratch_manager, current_scratch, scratch_file
+from utils.vmodel_tasks import get_vmodel_tasks
+from utils.gradio_pool import get_gradio_pool
+from utils.supabase_storage import get_supabase_storage
+
+
+def _parse_costs(value):
+    """Parse "provider=usd,provider=usd" into a dict"""
+    costs = {}
+    for item in value.split(','):
+        if '=' in item:
+            provider, cost = item.split('=', 1)
+            costs[provider.strip()] = float(cost)
+    return costs
 
 class VideoFaceSwapProcessor:
     """
@@ -41,16 +61,26 @@ class VideoFaceSwapProcessor:
             'hf-alsv': 'ALSv/video-face-swap',
             'hf-prithiv': 'prithivMLmods/Video-Face-Swapper',
         }
+        
+        # Auto mode orchestration
+        # - sequential: Replicate → VModel → HF Spaces, one after another
+        # - race: providers in race_providers run at the same time (first success wins),
+        #   limited so the summed cost of running providers stays within race_budget;
+        #   the remaining providers are tried one by one afterwards
+        self.auto_mode = os.getenv('VIDEO_AUTO_MODE', 'sequential').lower()
+        self.race_providers = [
+            name.strip() for name in os.getenv('VIDEO_RACE_PROVIDERS', 'replicate,vmodel').split(',') if name.strip()
+        ]
+        self.race_budget = float(os.getenv('VIDEO_RACE_BUDGET', '0.25'))
+        self.provider_costs = {'replicate': 0.14, 'vmodel': 0.10}
+        self.provider_costs.update(_parse_costs(os.getenv('VIDEO_PROVIDER_COSTS', '')))
+        
+        # Circuit breakers + health scores, keyed "video:<provider>"
+        self.health = get_health_registry()
     
     def _save_temp_file(self, file_data, suffix='.jpg'):
-        """Save uploaded file to temp location"""
-        temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        if hasattr(file_data, 'read'):
-            temp.write(file_data.read())
-        else:
-            temp.write(file_data)
-        temp.close()
-        return temp.name
+        """Save uploaded file to temp location (chunked copy, never the whole file in memory)"""
+        return copy_to_temp_file(file_data, suffix)
     
     def _try_hf_model(self, model_config, face_image_path, video_path, gender="all"):
         """Try single HF model with timeout"""
@@ -63,17 +93,13 @@ class VideoFaceSwapProcessor:
             start_time = time.time()
             
             from gradio_client import handle_file
-            client = Client(
-                model_name,
-                hf_token=self.hf_pro_token if self.hf_pro_token else None
-            )
-            
-            # Prepare arguments based on model config - simple predict only
-            result = client.predict(
-                handle_file(face_image_path),
-                handle_file(video_path),
-                api_name="/predict"
-            )
+            with get_gradio_pool().lease(model_name) as client:
+                # Prepare arguments based on model config - simple predict only
+                result = client.predict(
+                    handle_file(face_image_path),
+                    handle_file(video_path),
+                    api_name="/predict"
+                )
             
             elapsed = time.time() - start_time
             print(f"[HF] {model_name} completed in {elapsed:.2f}s")
@@ -172,19 +198,22 @@ class VideoFaceSwapProcessor:
             if img.mode != 'RGB':
                 img = img.convert('RGB')
             
-            # Save as JPEG to temp file
-            face_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            img.save(face_temp.name, 'JPEG', quality=95)
-            face_path = face_temp.name
-            face_temp.close()
+            # Save as JPEG in the request's scratch directory
+            face_path = scratch_file('.jpg')
+            img.save(face_path, 'JPEG', quality=95)
             print(f"[Replicate] Image converted to JPEG: {face_path}")
         except Exception as e:
             print(f"[Replicate] Image conversion failed: {e}, using raw data")
             # Fallback: save raw data
             face_path = self._save_temp_file(face_data, '.jpg')
         
-        # Save video
-        video_path = self._save_temp_file(video_file.stream if hasattr(video_file, 'stream') else video_file, '.mp4')
+        # Video is streamed from disk by the SDK (templates reuse their uploaded Replicate file instead)
+        video = ingest_media(video_file, '.mp4')
+        if isinstance(video, TemplateAsset):
+            video_path = None
+            video_input = self._replicate_template_url(video)
+        else:
+            video_path = video.path
         
         # Try models in order
         for model_name in self.replicate_models:
@@ -193,15 +222,24 @@ class VideoFaceSwapProcessor:
                 
                 # Open files for Replicate
                 # Note: arabyai-replicate/roop_face_swap params are swap_image + target_video
-                with open(face_path, 'rb') as f1, open(video_path, 'rb') as f2:
-                    output = replicate.run(
-                        model_name,
+                with open(face_path, 'rb') as f1, (open(video_path, 'rb') if video_path else nullcontext(video_input)) as f2:
+                    prediction = replicate.predictions.create(
+                        version=model_name.split(':', 1)[1],
                         input={
                             "swap_image": f1,      # Face to swap (source face)
                             "target_video": f2     # Video to swap into (target video)
                         }
                     )
                 
+                # When raced against other providers, cancel the prediction if another one wins
+                cancel_token = current_cancel_token()
+                if cancel_token:
+                    cancel_token.add_callback(prediction.cancel)
+                prediction.wait()
+                if prediction.status != 'succeeded':
+                    raise Exception(f"Prediction {prediction.id} {prediction.status}: {prediction.error}")
+                output = prediction.output
+                
                 # Handle different output formats
                 if isinstance(output, str):
                     video_url = output
@@ -233,32 +271,42 @@ class VideoFaceSwapProcessor:
                 except:
                     pass
                 print(f"[Replicate] ❌ {model_name} failed: {error_msg}")
+                if isinstance(video, TemplateAsset):
+                    # The uploaded copy may have expired early; upload again next time
+                    get_template_assets().invalidate('replicate', video.path)
                 continue
         
         raise Exception("All Replicate models failed")
     
-    def _upload_to_supabase(self, file_data, filename):
-        """Upload file to Supabase and return public URL"""
-        from supabase import create_client
-        
-        supabase_url = os.getenv('SUPABASE_URL')
-        supabase_key = os.getenv('SUPABASE_KEY')
-        
-        if not supabase_url or not supabase_key:
+    def _replicate_template_url(self, template):
+        """Replicate Files API URL for a template, uploaded once per content hash"""
+        def upload(path, sha256):
+            uploaded = replicate.files.create(path, content_type=mimetypes.guess_type(path)[0] or 'video/mp4')
+            expires_at = None
+            if uploaded.expires_at:
+                expires_at = datetime.fromisoformat(uploaded.expires_at.replace('Z', '+00:00')).timestamp()
+            return {'url': uploaded.urls['get'], 'file_id': uploaded.id, 'expires_at': expires_at}
+        
+        return get_template_assets().remote_url('replicate', template.path, upload)
+    
+    def _supabase_template_url(self, template):
+        """Public Supabase URL for a template (VModel needs URLs), uploaded once per content hash"""
+        def upload(path, sha256):
+            extension = os.path.splitext(path)[1] or '.mp4'
+            url = self._upload_to_supabase(path, f"{sha256[:32]}{extension}", folder='vmodel-templates', upsert=True)
+            return {'url': url}
+        
+        return get_template_assets().remote_url('supabase', template.path, upload)
+    
+    def _upload_to_supabase(self, file_data, filename, folder='vmodel-temp', upsert=False):
+        """Upload bytes or a local file path (streamed from disk) to Supabase and return public URL"""
+        storage = get_supabase_storage()
+        if not storage.client:
             raise Exception("SUPABASE_URL and SUPABASE_KEY required for VModel (needs public URLs)")
         
-        supabase = create_client(supabase_url, supabase_key)
-        
         # Upload to ai-photos bucket
-        file_path = f"vmodel-temp/{filename}"
-        supabase.storage.from_('ai-photos').upload(
-            file_path,
-            file_data,
-            {"content-type": "video/mp4" if filename.endswith('.mp4') else "image/jpeg"}
-        )
-        
-        # Get public URL
-        public_url = supabase.storage.from_('ai-photos').get_public_url(file_path)
+        content_type = "video/mp4" if filename.endswith('.mp4') else "image/jpeg"
+        public_url = storage.upload_file(file_data, f"{folder}/{filename}", content_type, upsert=upsert)
         print(f"[VModel] Uploaded to Supabase: {public_url}")
         return public_url
     
@@ -274,7 +322,6 @@ class VideoFaceSwapProcessor:
         
         print("[VModel] Starting video face swap...")
         
-        import requests
         import uuid
         
         # Read face image
@@ -286,107 +333,43 @@ class VideoFaceSwapProcessor:
         else:
             face_data = face_image
         
-        # Read video
-        if hasattr(video_file, 'stream'):
-            video_file.stream.seek(0)
-            video_data = video_file.stream.read()
-        elif hasattr(video_file, 'read'):
-            video_data = video_file.read()
-        else:
-            video_data = video_file
+        # Video stays on disk; Supabase streams it from the file (templates are uploaded once and reused)
+        video = ingest_media(video_file, '.mp4')
         
         # Upload files to Supabase to get public URLs
         unique_id = str(uuid.uuid4())[:8]
         try:
             face_url = self._upload_to_supabase(face_data, f"face_{unique_id}.jpg")
-            video_url = self._upload_to_supabase(video_data, f"video_{unique_id}.mp4")
-            
-            # VModel API call with URLs (JSON format)
-            response = requests.post(
-                "https://api.vmodel.ai/api/tasks/v1/create",
-                headers={
-                    "Authorization": f"Bearer {self.vmodel_token}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "version": "537e83f7ed84751dc56aa80fb2391b07696c85a49967c72c64f002a0ca2bb224",
-                    "input": {
-                        "target": face_url,  # URL to face image
-                        "source": video_url,  # URL to video
-                        "disable_safety_checker": True
-                    }
-                },
-                timeout=180
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            # Parse VModel response format: {'code': 200, 'result': {'task_id': '...', 'task_cost': ...}}
-            if result.get('code') == 200 and 'result' in result:
-                task_data = result['result']
-                task_id = task_data.get('task_id')
+            if isinstance(video, TemplateAsset):
+                video_url = self._supabase_template_url(video)
             else:
-                # Fallback to old format
-                task_id = result.get('task_id')
-            
-            if not task_id:
-                raise Exception(f"VModel API error: {result}")
-            
-            print(f"[VModel] Task created: {task_id}, polling for result...")
-            
-            # Poll for completion
-            import time
+                video_url = self._upload_to_supabase(video.path, f"video_{unique_id}.mp4")
             
-            # Small delay before first check (let API index the task)
-            time.sleep(2)
+            # Submit to the shared VModel poller; this thread just waits on the future
+            tasks = get_vmodel_tasks()
+            future = tasks.submit(
+                "537e83f7ed84751dc56aa80fb2391b07696c85a49967c72c64f002a0ca2bb224",
+                {
+                    "target": face_url,  # URL to face image
+                    "source": video_url,  # URL to video
+                    "disable_safety_checker": True
+                }
+            )
+            cancel_token = current_cancel_token()
+            if cancel_token:
+                # Losing a race cancels the task on VModel
+                cancel_token.add_callback(future.cancel)
             
-            max_retries = 60  # 60 * 3s = 3 minutes max
-            for i in range(max_retries):
-                try:
-                    status_response = requests.get(
-                        f"https://api.vmodel.ai/api/tasks/v1/get/{task_id}",
-                        headers={"Authorization": f"Bearer {self.vmodel_token}"}
-                    )
-                    
-                    # Log response for debugging
-                    print(f"[VModel] Status check #{i+1}: HTTP {status_response.status_code}")
-                    
-                    status_response.raise_for_status()
-                    status_data = status_response.json()
-                    
-                    # VModel may return nested response like create endpoint
-                    if 'result' in status_data and isinstance(status_data['result'], dict):
-                        # Nested format: {'code': 200, 'result': {...}}
-                        task_status = status_data['result']
-                    else:
-                        # Direct format
-                        task_status = status_data
-                    
-                    print(f"[VModel] Status: {task_status.get('status', 'unknown')}")
-                    
-                    if task_status.get('status') == 'succeeded':
-                        output_url = task_status.get('output', [None])[0]
-                        if output_url:
-                            print(f"[VModel] ✅ Success! Output: {output_url}")
-                            return output_url, "vmodel/video-face-swap-pro"
-                        else:
-                            raise Exception("VModel returned no output URL")
-                    
-                    elif task_status.get('status') in ['failed', 'canceled']:
-                        raise Exception(f"VModel task failed: {task_status.get('error', 'Unknown error')}")
-                    
-                    # Still processing
-                    time.sleep(3)
-                    
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code == 404:
-                        print(f"[VModel] Task not found yet (404), retrying... ({i+1}/{max_retries})")
-                        time.sleep(5)  # Longer delay on 404
-                        continue
-                    raise
+            try:
+                output = future.result(timeout=tasks.timeout + 30)
+            except CancelledError:
+                raise Exception(f"VModel task {future.task_id} abandoned (another provider won)")
             
-            raise Exception("VModel processing timeout (3 minutes)")
+            output_url = output[0] if output else None
+            if not output_url:
+                raise Exception("VModel returned no output URL")
+            print(f"[VModel] ✅ Success! Output: {output_url}")
+            return output_url, "vmodel/video-face-swap-pro"
             
         except Exception as e:
             print(f"[VModel] Error: {e}")
@@ -409,83 +392,21 @@ class VideoFaceSwapProcessor:
         print(f"[HF Space] Using {space_name}")
         
         try:
-            from gradio_client import Client, handle_file
-            
             # Save files to temp paths
             face_path = self._save_temp_file(face_image, suffix='.jpg')
-            video_path = self._save_temp_file(video_file, suffix='.mp4')
+            video = ingest_media(video_file, '.mp4')
+            video_path = video.path
             
             try:
-                # Create Gradio client
-                client = Client(space_name)
-                print(f"[HF Space] Connected to {space_name}")
-                
-                # Different spaces have different APIs
-                # Try common patterns
-                try:
-                    # Pattern 1: tonyassi/video-face-swap (image, video, gender)
-                    if 'tonyassi' in space_name:
-                        print(f"[HF Space] Calling with gender parameter: {gender}")
-                        result = client.predict(
-                            source_image=handle_file(face_path),
-                            target_video=handle_file(video_path),
-                            gender=gender,
-                            api_name="/predict"
-                        )
-                    else:
-                        # Pattern 2: Most other spaces (image, video only)
-                        print(f"[HF Space] Calling without gender parameter")
-                        result = client.predict(
-                            handle_file(face_path),
-                            handle_file(video_path),
-                            api_name="/predict"
-                        )
-                    
-                    print(f"[HF Space] Result type: {type(result)}")
-                    print(f"[HF Space] Result: {result}")
-                    
-                    # Result can be a string (URL or file path) or tuple
-                    if isinstance(result, tuple):
-                        video_result = result[0]
-                    else:
-                        video_result = result
-                    
-                    # Check if it's a URL or file path
-                    if isinstance(video_result, str):
-                        if video_result.startswith('http'):
-                            # It's a URL
-                            return video_result, space_name
-                        else:
-                            # It's a file path, need to read and potentially upload
-                            # For now, return the path (caller can handle upload)
-                            return video_result, space_name
-                    else:
-                        raise Exception(f"Unexpected result type: {type(video_result)}")
-                
-                except Exception as api_error:
-                    print(f"[HF Space] API error: {api_error}")
-                    # Try without api_name parameter
-                    print(f"[HF Space] Retrying without api_name...")
-                    result = client.predict(
-                        handle_file(face_path),
-                        handle_file(video_path)
-                    )
-                    
-                    if isinstance(result, tuple):
-                        video_result = result[0]
-                    else:
-                        video_result = result
-                    
-                    if isinstance(video_result, str):
-                        return video_result, space_name
-                    else:
-                        raise Exception(f"Unexpected result type: {type(video_result)}")
-            
+                # Shared client from the pool (no per-request config/handshake fetch)
+                with get_gradio_pool().lease(space_name) as client:
+                    return self._predict_space(client, space_name, face_path, video_path, gender)
             finally:
                 # Cleanup temp files
                 try:
                     os.unlink(face_path)
-                    os.unlink(video_path)
+                    if video is not video_file:
+                        video.cleanup()
                 except:
                     pass
         
@@ -493,6 +414,201 @@ class VideoFaceSwapProcessor:
             print(f"[HF Space] Error: {e}")
             raise Exception(f"HuggingFace Space {space_name} failed: {e}")
     
+    @staticmethod
+    def _predict_space(client, space_name, face_path, video_path, gender):
+        """Call a Space's face swap endpoint; returns (video_url_or_path, space_name)"""
+        from gradio_client import handle_file
+        
+        # Different spaces have different APIs
+        # Try common patterns
+        try:
+            # Pattern 1: tonyassi/video-face-swap (image, video, gender)
+            if 'tonyassi' in space_name:
+                print(f"[HF Space] Calling with gender parameter: {gender}")
+                result = client.predict(
+                    source_image=handle_file(face_path),
+                    target_video=handle_file(video_path),
+                    gender=gender,
+                    api_name="/predict"
+                )
+            else:
+                # Pattern 2: Most other spaces (image, video only)
+                print(f"[HF Space] Calling without gender parameter")
+                result = client.predict(
+                    handle_file(face_path),
+                    handle_file(video_path),
+                    api_name="/predict"
+                )
+            
+            print(f"[HF Space] Result type: {type(result)}")
+            print(f"[HF Space] Result: {result}")
+            
+            # Result can be a string (URL or file path) or tuple
+            if isinstance(result, tuple):
+                video_result = result[0]
+            else:
+                video_result = result
+            
+            # Check if it's a URL or file path
+            if isinstance(video_result, str):
+                if video_result.startswith('http'):
+                    # It's a URL
+                    return video_result, space_name
+                else:
+                    # It's a file path, need to read and potentially upload
+                    # For now, return the path (caller can handle upload)
+                    return video_result, space_name
+            else:
+                raise Exception(f"Unexpected result type: {type(video_result)}")
+        
+        except Exception as api_error:
+            print(f"[HF Space] API error: {api_error}")
+            # Try without api_name parameter
+            print(f"[HF Space] Retrying without api_name...")
+            result = client.predict(
+                handle_file(face_path),
+                handle_file(video_path)
+            )
+            
+            if isinstance(result, tuple):
+                video_result = result[0]
+            else:
+                video_result = result
+            
+            if isinstance(video_result, str):
+                return video_result, space_name
+            else:
+                raise Exception(f"Unexpected result type: {type(video_result)}")
+    
+    @staticmethod
+    def _read_upload(file_data):
+        """Read a (small) upload such as the face image into bytes so several providers can share it"""
+        if hasattr(file_data, 'stream'):
+            file_data.stream.seek(0)
+            return file_data.stream.read()
+        if hasattr(file_data, 'read'):
+            return file_data.read()
+        return file_data
+    
+    @staticmethod
+    def _health_key(provider):
+        return f"video:{provider}"
+    
+    def auto_order(self):
+        """Provider names in the order auto mode would try them right now"""
+        names = ['replicate'] + (['vmodel'] if self.vmodel_token else []) + list(self.hf_spaces)
+        return self.health.order(names, key=self._health_key)
+    
+    def _auto_chain(self, face_data, video_data, gender):
+        """
+        Auto mode providers in configured priority order: [(provider, callable -> (result, model))]
+        Each callable goes through the provider's circuit breaker
+        """
+        calls = [('replicate', lambda: self.swap_face_replicate(face_data, video_data))]
+        if self.vmodel_token:
+            calls.append(('vmodel', lambda: self.swap_face_vmodel(face_data, video_data)))
+        for hf_provider, space_name in self.hf_spaces.items():
+            calls.append((hf_provider, lambda space_name=space_name: self.swap_face_huggingface(face_data, video_data, space_name, gender)))
+        return [
+            (provider, lambda provider=provider, func=func: self.health.call(self._health_key(provider), func))
+            for provider, func in calls
+        ]
+    
+    @staticmethod
+    def _run_cancellable(token, scratch, func):
+        if scratch is None:
+            with cancel_scope(token):
+                return func()
+        # Race threads write temp files into the request's scratch session too
+        with cancel_scope(token), scratch.activate():
+            return func()
+    
+    def _race(self, candidates, errors):
+        """
+        Run candidates concurrently within the cost budget and return the first
+        (result, provider, model) to succeed, or None if all fail
+        A candidate is held back until the cost of running candidates leaves room for it;
+        the first one always starts. Losers are cancelled where the provider supports it
+        (Replicate, VModel polling) and abandoned otherwise.
+        """
+        queue = list(candidates)
+        running = {}
+        scratch = current_scratch()
+        pool = ThreadPoolExecutor(max_workers=max(len(queue), 1), thread_name_prefix='video-race')
+        
+        def launch_within_budget():
+            while queue:
+                provider, func = queue[0]
+                cost = self.provider_costs.get(provider, 0.0)
+                running_cost = sum(self.provider_costs.get(name, 0.0) for name, _ in running.values())
+                if running and running_cost + cost > self.race_budget:
+                    return
+                queue.pop(0)
+                token = CancelToken()
+                future = pool.submit(self._run_cancellable, token, scratch, func)
+                if scratch is not None:
+                    # Losers keep running after the winner returns; their input files must outlive the request
+                    scratch.retain()
+                    future.add_done_callback(lambda _: scratch.close())
+                running[future] = (provider, token)
+                print(f"[VideoSwap] Race: started {provider} (${running_cost + cost:.2f} in flight)")
+        
+        try:
+            launch_within_budget()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider, _ = running.pop(future)
+                    try:
+                        result, model = future.result()
+                    except Exception as e:
+                        print(f"[VideoSwap] Race: {provider} failed: {e}")
+                        errors.append(f"{provider}: {e}")
+                        continue
+                    
+                    for loser, token in running.values():
+                        print(f"[VideoSwap] Race: cancelling {loser}")
+                        token.cancel()
+                    print(f"[VideoSwap] Race: {provider} won")
+                    return result, provider, model
+                launch_within_budget()
+            return None
+        finally:
+            pool.shutdown(wait=False)
+    
+    def swap_face_race(self, face_image, video_file, gender="all"):
+        """
+        Auto mode with racing: providers in race_providers run in parallel (within
+        race_budget), the rest of the auto chain is tried sequentially if they all fail
+        
+        Returns:
+            (video_url, provider_used, model_used)
+        """
+        face_data = self._read_upload(face_image)
+        video_data = pin_media(ingest_media(video_file, '.mp4'))
+        
+        chain = self.health.order(self._auto_chain(face_data, video_data, gender), key=lambda item: self._health_key(item[0]))
+        racers = [item for item in chain if item[0] in self.race_providers]
+        held_back = [item for item in chain if item[0] not in self.race_providers]
+        errors = [] if self.vmodel_token else ["VModel: Not configured"]
+        
+        print(f"[VideoSwap] Race mode - racing {[name for name, _ in racers]} (budget ${self.race_budget:.2f})")
+        winner = self._race(racers, errors)
+        if winner:
+            return winner
+        
+        for provider, func in held_back:
+            try:
+                print(f"[VideoSwap] Trying {provider}...")
+                result, model = func()
+                return result, f"{provider} (fallback)", model
+            except Exception as e:
+                print(f"[VideoSwap] {provider} failed: {e}")
+                errors.append(f"{provider}: {e}")
+        
+        error_summary = "\n".join(errors)
+        raise Exception(f"All providers failed:\n{error_summary}")
+    
     def swap_face_video(self, face_image, video_file, provider="auto", gender="all"):
         """
         Main video face swap method with multiple providers
@@ -508,62 +624,65 @@ class VideoFaceSwapProcessor:
         """
         print(f"[VideoSwap] Starting with provider: {provider}")
         
+        # All temp files of this request live in one scratch directory, removed on exit.
+        # The video is spooled to disk once (or the file Werkzeug already spooled is used);
+        # providers stream it from there instead of holding it in memory
+        with get_scratch_manager().session('video-swap'):
+            # Owned copies live in the session directory and go with it (race losers may still read them)
+            video = ingest_media(video_file, '.mp4')
+            return self._swap_face_video(face_image, video, provider, gender)
+    
+    def _swap_face_video(self, face_image, video_file, provider, gender):
+        
         # Check if it's a HuggingFace Space provider
         if provider in self.hf_spaces:
             space_name = self.hf_spaces[provider]
             print(f"[VideoSwap] Using HuggingFace Space: {provider} ({space_name})")
-            result, model = self.swap_face_huggingface(face_image, video_file, space_name, gender)
+            result, model = self.health.call(
+                self._health_key(provider),
+                lambda: self.swap_face_huggingface(face_image, video_file, space_name, gender),
+                enforce=False
+            )
             return result, provider, model
         
         elif provider == "replicate":
             # Replicate only - arabyai-replicate/roop_face_swap with audio
             print("[VideoSwap] Using Replicate (arabyai-replicate/roop_face_swap)")
-            result, model = self.swap_face_replicate(face_image, video_file)
+            result, model = self.health.call(
+                self._health_key('replicate'), lambda: self.swap_face_replicate(face_image, video_file), enforce=False
+            )
             return result, "replicate", model
         
         elif provider == "vmodel":
             # VModel only - premium quality with audio
             print("[VideoSwap] Using VModel.AI")
-            result, model = self.swap_face_vmodel(face_image, video_file)
+            result, model = self.health.call(
+                self._health_key('vmodel'), lambda: self.swap_face_vmodel(face_image, video_file), enforce=False
+            )
             return result, "vmodel", model
         
+        elif self.auto_mode == "race":
+            return self.swap_face_race(face_image, video_file, gender)
+        
         else:  # "auto" or any other value
-            # Auto mode: Replicate primary → VModel fallback → HF fallback
-            print("[VideoSwap] Auto mode - Replicate → VModel → HF fallback chain")
-            
-            errors = []
-            
-            # Try 1: Replicate first (stable, audio preserved, $0.14)
-            try:
-                result, model = self.swap_face_replicate(face_image, video_file)
-                return result, "replicate", model
-            except Exception as replicate_error:
-                print(f"[VideoSwap] Replicate failed: {replicate_error}")
-                errors.append(f"Replicate: {replicate_error}")
-            
-            # Try 2: VModel fallback (premium, faster, $0.10)
-            if self.vmodel_token:
-                try:
-                    print("[VideoSwap] Falling back to VModel...")
-                    result, model = self.swap_face_vmodel(face_image, video_file)
-                    return result, "vmodel (fallback)", model
-                except Exception as vmodel_error:
-                    print(f"[VideoSwap] VModel fallback failed: {vmodel_error}")
-                    errors.append(f"VModel: {vmodel_error}")
-            else:
-                print("[VideoSwap] VModel not configured, skipping")
-                errors.append("VModel: Not configured")
+            # Auto mode: Replicate → VModel → HF Spaces, reordered by recent health
+            # (open circuits are skipped, faster/more reliable providers go first)
+            face_data = self._read_upload(face_image)
+            video_data = ingest_media(video_file, '.mp4')
+            chain = self.health.order(self._auto_chain(face_data, video_data, gender), key=lambda item: self._health_key(item[0]))
+            print(f"[VideoSwap] Auto mode - {' → '.join(name for name, _ in chain)} fallback chain")
             
-            # Try 3: HuggingFace Spaces fallback (FREE, slower)
-            print("[VideoSwap] Trying HuggingFace Spaces as last resort...")
-            for hf_provider, space_name in self.hf_spaces.items():
+            errors = [] if self.vmodel_token else ["VModel: Not configured"]
+            for index, (chain_provider, func) in enumerate(chain):
                 try:
-                    print(f"[VideoSwap] Trying {hf_provider} ({space_name})...")
-                    result, model = self.swap_face_huggingface(face_image, video_file, space_name, gender)
-                    return result, f"{hf_provider} (fallback)", model
-                except Exception as hf_error:
-                    print(f"[VideoSwap] {hf_provider} failed: {hf_error}")
-                    errors.append(f"{hf_provider}: {hf_error}")
+                    result, model = func()
+                    return result, chain_provider if index == 0 else f"{chain_provider} (fallback)", model
+                except CircuitOpenError as circuit_error:
+                    print(f"[VideoSwap] {circuit_error}")
+                    errors.append(f"{chain_provider}: {circuit_error}")
+                except Exception as provider_error:
+                    print(f"[VideoSwap] {chain_provider} failed: {provider_error}")
+                    errors.append(f"{chain_provider}: {provider_error}")
             
             # All providers failed
             error_summary = "\n".join(errors)
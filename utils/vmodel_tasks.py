@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.http_client import get_http_client
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'canceled')
+
+
+class VModelTaskManager:
+    """
+    Tracks every outstanding VModel task from one background poller
+
+    Instead of each request sleeping in its own status loop, submit() creates
+    the task and returns a concurrent.futures.Future resolving to the task
+    output (list of URLs). Once per tick the poller collects all tasks that
+    are due and checks them as one batch (concurrently, over the shared
+    keep-alive pool), so N waiting requests cost one thread, not N.
+
+    Backoff is adaptive per task: the first check comes after first_poll
+    (VModel needs a moment to index new tasks), then the interval grows from
+    poll_initial by 1.5x up to poll_max. A 404 ("not indexed yet") keeps
+    the task at the short interval. Cancelling the Future cancels the task.
+    """
+
+    def __init__(self, api_token, base_url='https://api.vmodel.ai', first_poll=2.0, poll_initial=2.0,
+                 poll_max=10.0, max_concurrent_polls=16, timeout=180, tick=0.25):
+        self.api_token = api_token
+        self.base_url = base_url.rstrip('/')
+        self.first_poll = first_poll
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.timeout = timeout
+        self.tick = tick
+
+        # task id -> {'future', 'created_at', 'next_poll_at', 'polls'}
+        self._inflight = {}
+        self._stats = {'created': 0, 'succeeded': 0, 'failed': 0, 'canceled': 0, 'timeouts': 0,
+                       'polls': 0, 'batches': 0, 'not_found': 0}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent_polls, thread_name_prefix='vmodel-poll')
+        self._thread = threading.Thread(target=self._poll_forever, name='vmodel-poller', daemon=True)
+        self._thread.start()
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_token}"}
+
+    @staticmethod
+    def _unwrap(data):
+        """VModel wraps payloads as {'code': 200, 'result': {...}}; older responses are flat"""
+        if isinstance(data.get('result'), dict):
+            return data['result']
+        return data
+
+    def submit(self, version, input):
+        """
+        Create a task and return a Future resolving to its output list
+        Creation errors are raised here; task failures set the Future's exception
+        """
+        response = get_http_client().post(
+            f"{self.base_url}/api/tasks/v1/create",
+            headers=dict(self._headers(), **{"Content-Type": "application/json"}),
+            json={"version": version, "input": input},
+            timeout=(5, 60)
+        )
+        response.raise_for_status()
+        result = response.json()
+        task_id = self._unwrap(result).get('task_id')
+        if not task_id:
+            raise Exception(f"VModel API error: {result}")
+
+        future = Future()
+        now = time.time()
+        with self._lock:
+            self._inflight[task_id] = {
+                'future': future,
+                'created_at': now,
+                'next_poll_at': now + self.first_poll,
+                'polls': 0,
+            }
+            self._stats['created'] += 1
+            in_flight = len(self._inflight)
+        future.task_id = task_id
+        future.add_done_callback(lambda f: f.cancelled() and self._wakeup.set())
+        print(f"[VModel] Task created: {task_id} ({in_flight} in flight)")
+        return future
+
+    def run(self, version, input, timeout=None):
+        """Blocking convenience wrapper: submit and wait for the output list"""
+        return self.submit(version, input).result(timeout=timeout or self.timeout)
+
+    def _next_delay(self, polls):
+        return min(self.poll_initial * (1.5 ** polls), self.poll_max)
+
+    def _complete(self, task_id, task):
+        status = task.get('status')
+        if status not in TERMINAL_STATUSES:
+            return
+        with self._lock:
+            entry = self._inflight.pop(task_id, None)
+            if not entry or entry['future'].done():
+                return
+            self._stats['succeeded' if status == 'succeeded' else 'failed'] += 1
+
+        elapsed = time.time() - entry['created_at']
+        if status == 'succeeded':
+            output = task.get('output') or []
+            print(f"[VModel] Task {task_id} succeeded in {elapsed:.1f}s after {entry['polls']} checks")
+            entry['future'].set_result(output if isinstance(output, list) else [output])
+        else:
+            print(f"[VModel] Task {task_id} {status}: {task.get('error')}")
+            entry['future'].set_exception(Exception(f"VModel task failed: {task.get('error', 'Unknown error')}"))
+
+    def _poll_one(self, task_id, entry):
+        try:
+            response = get_http_client().get(
+                f"{self.base_url}/api/tasks/v1/get/{task_id}",
+                headers=self._headers(),
+                timeout=(5, 30)
+            )
+            if response.status_code == 404:
+                # Not indexed yet - retry at the short interval
+                with self._lock:
+                    self._stats['not_found'] += 1
+                    entry['next_poll_at'] = time.time() + self.poll_initial
+                return
+            response.raise_for_status()
+            task = self._unwrap(response.json())
+        except Exception as e:
+            print(f"[VModel] Status check {task_id} failed: {e}")
+            with self._lock:
+                entry['next_poll_at'] = time.time() + self._next_delay(entry['polls'])
+            return
+
+        with self._lock:
+            self._stats['polls'] += 1
+            entry['polls'] += 1
+            entry['next_poll_at'] = time.time() + self._next_delay(entry['polls'])
+        self._complete(task_id, task)
+
+    def _cancel(self, task_id):
+        try:
+            get_http_client().post(
+                f"{self.base_url}/api/tasks/v1/cancel/{task_id}", headers=self._headers(), timeout=(5, 15)
+            )
+        except Exception as e:
+            print(f"[VModel] Cancel {task_id} failed: {e}")
+
+    def _poll_forever(self):
+        while True:
+            now = time.time()
+            due, cancelled = [], []
+            with self._lock:
+                for task_id, entry in list(self._inflight.items()):
+                    if entry['future'].cancelled():
+                        # Caller gave up (e.g. another provider won the race)
+                        del self._inflight[task_id]
+                        self._stats['canceled'] += 1
+                        cancelled.append(task_id)
+                    elif now - entry['created_at'] > self.timeout:
+                        del self._inflight[task_id]
+                        self._stats['timeouts'] += 1
+                        entry['future'].set_exception(
+                            TimeoutError(f"VModel task {task_id} timed out after {self.timeout}s")
+                        )
+                        cancelled.append(task_id)
+                    elif entry['next_poll_at'] <= now:
+                        # Push next_poll_at forward so a slow GET isn't issued twice
+                        entry['next_poll_at'] = now + self.poll_max
+                        due.append((task_id, entry))
+                if due:
+                    self._stats['batches'] += 1
+
+            for task_id in cancelled:
+                print(f"[VModel] Canceling task {task_id}")
+                self._pool.submit(self._cancel, task_id)
+            if due:
+                for future in [self._pool.submit(self._poll_one, task_id, entry) for task_id, entry in due]:
+                    future.result()
+
+            self._wakeup.wait(self.tick)
+            self._wakeup.clear()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            tasks = [
+                {'task_id': task_id, 'age_seconds': round(now - entry['created_at'], 1), 'polls': entry['polls']}
+                for task_id, entry in self._inflight.items()
+            ]
+            return dict(self._stats, in_flight=len(tasks), tasks=tasks,
+                        poll_initial=self.poll_initial, poll_max=self.poll_max)
+
+
+_task_manager = None
+_task_manager_lock = threading.Lock()
+
+
+def get_vmodel_tasks():
+    """Process-wide VModelTaskManager, or None without VMODEL_API_TOKEN"""
+    global _task_manager
+    api_token = os.getenv('VMODEL_API_TOKEN', '')
+    if not api_token:
+        return None
+
+    with _task_manager_lock:
+        if _task_manager is None:
+            _task_manager = VModelTaskManager(
+                api_token=api_token,
+                base_url=os.getenv('VMODEL_API_BASE_URL', 'https://api.vmodel.ai'),
+                first_poll=float(os.getenv('VMODEL_FIRST_POLL_SECONDS', '2')),
+                poll_initial=float(os.getenv('VMODEL_POLL_INITIAL', '2')),
+                poll_max=float(os.getenv('VMODEL_POLL_MAX', '10')),
+                timeout=int(os.getenv('VMODEL_TASK_TIMEOUT', '180'))
+            )
+        return _task_manager